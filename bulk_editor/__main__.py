@@ -1,20 +1,24 @@
 import argparse
-from dataclasses import asdict
 import json
+import logging
+import os
+import sys
+import time
 
-from .data_models import PatchList
 from .loggers import init_logging
-from . import mappings, actions
-
-init_logging(log_file="bulk_editor.log")
+from . import mappings, actions, batch, impact, jobs
+from .data_models import BulkEditorError, get_global_defaults_from_file
+from .defaults_store import DefaultsStore
+from .history import History
 
 BACKUP_FILE = "test_1.bel"
 OUTPUT_FILE = "test_output.bel"
+# global defaults written by earlier versions, imported into the defaults store.
 DEFAULTS_FILE = "global_defaults.json"
 
 parser = argparse.ArgumentParser()
 
-parser.add_argument("action", type=str, choices=actions.VALID_ACTIONS.keys())
+parser.add_argument("action", type=str, nargs="?", choices=actions.VALID_ACTIONS.keys())
 
 parser.add_argument(
     "-a",
@@ -34,27 +38,188 @@ parser.add_argument(
 parser.add_argument("-p", "--params", type=str, default="noop")
 parser.add_argument("-c", "--coords", type=str)
 parser.add_argument("-f", "--force", action="store_true", default=False)
+parser.add_argument(
+    "-l",
+    "--loops",
+    type=int,
+    nargs=2,
+    choices=range(1, 10),
+    metavar=("LOOP", "OTHER"),
+    help="loops to swap with swap_loops, or the loop to move and the loop to move it "
+    "after with reorder_chain (9 is the volume loop)",
+)
+parser.add_argument(
+    "--wipe",
+    action="store_true",
+    default=False,
+    help="with swap_loops, move LOOP to OTHER and wipe what was in OTHER",
+)
+parser.add_argument(
+    "--base",
+    type=str,
+    help="with merge_template, the old version of the template at --coords: a backup "
+    "file or a JSON patch file",
+)
+parser.add_argument(
+    "--strategy",
+    type=str,
+    choices=["ours", "theirs"],
+    default="ours",
+    help="with merge_template, keep (ours) or overwrite (theirs) customized cells "
+    "that the template changed",
+)
+parser.add_argument(
+    "--threshold",
+    type=float,
+    help="with merge_template, share of the template cells a patch must hold to be "
+    "derived from it (default 0.8, 0 merges into every patch)",
+)
+parser.add_argument(
+    "--before",
+    action="store_true",
+    default=False,
+    help="with reorder_chain, move LOOP before OTHER instead of after it",
+)
+parser.add_argument(
+    "-b",
+    "--backend",
+    type=str,
+    choices=["patch", "matrix", "lazy", "stream"],
+    default="patch",
+)
+
+parser.add_argument(
+    "-j",
+    "--job",
+    type=str,
+    help="JSON or TOML file listing several actions to run in a single pass",
+)
 
-args = parser.parse_args()
+parser.add_argument(
+    "--batch",
+    type=str,
+    nargs="+",
+    metavar="PATH",
+    help="directories or globs of backup files to edit, instead of the default backup",
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    type=int,
+    help="number of processes to use with --batch (default: one per core)",
+)
+parser.add_argument(
+    "-o",
+    "--output_dir",
+    type=str,
+    help="directory to write edited backups to with --batch "
+    "(default: next to each backup)",
+)
+parser.add_argument(
+    "-n",
+    "--dry-run",
+    action="store_true",
+    default=False,
+    help="report what the actions would change, without writing anything",
+)
+parser.add_argument(
+    "--report",
+    type=str,
+    default="impact_report.json",
+    help="file to write the JSON impact report of --dry-run to",
+)
 
-if args.params != "noop":
-    with open(args.params, "r") as paramfile:
-        args.params = json.load(paramfile)
-else:
-    args.params = {}
 
-with open(BACKUP_FILE, "r") as infile:
-    backup_file = json.load(infile)
+def main():
+    init_logging(log_file="bulk_editor.log")
+    args = parser.parse_args()
 
-patch_list = PatchList(patches=backup_file["patch"])
+    if args.job is not None:
+        steps = jobs.load_job(args.job)
+    elif args.action is None:
+        parser.error("either an action or --job is required")
 
-updated_patches, new_global_defaults = actions.VALID_ACTIONS[args.action](
-    patch_list, args
-)
+    if args.params != "noop":
+        with open(args.params, "r") as paramfile:
+            args.params = json.load(paramfile)
+    else:
+        args.params = {}
+
+    if args.job is None:
+        steps = [args]
+
+    # every backup is rebased from the same global default, in this process and in
+    # the --batch workers.
+    store = DefaultsStore()
+    if store.version == 0 and os.path.isfile(DEFAULTS_FILE):
+        default = get_global_defaults_from_file(DEFAULTS_FILE)
+        # a dry run writes nothing, so the legacy file is only read.
+        if not args.dry_run:
+            store.commit(default, f"import {DEFAULTS_FILE}")
+    else:
+        default = store.current()
+
+    if args.batch:
+        if args.dry_run:
+            parser.error("--dry-run does not support --batch")
+        paths = batch.expand_paths(args.batch)
+        if not paths:
+            parser.error(f"no backup files match {' '.join(args.batch)}")
+        try:
+            batch.output_paths(paths, args.output_dir)
+        except BulkEditorError as e:
+            parser.error(str(e))
+        start = time.perf_counter()
+        failed = 0
+        for result in batch.run_batch(
+            paths,
+            steps,
+            output_dir=args.output_dir,
+            workers=args.workers,
+            backend=args.backend,
+            default=default,
+        ):
+            if result.ok:
+                changed = (
+                    "" if result.changed is None else f", {result.changed} changed"
+                )
+                logging.info(
+                    f"OK     {result.path} -> {result.output} "
+                    f"({result.seconds:.2f}s{changed})"
+                )
+            else:
+                failed += 1
+                logging.error(f"FAILED {result.path} ({result.error})")
+        logging.info(
+            f"Edited {len(paths) - failed}/{len(paths)} backups "
+            f"in {time.perf_counter() - start:.2f}s."
+        )
+        sys.exit(1 if failed else 0)
+
+    if args.dry_run:
+        report = impact.dry_run(
+            BACKUP_FILE, steps, backend=args.backend, default=default
+        )
+        with open(args.report, "w") as reportfile:
+            json.dump(report.to_dict(), reportfile)
+        impact.print_report(report)
+        logging.info(f"Wrote the impact report to {args.report}.")
+        return
+
+    action = "job " + args.job if args.job is not None else args.action
+    history = History()
+    history.commit(BACKUP_FILE, f"before {action}")
+
+    _, new_global_defaults = batch.edit_file(
+        BACKUP_FILE, OUTPUT_FILE, steps, backend=args.backend, default=default
+    )
+
+    version = history.commit(OUTPUT_FILE, action)
+    logging.info(f"Recorded {OUTPUT_FILE} as version {version} of the history.")
+    version = store.commit(new_global_defaults, action)
+    logging.info(f"Global defaults are at version {version}.")
 
-backup_file["patch"] = [asdict(patch) for patch in updated_patches]
 
-with open(OUTPUT_FILE, "w") as outfile, open(DEFAULTS_FILE, "w") as defaultsfile:
-    json.dump(backup_file, outfile)
-    # TODO - probably want to save the new defaults file as a new file rather than overwriting.
-    json.dump(asdict(new_global_defaults), defaultsfile)
+# NOTE - the guard stops --batch worker processes from running main again.
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,99 @@
+import json
+import logging
+
+from . import data_models as dm
+from . import mappings
+
 VALID_ACTIONS = {
-    "set_assign": lambda patch_list, args: set_assign(patch_list, args),
-    "set_default_patch": lambda patch_list, args: set_default_patch(patch_list, args),
+    "set_assign": lambda patch_list, args, **kwargs: set_assign(
+        patch_list, args, **kwargs
+    ),
+    "set_default_patch": lambda patch_list, args, **kwargs: set_default_patch(
+        patch_list, args, **kwargs
+    ),
+    "swap_loops": lambda patch_list, args, **kwargs: swap_loops(
+        patch_list, args, **kwargs
+    ),
+    "reorder_chain": lambda patch_list, args, **kwargs: reorder_chain(
+        patch_list, args, **kwargs
+    ),
+    "merge_template": lambda patch_list, args, **kwargs: merge_template(
+        patch_list, args, **kwargs
+    ),
 }
 
 
-def set_assign(patch_list, args):
+def set_assign(patch_list, args, apply: bool = True):
     required_args = ["assign_number", "source", "mode", "target", "params"]
     payload = {k: getattr(args, k) for k in required_args}
-    return patch_list.update_assign(**payload)
+    return patch_list.update_assign(**payload, apply=apply)
 
 
-def set_default_patch(patch_list, args):
-    bank, patch = [int(i) for i in getattr("coords", args).split(":")]
+def set_default_patch(patch_list, args, apply: bool = True):
+    bank, patch = [int(i) for i in getattr(args, "coords").split(":")]
     patch_list.set_as_default(bank, patch)
-    return patch_list.apply_default()
+    if apply:
+        patch_list.apply_default()
+    return patch_list.patches, patch_list.latest_default_state
+
+
+def swap_loops(patch_list, args, apply: bool = True):
+    # NOTE - a swap is always applied straight away, see PatchList.swap_loops.
+    loop, other = getattr(args, "loops")
+    return patch_list.swap_loops(loop, other, wipe=getattr(args, "wipe"))
+
+
+def reorder_chain(patch_list, args, apply: bool = True):
+    # NOTE - a reorder is always applied straight away, see PatchList.reorder_chain.
+    loop, anchor = getattr(args, "loops")
+    rejected = patch_list.reorder_chain(loop, anchor, after=not getattr(args, "before"))
+    if rejected:
+        coords = ", ".join(
+            f"{bank}:{patch}" for bank, patch in map(mappings.index_to_patch, rejected)
+        )
+        logging.warning(
+            f"Left {len(rejected)} patches with an invalid chain untouched: {coords}"
+        )
+    return patch_list.patches, patch_list.latest_default_state
+
+
+def load_template(path: str, bank: int, patch: int) -> dm.Patch:
+    """Read a template patch from a backup (at bank:patch) or from a JSON patch
+    file, such as a global defaults file."""
+    if path.endswith(".bel"):
+        from .bel import read_patch_at
+
+        return read_patch_at(path, bank, patch)
+    with open(path, "r") as infile:
+        return dm.Patch.from_dict(json.load(infile))
+
+
+def merge_template(patch_list, args, apply: bool = True):
+    # NOTE - a merge is always applied straight away, see PatchList.merge_template.
+    bank, patch = [int(i) for i in getattr(args, "coords").split(":")]
+    base = load_template(getattr(args, "base"), bank, patch)
+    result = patch_list.merge_template(
+        base,
+        patch_list.get_patch(bank, patch),
+        strategy=getattr(args, "strategy"),
+        threshold=getattr(args, "threshold"),
+    )
+    logging.info(
+        f"Merged template {bank}:{patch} into {len(result.patches)} derived patches, "
+        f"{len(result.updated)} updated."
+    )
+    if result.conflicts:
+        logging.warning(
+            f"{len(result.conflicts)} customized cells conflict with the template "
+            f"change, resolved as {result.strategy}:"
+        )
+        for conflict in result.conflicts:
+            bank, patch = mappings.index_to_patch(conflict.slot)
+            cell = conflict.field + (
+                "" if conflict.index is None else f"[{conflict.index}]"
+            )
+            logging.warning(
+                f"  {bank}:{patch} {cell}: template {conflict.base} -> "
+                f"{conflict.theirs}, patch {conflict.ours}"
+            )
+    return patch_list.patches, patch_list.latest_default_state
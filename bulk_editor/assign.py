@@ -1,6 +1,5 @@
-from dataclasses import asdict
-
 from . import data_models, defaults, errors, mappings
+from .mask import Mask
 
 
 def set_global_assign_default(
@@ -43,40 +42,38 @@ def set_global_assign_default(
     masks = [mask_base.mask(patch) for patch in current_state]
     # Apply the newly updated global default mask to the default patch in order to fill in any Nones
     # with the factory default values.
-    new_base_patch = data_models.DEFAULT_PATCH.update(asdict(updated_defaults))
+    new_base_patch = data_models.DEFAULT_PATCH.update(updated_defaults.to_dict())
     # Apply patch data back on top of thew new udpdated_defaults for each patch, return updated_defaults
     return [new_base_patch.update(mask) for mask in masks], updated_defaults
 
 
-def create_input_array(index, value, value_type, array_type):
-    input_array = defaults.default_values(None, mappings.array_lengths_map[array_type])
+def input_value(value, value_type):
     if value_type == "integer":
-        input_array[index] = value
-    else:
-        input_array[index] = mappings.value_type_map[value_type].index(value)
+        return value
+    return mappings.value_type_map[value_type].index(value)
+
+
+def create_input_array(index, value, value_type, array_type):
+    input_array = defaults.values(None, mappings.array_lengths_map[array_type])
+    input_array[index] = input_value(value, value_type)
     return input_array
 
 
-def build_assign_mask(assign_number, source, mode, target, params):
+def build_assign_mask(assign_number, source, mode, target, params) -> Mask:
     index = assign_number - 1
-    non_assign_params = {}
+    mask = Mask(
+        {
+            ("ID_PATCH_ASSIGN_SOURCE", index): input_value(source, "source"),
+            ("ID_PATCH_ASSIGN_TARGET", index): input_value(target, "target"),
+            ("ID_PATCH_ASSIGN_MODE", index): input_value(mode, "mode"),
+            ("ID_PATCH_ASSIGN_SW", index): 1,  # turn on patch assign
+            # NOTE: This assumes that _all_ params entries will _always_ be integers!
+            **{(k, index): v for (k, v) in params.items()},
+        }
+    )
     if source in mappings.ES8_FOOTSWITCHES:
         # if the assign is a footswitch of the ES-8, then disable the normal
         # functionality of the footswitch globally.
-        non_assign_params["ID_PATCH_CTL_FUNC"] = create_input_array(
-            mappings.ES8_FOOTSWITCHES.index(source), "OFF", "ctl_func", "ctl_func"
-        )
-    return dict(
-        ID_PATCH_ASSIGN_SOURCE=create_input_array(index, source, "source", "assign"),
-        ID_PATCH_ASSIGN_TARGET=create_input_array(index, target, "target", "assign"),
-        ID_PATCH_ASSIGN_MODE=create_input_array(index, mode, "mode", "assign"),
-        ID_PATCH_ASSIGN_SW=create_input_array(
-            index, 1, "integer", "assign"
-        ),  # turn on patch assign
-        # NOTE: This assumes that _all_ params entries will _always_ be integers only!
-        **{
-            k: create_input_array(index, v, "integer", "assign")
-            for (k, v) in params.items()
-        },
-        **non_assign_params,
-    )
+        ctl_index = mappings.ES8_FOOTSWITCHES.index(source)
+        mask[("ID_PATCH_CTL_FUNC", ctl_index)] = input_value("OFF", "ctl_func")
+    return mask
@@ -0,0 +1,180 @@
+"""Apply the same actions to many backup files at once.
+
+`edit_file` runs a list of actions (see `jobs`) against a single backup and writes
+the result. `run_batch` fans `edit_file` out over a process pool, one backup per
+task, so that editing a directory of backups scales with the number of cores and
+only pays for interpreter startup and imports once per worker.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+import glob
+import os
+import time
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from . import jobs
+from .bel import BelReader, changed_patches, splice_write, write_bel
+from .data_models import DEFAULT_PATCH, BulkEditorError, Patch, PatchList
+
+OUTPUT_SUFFIX = "_edited"
+
+
+@dataclass
+class BatchResult:
+    path: str
+    output: str
+    ok: bool
+    seconds: float
+    # number of patches that changed (None with the stream backend, which does not
+    # compare patches)
+    changed: Optional[int] = None
+    error: Optional[str] = None
+
+
+def edit_file(
+    path: str,
+    output: str,
+    steps: list,
+    backend: str = "patch",
+    default: Optional[Patch] = None,
+) -> Tuple[Optional[int], Patch]:
+    """Run the actions in `steps` against the backup at `path`, writing the result to
+    `output`. Return the number of patches that changed and the new global default.
+
+    `default` is the global default the patches are based on (by default, the
+    factory default patch).
+
+    With the stream backend, patches are read, updated and written one at a time.
+    Otherwise only the patches that changed are re-encoded, and everything else is
+    copied verbatim from the backup.
+    """
+    with BelReader(path) as reader:
+        if backend == "stream":
+            original_patches = (patch for *_, patch in reader.iter_raw())
+        else:
+            raw_patches = list(reader.iter_raw())
+            original_patches = [patch for *_, patch in raw_patches]
+        patch_list = PatchList(
+            patches=original_patches,
+            backend=backend,
+            states=[DEFAULT_PATCH if default is None else default],
+        )
+        _, new_global_defaults = jobs.run_job(patch_list, steps)
+
+        if backend == "stream":
+            with open(output, "w") as outfile:
+                write_bel(outfile, reader.header, patch_list.iter_dicts())
+            return None, new_global_defaults
+
+    changed = changed_patches(original_patches, patch_list.iter_dicts())
+    splice_write(
+        path,
+        output,
+        changed,
+        spans=[(start, end) for _, start, end, _ in raw_patches],
+    )
+    return len(changed), new_global_defaults
+
+
+def expand_paths(patterns: Iterable[str], suffix: str = OUTPUT_SUFFIX) -> List[str]:
+    """Return the backup files matched by `patterns`, each of which is either a
+    directory (meaning every `.bel` file in it, except the edited copies written by
+    an earlier run, which end with `suffix`) or a glob."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(pattern, "*.bel"))
+            if suffix:
+                matches = [
+                    path
+                    for path in matches
+                    if not os.path.splitext(path)[0].endswith(suffix)
+                ]
+        else:
+            matches = glob.glob(pattern)
+        paths.extend(sorted(matches))
+    # drop duplicates, keeping the order in which they were matched
+    return list(dict.fromkeys(paths))
+
+
+def output_path(
+    path: str, output_dir: Optional[str] = None, suffix: str = OUTPUT_SUFFIX
+) -> str:
+    """Return where the edited copy of the backup at `path` should be written."""
+    stem, ext = os.path.splitext(os.path.basename(path))
+    output = os.path.join(output_dir or os.path.dirname(path), f"{stem}{suffix}{ext}")
+    if os.path.abspath(output) == os.path.abspath(path):
+        raise BulkEditorError(f"Refusing to overwrite {path}.")
+    return output
+
+
+def output_paths(
+    paths: List[str], output_dir: Optional[str] = None, suffix: str = OUTPUT_SUFFIX
+) -> List[str]:
+    """Return `output_path` for each backup in `paths`, checking that no two backups
+    are written to the same file, and that no backup is written over another one."""
+    outputs = [output_path(path, output_dir, suffix) for path in paths]
+    inputs = {os.path.abspath(path): path for path in paths}
+    seen = {}
+    for path, output in zip(paths, outputs):
+        key = os.path.abspath(output)
+        if key in inputs:
+            raise BulkEditorError(
+                f"The edited copy of {path} would overwrite {inputs[key]}."
+            )
+        if key in seen:
+            raise BulkEditorError(
+                f"{seen[key]} and {path} would both be written to {output}."
+            )
+        seen[key] = path
+    return outputs
+
+
+def _edit(
+    path: str, output: str, steps: list, backend: str, default: Optional[Patch]
+) -> BatchResult:
+    """Worker for run_batch: edit a single backup, capturing any error."""
+    start = time.perf_counter()
+    try:
+        changed, _ = edit_file(path, output, steps, backend, default)
+    except Exception as e:
+        return BatchResult(
+            path,
+            output,
+            ok=False,
+            seconds=time.perf_counter() - start,
+            error=f"{type(e).__name__}: {e}",
+        )
+    return BatchResult(
+        path, output, ok=True, seconds=time.perf_counter() - start, changed=changed
+    )
+
+
+def run_batch(
+    paths: List[str],
+    steps: list,
+    output_dir: Optional[str] = None,
+    suffix: str = OUTPUT_SUFFIX,
+    workers: Optional[int] = None,
+    backend: str = "patch",
+    default: Optional[Patch] = None,
+) -> Iterator[BatchResult]:
+    """Run the actions in `steps` against every backup in `paths`, using a pool of
+    `workers` processes (by default, one per core). Every backup is based on the
+    global default `default`, as with `edit_file`.
+
+    Yield a BatchResult for each backup as it completes. A backup that fails does
+    not stop the others from being edited. Raise BulkEditorError before editing
+    anything if two backups would be written to the same file (see `output_paths`).
+    """
+    outputs = output_paths(paths, output_dir, suffix)
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_edit, path, output, steps, backend, default)
+            for path, output in zip(paths, outputs)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
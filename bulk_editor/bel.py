@@ -0,0 +1,384 @@
+"""Reading and writing `.bel` patch backup files.
+
+A backup file is a single JSON object with a small header (`target`, `format` and
+`system`) followed by a `patch` array holding the 800 patches. The reader in this
+module parses the header up front and then decodes the patch array one patch at a
+time, so that a backup can be processed in constant memory.
+
+For random access, `load_index` records the byte span of every patch object in the
+file (cached next to the backup, keyed by its size and mtime), and `BelIndex` uses
+it to decode single patches out of a memory map of the file. The same spans let
+`splice_write` copy unchanged patches from the source file verbatim and only
+re-encode the patches that actually changed.
+
+`write_bel` goes the other way and writes a backup from any iterable of patches,
+one patch at a time, so that a generator of patches can be read, updated and
+written without ever holding the whole patch list in memory.
+"""
+
+from collections.abc import Sequence
+from contextlib import contextmanager
+import json
+import logging
+import mmap
+import os
+from typing import Dict, Iterable, Iterator, List, Mapping, Tuple
+
+from . import data_models as dm
+from . import mappings
+
+CHUNK_SIZE = 64 * 1024
+PATCH_KEY = "patch"
+INDEX_SUFFIX = ".idx"
+
+
+class BelFormatError(dm.BulkEditorError):
+    pass
+
+
+class BelReader:
+    """Incremental reader for `.bel` files.
+
+    The header is parsed when the file is opened and is available as `self.header`.
+    Iterating over the reader then yields `(PatchCoords, Patch)` tuples, one patch at
+    a time. Any top-level keys that come after the patch array are added to
+    `self.header` once the patches have been consumed.
+
+    Usage:
+
+        with BelReader("backup.bel") as reader:
+            print(reader.header["target"])
+            for coords, patch in reader:
+                ...
+
+    NOTE - The file is decoded as latin-1, so that character offsets into the buffer
+           are also byte offsets into the file. `.bel` files only contain ASCII keys
+           and integer values, so this does not change the decoded content.
+    """
+
+    def __init__(self, path: str, chunk_size: int = CHUNK_SIZE):
+        self.path = path
+        self.header = {}
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._file = open(path, "rb")
+        self._buffer = ""
+        self._pos = 0  # position within self._buffer
+        self._offset = 0  # byte offset of self._buffer[0] within the file
+        self._eof = False
+        self._consumed = False
+        try:
+            self._read_header()
+        except BaseException:
+            self._file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def __iter__(self) -> Iterator[Tuple[dm.PatchCoords, dm.Patch]]:
+        for index, _, _, patch in self.iter_raw():
+            coords = dm.PatchCoords(*mappings.index_to_patch(index))
+            yield coords, dm.Patch.from_dict(patch)
+
+    def iter_raw(self) -> Iterator[Tuple[int, int, int, dict]]:
+        """Yield `(index, start, end, patch_dict)` for every patch in the file, where
+        `start` and `end` are the byte span of the patch object within the file."""
+        if self._consumed:
+            raise BelFormatError(f"Patches in {self.path} have already been read.")
+        self._consumed = True
+        index = 0
+        if self._peek() == "]":
+            self._pos += 1
+        else:
+            while True:
+                start, end, patch = self._value()
+                yield index, start, end, patch
+                index += 1
+                if self._next_delimiter(",]") == "]":
+                    break
+        if self._next_delimiter(",}") == ",":
+            self._read_members()
+
+    def _read_header(self):
+        self._expect("{")
+        if self._peek() == "}":
+            raise BelFormatError(f"{self.path} does not contain any patches.")
+        self._read_members()
+        if PATCH_KEY not in self.header:
+            raise BelFormatError(f"{self.path} does not contain any patches.")
+        del self.header[PATCH_KEY]
+
+    def _read_members(self):
+        """Read `key: value` members of the top level object into self.header, until
+        either the start of the patch array or the end of the object."""
+        if self._peek() == "}":
+            return
+        while True:
+            _, _, key = self._value()
+            self._expect(":")
+            if key == PATCH_KEY:
+                self._expect("[")
+                self.header[PATCH_KEY] = None
+                return
+            self.header[key] = self._value()[2]
+            if self._next_delimiter(",}") == "}":
+                return
+
+    def _fill(self) -> bool:
+        """Read the next chunk of the file into the buffer, discarding anything that
+        has already been consumed. Return False at the end of the file."""
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._offset += self._pos
+        self._buffer = self._buffer[self._pos :] + chunk.decode("latin-1")
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Skip whitespace and return the next character (without consuming it)."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise BelFormatError(f"Unexpected end of file in {self.path}.")
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            raise BelFormatError(
+                f"Expected '{char}' at byte {self._offset + self._pos} of {self.path}."
+            )
+        self._pos += 1
+
+    def _next_delimiter(self, allowed: str) -> str:
+        char = self._peek()
+        if char not in allowed:
+            raise BelFormatError(
+                f"Unexpected '{char}' at byte {self._offset + self._pos} of {self.path}."
+            )
+        self._pos += 1
+        return char
+
+    def _value(self):
+        """Decode the next JSON value, reading more of the file until it is complete.
+        Return `(start, end, value)`, where start and end are byte offsets."""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise BelFormatError(f"Invalid JSON in {self.path}.")
+                continue
+            # a value that runs up to the end of the buffer (eg a number) may
+            # continue in the next chunk.
+            if end == len(self._buffer) and self._fill():
+                continue
+            start = self._offset + self._pos
+            self._pos = end
+            return start, self._offset + end, value
+
+
+def iter_patches(path: str) -> Iterator[Tuple[dm.PatchCoords, dm.Patch]]:
+    """Yield `(PatchCoords, Patch)` for every patch in the backup at `path`."""
+    with BelReader(path) as reader:
+        yield from reader
+
+
+def read_header(path: str) -> dict:
+    """Return the header (everything but the patch list) of the backup at `path`."""
+    with BelReader(path) as reader:
+        return reader.header
+
+
+def index_path(path: str) -> str:
+    return f"{path}{INDEX_SUFFIX}"
+
+
+def build_index(path: str) -> List[Tuple[int, int]]:
+    """Return the `(start, end)` byte span of every patch object in the backup."""
+    with BelReader(path) as reader:
+        return [(start, end) for _, start, end, _ in reader.iter_raw()]
+
+
+def load_index(path: str, cache: bool = True) -> List[Tuple[int, int]]:
+    """Return the patch spans of the backup at `path`.
+
+    The spans are cached in a file next to the backup, keyed on the size and mtime of
+    the backup, so that the backup only needs to be parsed again when it changes. A
+    cache that cannot be read is ignored and rebuilt.
+    """
+    stat = os.stat(path)
+    key = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    cache_file = index_path(path)
+    if cache and os.path.isfile(cache_file):
+        try:
+            with open(cache_file, "r") as infile:
+                cached = json.load(infile)
+            if cached.get("key") == key:
+                return [tuple(span) for span in cached["spans"]]
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            # a damaged cache is a miss, and is overwritten below.
+            logging.debug(f"Ignoring invalid patch index {cache_file}: {e}")
+    spans = build_index(path)
+    if cache:
+        try:
+            # written atomically, so that a reader never sees half of it.
+            with open(f"{cache_file}.tmp", "w") as outfile:
+                json.dump({"key": key, "spans": spans}, outfile)
+            os.replace(f"{cache_file}.tmp", cache_file)
+        except OSError as e:
+            logging.debug(f"Unable to cache patch index for {path}: {e}")
+    return spans
+
+
+class BelIndex(Sequence):
+    """Read-only sequence of the raw patch dicts in a backup file.
+
+    Each patch is decoded from a memory map of the file when it is accessed, using
+    the spans from `load_index`, so nothing but the requested patch is parsed. This
+    can be used as the patch list of a lazy PatchList.
+    """
+
+    def __init__(self, path: str, cache: bool = True):
+        self.path = path
+        self.spans = load_index(path, cache=cache)
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        start, end = self.spans[index]
+        return json.loads(self._map[start:end])
+
+    def raw(self, index: int) -> bytes:
+        """Return the encoded bytes of the patch at `index`."""
+        start, end = self.spans[index]
+        return self._map[start:end]
+
+
+def read_patch_at(path: str, bank: int, patch: int) -> dm.Patch:
+    """Read the single patch at `bank:patch` from the backup at `path`."""
+    with BelIndex(path) as index:
+        return dm.Patch.from_dict(index[mappings.patch_to_index(bank, patch)])
+
+
+def load_patch_list(path: str, backend: str = "patch", **kwargs) -> dm.PatchList:
+    """Create a PatchList from the backup at `path`.
+
+    With the lazy backend, patches are decoded from a memory map of the backup as they
+    are accessed. The memory map is only released when the PatchList is garbage
+    collected, so use `open_patch_list` to release it as soon as the PatchList is no
+    longer needed. Otherwise the backup is streamed into the PatchList.
+    """
+    if backend == "lazy":
+        patches = BelIndex(path)
+    else:
+        with BelReader(path) as reader:
+            patches = [patch for *_, patch in reader.iter_raw()]
+    return dm.PatchList(patches, backend=backend, **kwargs)
+
+
+@contextmanager
+def open_patch_list(
+    path: str, backend: str = "patch", **kwargs
+) -> Iterator[dm.PatchList]:
+    """Context manager version of `load_patch_list`, which closes the memory map of
+    the backup (with the lazy backend) when the block exits.
+
+    Usage:
+
+        with open_patch_list("backup.bel", backend="lazy") as patch_list:
+            ...
+    """
+    if backend != "lazy":
+        yield load_patch_list(path, backend, **kwargs)
+        return
+    with BelIndex(path) as patches:
+        yield dm.PatchList(patches, backend=backend, **kwargs)
+
+
+def changed_patches(old: Iterable[dict], new: Iterable[dict]) -> Dict[int, dict]:
+    """Return `{index: patch}` for every patch in `new` that differs from `old`."""
+    return {i: b for i, (a, b) in enumerate(zip(old, new)) if a != b}
+
+
+def splice_write(
+    source: str,
+    output: str,
+    changed: Mapping[int, dict],
+    spans: List[Tuple[int, int]] = None,
+) -> int:
+    """Write a copy of the backup at `source` to `output`, with the patches in
+    `changed` (a mapping of patch index to patch dict) replaced.
+
+    Everything else, including the header, the `system` section and the separators
+    between patches, is copied verbatim from `source`, so the time taken scales with
+    the number of changed patches rather than the size of the backup. Return the
+    number of patches that were re-encoded.
+
+    `spans` can be supplied if the patch spans of `source` are already known (eg from
+    `BelReader.iter_raw`), otherwise they are read with `load_index`.
+    """
+    if spans is None:
+        spans = load_index(source)
+    with open(source, "rb") as infile, open(output, "wb") as outfile:
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            pos = 0
+            for index in sorted(changed):
+                start, end = spans[index]
+                outfile.write(data[pos:start])
+                outfile.write(json.dumps(changed[index]).encode())
+                pos = end
+            outfile.write(data[pos:])
+    return len(changed)
+
+
+def write_bel(outfile, header: Mapping, patches: Iterable) -> int:
+    """Write a backup to the text file handle `outfile`, one patch at a time.
+
+    `header` holds the top-level keys of the backup (`target`, `format` and `system`)
+    and `patches` is any iterable of patch dicts or Patch instances, which is only
+    consumed as it is written. The output is identical to `json.dump` of the whole
+    document. Return the number of patches written.
+    """
+    outfile.write("{")
+    for key, value in header.items():
+        outfile.write(f"{json.dumps(key)}: {json.dumps(value)}, ")
+    outfile.write(f"{json.dumps(PATCH_KEY)}: [")
+    count = 0
+    for patch in patches:
+        if count:
+            outfile.write(", ")
+        if not isinstance(patch, dict):
+            patch = patch.to_dict()
+        outfile.write(json.dumps(patch))
+        count += 1
+    outfile.write("]}")
+    return count
@@ -0,0 +1,101 @@
+"""Mask/update codec compiled from the fields of a patch dataclass.
+
+`Patch._mutate` works out what to do with every field of every patch at call time,
+via `getattr`, `isinstance` checks and a `starmap` over bound methods. As the fields
+of a patch and their types never change, this module generates the source for
+specialized mask, update, equality and hash functions once at import time, with one
+unrolled block per field that already knows whether the field is a scalar or a list.
+"""
+
+from dataclasses import fields
+from types import SimpleNamespace
+
+_MISSING = object()
+
+
+def _mask_source(names, lists):
+    lines = ["def mask(base, patch):", "    out = {}", "    get = patch.get"]
+    for name in names:
+        if name in lists:
+            value = "[None if x == y else y for x, y in zip(c, v)]"
+        else:
+            value = "v"
+        lines += [
+            f"    v = get({name!r}, _MISSING)",
+            "    if v is not _MISSING:",
+            f"        c = base.{name}",
+            "        if c != v:",
+            f"            out[{name!r}] = {value}",
+        ]
+    lines.append("    return out")
+    return "\n".join(lines)
+
+
+def _update_source(names, lists):
+    lines = ["def update(base, mask):", "    get = mask.get"]
+    for i, name in enumerate(names):
+        if name in lists:
+            value = "[x if y is None else y for x, y in zip(c, v)]"
+        else:
+            value = "c if v is None else v"
+        lines += [
+            f"    c = base.{name}",
+            f"    v = get({name!r}, c)",
+            "    if v is not c and c != v:",
+            f"        c = {value}",
+            f"    f{i} = c",
+        ]
+    args = ", ".join(f"f{i}" for i in range(len(names)))
+    lines.append(f"    return _cls({args})")
+    return "\n".join(lines)
+
+
+def _equals_source(names):
+    comparisons = " and ".join(f"a.{name} == b.{name}" for name in names)
+    return "\n".join(
+        [
+            "def equals(a, b):",
+            "    if a is b:",
+            "        return True",
+            "    if b.__class__ is not a.__class__:",
+            "        return NotImplemented",
+            f"    return {comparisons}",
+        ]
+    )
+
+
+def _hash_source(names, lists):
+    values = ", ".join(f"tuple(a.{n})" if n in lists else f"a.{n}" for n in names)
+    return "\n".join(["def content_hash(a):", f"    return hash(({values}))"])
+
+
+def compile_codec(cls, template) -> SimpleNamespace:
+    """Compile mask, update and equality functions for the dataclass `cls`.
+
+    `template` is a fully populated instance of `cls` (eg the factory default patch)
+    which is used to determine whether each field is a scalar or a list.
+
+    * mask(base, patch):  equivalent to `base._mutate("_mask", patch)`.
+    * update(base, mask): equivalent to `cls(**{**asdict(base),
+                          **base._mutate("_pick", mask)})`.
+    * equals(a, b):       field by field equality, short-circuiting on the first
+                          field that differs.
+    * hash(a):            hash of the contents of every field, consistent with
+                          equals.
+    """
+    names = [f.name for f in fields(cls)]
+    lists = {name for name in names if isinstance(getattr(template, name), list)}
+    namespace = {"_MISSING": _MISSING, "_cls": cls}
+    for source in (
+        _mask_source(names, lists),
+        _update_source(names, lists),
+        _equals_source(names),
+        _hash_source(names, lists),
+    ):
+        exec(compile(source, f"<{cls.__name__} codec>", "exec"), namespace)
+    return SimpleNamespace(
+        mask=namespace["mask"],
+        update=namespace["update"],
+        equals=namespace["equals"],
+        hash=namespace["content_hash"],
+    )
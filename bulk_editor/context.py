@@ -2,6 +2,8 @@
 
 from dataclasses import dataclass
 
+from tinydb import TinyDB, Query
+
 from . import database as db
 
 
@@ -16,3 +18,5 @@ class DotDict(dict):
 @dataclass
 class AppContext:
     user_prefs: db.Es8Table
+    db: TinyDB = None
+    orm: Query = None
@@ -1,15 +1,17 @@
-from dataclasses import dataclass, field, asdict
-from datetime import datetime
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields, asdict, replace
 from functools import reduce
-from itertools import starmap
+from itertools import count, starmap
 import json
 import logging
+from operator import mul
 import os
-from typing import Optional
+from typing import List, Optional, Sequence
 
 from . import defaults, mappings
-
-GLOBAL_DEFAULTS_FILE = "global_defaults"
+from .codec import compile_codec
+from .inverted import InvertedIndex, Selection
+from .mask import Edit, Mask, compose
 
 
 class BulkEditorError(Exception):
@@ -20,24 +22,59 @@ class NoDefaultSet(BulkEditorError):
     pass
 
 
+class FrozenDict(dict):
+    """Read-only dictionary, which can be hashed (and so used in sets, or as a key)."""
+
+    __slots__ = ()
+
+    def __hash__(self):
+        return hash(frozenset(self.items()))
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__} is read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+
+class _HashCache:
+    """Base class for slotted dataclasses, adding a slot to cache their hash in."""
+
+    __slots__ = ("_hash",)
+
+
 @dataclass
 class PatchCoords:
     bank: int
     patch: int
 
 
-def get_global_defaults_from_file():
+def get_global_defaults_from_file(path: Optional[str] = None):
+    """Return the global defaults from the JSON file at `path`, or by default the
+    current version in the defaults store (see `defaults_store`)."""
+    if path is None:
+        from .defaults_store import DefaultsStore
+
+        return DefaultsStore().current()
     global_defaults = DEFAULT_PATCH
-    if os.path.isfile(GLOBAL_DEFAULTS_FILE):
-        with open("{GLOBAL_DEFAULTS_FILE}.json", "r") as infile:
+    if os.path.isfile(path):
+        with open(path, "r") as infile:
             global_defaults = Patch(**json.load(infile))
             if global_defaults.is_mask:
                 # if the supplied global default file is actually a mask,
                 # apply it to the factory default so that it is a full Patch.
-                global_defaults = DEFAULT_PATCH.update(**asdict(global_defaults))
+                global_defaults = DEFAULT_PATCH.update(asdict(global_defaults))
     return global_defaults
 
 
+def _as_patch(patch) -> "Patch":
+    return patch if isinstance(patch, Patch) else Patch.from_dict(patch)
+
+
+def _as_dict(patch) -> dict:
+    return patch if isinstance(patch, dict) else patch.to_dict()
+
+
 @dataclass
 class Profile:
     id: int
@@ -54,32 +91,150 @@ class PatchList:
     """
 
     patches: list
-    global_defaults_name: str = GLOBAL_DEFAULTS_FILE
-    global_defaults_backup: str = "{GLOBAL_DEFAULTS_FILE}_{date}"
+    # path of the defaults store that set_as_default(to_file=True) commits to, by
+    # default `defaults_store.store_path()`.
+    defaults_store: Optional[str] = None
     # NOTE - The states attribute might be a bit of a code smell. It is comprised of a
     #        list with mixed data types. Index[0] is a Patch instance, and everything
-    #        else is a mask (dictionary), so that the masks can be reduced
-    #        onto the patch. Not sure if this is a bad pattern or not.
-    states: list = field(default_factory=lambda: [get_global_defaults_from_file()])
+    #        else is a mask (dictionary or sparse Mask), so that the masks can be
+    #        reduced onto the patch. Not sure if this is a bad pattern or not.
+    # NOTE - the states start from the factory default unless given. The global
+    #        defaults in the defaults store are never read implicitly, pass
+    #        `states=[get_global_defaults_from_file()]` to start from them.
+    states: list = field(default_factory=lambda: [DEFAULT_PATCH])
+    # "patch" keeps a Patch instance per slot, "matrix" keeps all patches in a single
+    # columnar PatchMatrix and applies defaults as whole-column operations, "lazy"
+    # keeps the raw patch dicts and only builds a Patch instance for a slot when it
+    # is first accessed, "stream" keeps patches as a one-shot iterator so that they
+    # can be read, updated and written one at a time.
+    backend: str = "patch"
+    # NOTE - _rows, _patches, _cache and _interned are set by the patches setter.
+    _rows: list = field(init=False, repr=False)
     _patches: list = field(init=False, repr=False)
+    _cache: dict = field(init=False, repr=False)
+    _interned: dict = field(init=False, repr=False)
+    _matrix: object = field(init=False, repr=False, default=None)
+    # InvertedIndex of the patches, built on demand - see self.index
+    _index: Optional[InvertedIndex] = field(
+        init=False, repr=False, compare=False, default=None
+    )
+    # (states list, number of states folded, folded Patch) - see latest_default_state
+    _fold_cache: tuple = field(
+        init=False, repr=False, compare=False, default=(None, 0, None)
+    )
+    # Edit accumulated since begin() (None outside of a transaction), and the length
+    # of self.states when the transaction began - see begin()
+    _pending: Optional[Edit] = field(
+        init=False, repr=False, compare=False, default=None
+    )
+    _savepoint: int = field(init=False, repr=False, compare=False, default=0)
+
+    def __post_init__(self):
+        if self.backend == "matrix":
+            from .matrix import PatchMatrix
+
+            self._matrix = PatchMatrix.from_patches(self._rows)
+            self._rows = None
+        elif self.backend == "patch":
+            # build every Patch instance up front.
+            self.patches
 
     @staticmethod
     def _convert_to_index(bank: int, patch: int):
         """The ES-8 has 800 patches arranged in 100 banks of 8.
         The banks go from 0-99, and each patch in a bank is numbered 1-8.
         The patch list is 0-indexed, so we must subtract 1 to get the correct index.
-        EG Bank 32, patch 4 would be ((32 + 1) * 8 + 4) - 1 = 267.
+        EG Bank 32, patch 4 would be (32 * 8 + 4) - 1 = 259.
         """
-        return (((bank + 1) * 8) + patch) - 1
+        return mappings.patch_to_index(bank, patch)
 
     @property
     def patches(self):
+        """Return every patch as a Patch instance, building any that have not been
+        built yet.
+
+        In stream mode this is a one-shot iterator over the patches instead.
+        """
+        if self.backend == "stream":
+            return map(_as_patch, self._rows)
+        if self._patches is None:
+            self._patches = [self._patch_at(i) for i in range(len(self.rows))]
         return self._patches
 
     @patches.setter
     def patches(self, patches: list):
-        """Take in a list of dicts and return a list of initialized Patch instances."""
-        self._patches = list(map(lambda p: Patch(**p), patches))
+        """Take in a list (or iterable) of dicts or Patch instances.
+
+        Patch instances are built from the dicts when they are first accessed, either
+        through self.patches or (in lazy mode) one at a time through self.get_patch.
+        """
+        self._rows = patches
+        self._patches = None
+        self._cache = {}
+        self._interned = {}
+        self._matrix = None
+        self._index = None
+
+    @property
+    def rows(self) -> Sequence:
+        """Return the raw patch list, as dicts or Patch instances."""
+        if self._rows is None:
+            self._rows = (
+                self._patches
+                if self._patches is not None
+                else list(self._matrix.to_dicts())
+            )
+        elif not isinstance(self._rows, Sequence):
+            self._rows = list(self._rows)
+        return self._rows
+
+    def _patch_at(self, index: int):
+        """Return the Patch at `index`, building it from the raw dict (and caching it)
+        on first access."""
+        if self._patches is not None:
+            return self._patches[index]
+        patch = self._cache.get(index)
+        if patch is None:
+            patch = self._cache[index] = self._intern(_as_patch(self.rows[index]))
+        return patch
+
+    def _intern(self, patch: "Patch") -> "Patch":
+        """Return the Patch equal to `patch` that is already in the list, if there is
+        one, so that identical patches (eg factory fresh patches) share one instance.
+        """
+        return self._interned.setdefault(patch, patch)
+
+    @property
+    def matrix(self):
+        """Return the patches as a PatchMatrix, building it from self.rows if it
+        has not been built yet."""
+        if self._matrix is None:
+            from .matrix import PatchMatrix
+
+            self._matrix = PatchMatrix.from_patches(self.rows)
+        return self._matrix
+
+    @property
+    def index(self) -> InvertedIndex:
+        """Return an inverted index of the cell values of every patch, building it on
+        first use. Once built, the index is updated as defaults are applied.
+
+        NOTE - edits in a transaction are only reflected once they are committed.
+        """
+        if self._index is None:
+            if self.backend == "stream":
+                raise BulkEditorError("Patches can not be indexed in stream mode.")
+            if self.backend == "matrix":
+                self._index = InvertedIndex.from_matrix(self.matrix)
+            else:
+                self._index = InvertedIndex.from_patches(self.rows)
+        return self._index
+
+    def select(self, field: str, value, index: Optional[int] = None) -> Selection:
+        """Return the slots of the patches where `field` (or `field[index]`) is
+        `value`, eg `select("ID_PATCH_LOOP_SW_LOOP", 1, 6)` for every patch with loop
+        7 on. Selections can be combined with `&`, `|` and `~`."""
+        return self.index.where(field, value, index)
 
     @property
     def initial_default_state(self):
@@ -89,18 +244,38 @@ class PatchList:
     def latest_default_state(self):
         """Collapse self.states down to a single Patch instance representing the latest
         default state.
-        TODO - Maybe make this a LRU cache so we aren't reducing every time this thing
-               is accessed?
-               Could probably key the cache on the length of `self.state`. If the length
-               isnt in the cache,
-               recalculate latest_default_state otherwise return the cached value.
+
+        The folded Patch is cached, so reading this is O(1) unless self.states has
+        changed since the last fold.
         """
-        return reduce(lambda state, mask: state.update(mask), self.states)
+        return self._fold()
+
+    def _fold(self):
+        """Fold any states that have not been folded yet onto the cached default.
+
+        The cache is keyed on the identity and length of self.states. Pushing a state
+        only folds the new mask onto the cached Patch, while replacing (or shrinking)
+        self.states invalidates the cache and folds the new stack from the start.
+        NOTE - self.states is treated as append-only. Editing an entry in place will
+               not invalidate the cache.
+        """
+        states, length, folded = self._fold_cache
+        if states is not self.states or length > len(self.states):
+            length, folded = 1, self.states[0]
+        if length < len(self.states):
+            folded = reduce(
+                lambda state, mask: state.update(mask), self.states[length:], folded
+            )
+        self._fold_cache = (self.states, len(self.states), folded)
+        return folded
 
     def get_patch(self, bank: int, patch: int):
         """Return a patch specified by bank and: integer."""
         index = self._convert_to_index(bank, patch)
-        return self.patches[index]
+        if self._pending:
+            # include any edits that have not been committed yet.
+            return Patch.from_dict(self._pending.apply(self._patch_at(index)))
+        return self._patch_at(index)
 
     def set_as_default(
         self, bank: int, patch: int, to_file: bool = False, no_return: bool = True
@@ -115,8 +290,8 @@ class PatchList:
         :type bank: int
         :param patch: patch number for default patch
         :type patch: int
-        :param to_file: boolean indicating whether to write out patch to file
-                        (default True)
+        :param to_file: boolean indicating whether to commit the new default to the
+                        defaults store as a new version (default False)
         :type to_file: bool
         :return: Patch instance representing default patch
         :rtype: Patch
@@ -134,16 +309,10 @@ class PatchList:
             self._update_states(new_default_state)
 
         if to_file:
-            # TODO - Not sure if I want to have file operations inside this class.
-            now = datetime.now()
-            backup_file = (
-                f"{self.global_defaults_backup.format(date=now.toisoformat())}.json"
-            )
-            current_default_file = f"{self.global_defaults_name}.json"
+            from .defaults_store import DefaultsStore
 
-            map(
-                lambda f: self.render_to_file(f, "latest_default_state"),
-                [backup_file, current_default_file],
+            DefaultsStore(self.defaults_store).commit(
+                self.latest_default_state, f"set_as_default {bank}:{patch}"
             )
 
         return None if no_return else self.latest_default_state
@@ -153,10 +322,59 @@ class PatchList:
 
         the newest state is the end of the list.
         """
+        previous = self.latest_default_state
         if isinstance(new_state, Patch):
-            new_state = asdict(new_state)
+            # only keep the cells that actually change the latest default state.
+            new_state = Mask.diff(previous, new_state)
 
         self.states.append(new_state)
+        latest = self._fold()
+        if self._pending is not None:
+            self._pending = compose(self._pending, Edit.diff(previous, latest))
+
+    def begin(self):
+        """Start a transaction.
+
+        Until commit() is called, changes to the default state (eg update_assign,
+        set_as_default) are only accumulated into a single pending Edit, and are not
+        applied to the patches. Any states that were already pushed but not applied
+        yet are included in the transaction.
+        """
+        if self._pending is not None:
+            raise BulkEditorError("A transaction is already in progress.")
+        self._savepoint = len(self.states)
+        self._pending = Edit.diff(self.initial_default_state, self.latest_default_state)
+
+    def commit(self):
+        """Apply every change made since begin() to the patches in a single pass.
+
+        The result is identical to applying each change as it was made, as the
+        pending Edit remembers every value that the default has held for each cell.
+        """
+        if self._pending is None:
+            raise BulkEditorError("No transaction in progress.")
+        edit, self._pending = self._pending, None
+        self.states = [self.latest_default_state]
+        self._apply_edit(edit)
+
+    def rollback(self):
+        """Discard every change made since begin()."""
+        if self._pending is None:
+            raise BulkEditorError("No transaction in progress.")
+        self._pending = None
+        self.states = self.states[: self._savepoint]
+
+    @contextmanager
+    def transaction(self):
+        """Run the body of a `with` block as a transaction, committing it at the end,
+        or rolling it back if an exception is raised."""
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
 
     def apply_default(self, factory: bool = False, overwrite: bool = False):
         """Apply self.latest_default_state to all patches.
@@ -178,93 +396,301 @@ class PatchList:
 
         if overwrite:
             logging.warning("Destructive action! This will overwite data!")
-            self.patches = [self.latest_default_state * 800]
+            self.patches = [self.latest_default_state] * len(self.rows)
             return
 
         self._apply()
 
     @staticmethod
-    def create_input_array(index, value, value_type, array_type):
-        input_array = defaults.default_values(
-            None, mappings.array_lengths_map[array_type]
-        )
+    def input_value(value, value_type):
         if value_type == "integer":
-            input_array[index] = value
-        else:
-            input_array[index] = mappings.value_type_map[value_type].index(value)
+            return value
+        return mappings.value_type_map[value_type].index(value)
+
+    @staticmethod
+    def create_input_array(index, value, value_type, array_type):
+        input_array = defaults.values(None, mappings.array_lengths_map[array_type])
+        input_array[index] = PatchList.input_value(value, value_type)
         return input_array
 
-    def get_patch_assigns(self, bank: int, patch: int):
+    def get_patch_assigns(self, bank: int, patch: int) -> List["Assign"]:
+        """Return the assigns of the patch at bank:patch."""
         index = self._convert_to_index(bank, patch)
-        p = self.patches[index]
-        return [
-            Assign(patch_id=index, **{p.get_assign(i)})
-            for i in range(mappings.array_lengths_map["assign"])
-        ]
+        return decode_assigns(assign_columns([self.get_patch(bank, patch)]), index)
+
+    def assigns(self) -> List["Assign"]:
+        """Return every assign slot of every patch as an Assign, ordered by patch and
+        then by assign number (eg to load into `database_old.AssignModel`).
+
+        NOTE - edits in a transaction are only reflected once they are committed.
+        """
+        if self.backend == "stream":
+            raise BulkEditorError("Assigns can not be decoded in stream mode.")
+        if self.backend == "matrix":
+            from .matrix import FIELD_SLICES
+
+            columns = self.matrix.columns
+            return decode_assigns(
+                {name: columns[FIELD_SLICES[name]] for name in ASSIGN_FIELDS}
+            )
+        return decode_assigns(assign_columns(self.rows))
 
     def update_assign(
-        self, assign_number: int, source: str, mode: str, target: str, params: dict
+        self,
+        assign_number: int,
+        source: str,
+        mode: str,
+        target: str,
+        params: dict,
+        apply: bool = True,
     ):
         """update self.latest_default_state's assign number assign_number
         TODO - lots of args. Maybe there is a better way to pass the argparse arguments
                around.
+
+        Set apply to False to only update the default state, so that several edits
+        can be applied to the patches together with a single call to apply_default.
         """
         index = assign_number - 1
-        non_assign_params = {}
+        mask = Mask(
+            {
+                ("ID_PATCH_ASSIGN_SOURCE", index): self.input_value(source, "source"),
+                ("ID_PATCH_ASSIGN_TARGET", index): self.input_value(target, "target"),
+                ("ID_PATCH_ASSIGN_MODE", index): self.input_value(mode, "mode"),
+                ("ID_PATCH_ASSIGN_SW", index): 1,  # turn on patch assign
+                # NOTE: This assumes that _all_ params entries will _always_ be:
+                #       integers!
+                **{(k, index): v for (k, v) in params.items()},
+            }
+        )
         if source in mappings.ES8_FOOTSWITCHES:
             # if the assign is a footswitch of the ES-8, then disable the normal
             # functionality of the footswitch globally.
-            non_assign_params["ID_PATCH_CTL_FUNC"] = self.create_input_array(
-                mappings.ES8_FOOTSWITCHES.index(source), "OFF", "ctl_func", "ctl_func"
-            )
-        mask = dict(
-            ID_PATCH_ASSIGN_SOURCE=self.create_input_array(
-                index, source, "source", "assign"
-            ),
-            ID_PATCH_ASSIGN_TARGET=self.create_input_array(
-                index, target, "target", "assign"
-            ),
-            ID_PATCH_ASSIGN_MODE=self.create_input_array(index, mode, "mode", "assign"),
-            ID_PATCH_ASSIGN_SW=self.create_input_array(
-                index, 1, "integer", "assign"
-            ),  # turn on patch assign
-            # NOTE: This assumes that _all_ params entries will _always_ be: integers!
-            **{
-                k: self.create_input_array(index, v, "integer", "assign")
-                for (k, v) in params.items()
-            },
-            **non_assign_params,
-        )
+            ctl_index = mappings.ES8_FOOTSWITCHES.index(source)
+            mask[("ID_PATCH_CTL_FUNC", ctl_index)] = self.input_value("OFF", "ctl_func")
         self._update_states(mask)
-        self._apply()
+        if apply:
+            self._apply()
         return self.patches, self.latest_default_state
 
     def _apply(self):
         """Apply self.latest_default_state to patches, using self.initial_default_state
-        to create masks."""
-        # create patch masks
-        patch_masks = map(
-            lambda patch: self.initial_default_state.mask(asdict(patch)), self.patches
-        )
-        # Apply patch masks to new default state
-        self.patches = map(
-            lambda mask: asdict(self.latest_default_state.update(mask)), patch_masks
-        )
+        as the base of each patch.
+
+        Only the cells where the two default states differ are visited: a cell that
+        still holds the initial default value is set to the latest default value, and
+        everything else is carried over untouched (patches that do not change at all
+        are kept as is). This is equivalent to
+        `latest.update(initial.mask(patch))` for every patch.
+
+        Inside a transaction this does nothing, the patches are updated by commit().
+        """
+        if self._pending is not None:
+            return
+        edit = Edit.diff(self.initial_default_state, self.latest_default_state)
         # Reset the states stack
-        new_initial_state = self.latest_default_state
-        self.states = [new_initial_state]
+        self.states = [self.latest_default_state]
+        self._apply_edit(edit)
+
+    def _apply_edit(self, edit: Edit):
+        """Apply `edit` to every patch."""
+        if not edit:
+            return
+        index = self._index
+        self._rewrite(edit, lambda matrix: matrix.apply_edit(edit))
+        if index is not None:
+            # move the patches in the index rather than rebuilding it.
+            index.apply_edit(edit)
+            self._index = index
+
+    def _rewrite(self, edit, apply_matrix):
+        """Rewrite every patch with `edit`, which has the `changes`/`apply` interface
+        of `mask.Edit`. `apply_matrix` applies it to a PatchMatrix.
+
+        The updated patches are a lazy `map`, which is only consumed when the patches
+        are next accessed (or, in stream mode, written out).
+        """
+        if self.backend == "matrix":
+            self._matrix = apply_matrix(self.matrix)
+            self._rows = None
+            self._patches = None
+            self._cache = {}
+            self._index = None
+        elif self.backend in ("lazy", "stream"):
+            # work directly on the raw dicts, without building every Patch.
+            rows = self._rows if self.backend == "stream" else self.rows
+            self.patches = map(edit.apply, rows)
+        else:
+            # identical patches are interned, so each distinct patch is only updated
+            # once.
+            updated = {}
+
+            def apply_edit(patch):
+                if patch not in updated:
+                    updated[patch] = patch.apply_edit(edit)
+                return updated[patch]
+
+            self.patches = map(apply_edit, self.patches)
+
+    def swap_loops(self, loop: int, other: int, wipe: bool = False):
+        """Swap loops `loop` and `other` (1-8) in every patch and in the default
+        state, see `loops.LoopSwap`. With `wipe`, the settings of `loop` move to
+        `other` and the settings that were in `other` are wiped.
+        """
+        from .loops import LoopSwap
+
+        self._rewire(LoopSwap(loop, other, wipe))
+        return self.patches, self.latest_default_state
+
+    def reorder_chain(
+        self, loop: int, anchor: int, after: bool = True, used_only: bool = True
+    ) -> List[int]:
+        """Move `loop` directly after (or before) `anchor` in the signal chain of
+        every patch that uses both loops (or of every patch, with `used_only=False`),
+        see `loops.ChainMove`. Loops are numbered 1-8, and 9 is the volume loop.
+
+        Return the slot of every patch that was left untouched because its chain is
+        not a valid permutation.
+        """
+        from .loops import ChainMove
+
+        if self.backend == "stream":
+            raise BulkEditorError("Chains can not be reordered in stream mode.")
+        move = ChainMove(loop, anchor, after, used_only)
+        with self._flushed():
+            # check the chains once any pending default changes are applied, as
+            # the move will find them.
+            rejected = move.rejected(
+                self.matrix if self.backend == "matrix" else self.rows
+            )
+            self.states = [self.latest_default_state.apply_edit(move)]
+            self._rewrite(move, move.apply_matrix)
+        return rejected
+
+    def merge_template(
+        self,
+        base,
+        theirs,
+        strategy: str = "ours",
+        threshold: Optional[float] = None,
+    ):
+        """Merge the change from the `base` version of a template (meta-patch) to
+        `theirs` into every patch derived from the template, with a three-way merge
+        (see `merge`). Cells that a patch customized are conflicts, which keep the
+        patch value with the "ours" strategy or take the new template value with
+        "theirs".
+
+        A patch is derived from the template if it holds the `base` value in at least
+        `threshold` (by default `merge.DERIVED_THRESHOLD`) of the cells where the
+        template differs from the factory default. Pass 0 to merge into every patch.
+
+        Return the `merge.MergeResult`, which holds the result for each cell and the
+        list of conflicts. The default state is left as is.
+        """
+        from .merge import DERIVED_THRESHOLD, derived_from, three_way_merge
+
+        if self.backend == "stream":
+            raise BulkEditorError("Templates can not be merged in stream mode.")
+        if threshold is None:
+            threshold = DERIVED_THRESHOLD
+        with self._flushed():
+            patches = derived_from(self.index, base, threshold) if threshold else None
+            result = three_way_merge(self.index, base, theirs, patches, strategy)
+            self._assign(result.assignments())
+        return result
+
+    def _assign(self, assignments: dict):
+        """Set cells of individual patches, from `{(field, index): (value,
+        Selection)}`, keeping the index (if it has been built) up to date."""
+        if not assignments:
+            return
+        index = self._index
+        if self.backend == "matrix":
+            from .matrix import FIELD_SLICES, PatchMatrix
+
+            columns = list(self.matrix.columns)
+            for (name, i), (value, patches) in assignments.items():
+                c = FIELD_SLICES[name] if i is None else FIELD_SLICES[name].start + i
+                column = columns[c] = list(columns[c])
+                for slot in patches:
+                    column[slot] = value
+            self._matrix = PatchMatrix(columns)
+            self._rows = None
+            self._patches = None
+            self._cache = {}
+        else:
+            masks = {}
+            for cell, (value, patches) in assignments.items():
+                for slot in patches:
+                    masks.setdefault(slot, Mask())[cell] = value
+            rows = list(self.patches if self.backend == "patch" else self.rows)
+            for slot, mask in masks.items():
+                patch = rows[slot]
+                rows[slot] = (
+                    patch.update(mask)
+                    if isinstance(patch, Patch)
+                    else mask.apply(patch)
+                )
+            self.patches = rows
+        if index is not None:
+            for (name, i), (value, patches) in assignments.items():
+                index.assign(name, i, value, patches)
+            self._index = index
+
+    def _rewire(self, edit):
+        """Apply `edit` (eg a `loops.LoopSwap`) to every patch and to the default
+        state, for changes to the patches themselves rather than to the default."""
+        with self._flushed():
+            self.states = [self.latest_default_state.apply_edit(edit)]
+            self._rewrite(edit, edit.apply_matrix)
+
+    @contextmanager
+    def _flushed(self):
+        """Apply any default changes that have not been applied yet before the body
+        of the `with` block, for changes to the patches themselves.
+
+        Inside a transaction, the changes so far are committed and a new transaction
+        is started afterwards, so a rollback only discards later changes.
+        """
+        in_transaction = self._pending is not None
+        if in_transaction:
+            self.commit()
+        else:
+            self._apply()
+        yield
+        if in_transaction:
+            self.begin()
+
+    def iter_dicts(self):
+        """Return an iterator over the patches in the dictionary shape used in `.bel`
+        files. In stream mode, this consumes the patches."""
+        if self.backend == "matrix":
+            return self.matrix.to_dicts()
+        if self.backend == "stream":
+            return map(_as_dict, self._rows)
+        return map(_as_dict, self.rows)
+
+    def to_dicts(self) -> list:
+        """Return the patches in the dictionary shape used in `.bel` files."""
+        return list(self.iter_dicts())
 
     def render_to_file(self, filename: str, attribute: str):
         attr = getattr(self, attribute)
         with open(filename, "w") as outfile:
-            json.dump(attr, outfile)
+            json.dump(attr.to_dict() if isinstance(attr, Patch) else attr, outfile)
 
 
-@dataclass
-class Patch:
+@dataclass(slots=True)
+class Patch(_HashCache):
     """Dataclass that bundles together all of the individual fields and related methods\
     for a patch.
 
+    Patch instances are slotted, and list fields are shared rather than copied between
+    a patch, the patches created from it by `update` and the dictionaries returned by
+    `to_dict`. Patches are therefore immutable: neither fields nor list fields may be
+    changed in place, and every method that changes a patch returns a new one. This
+    lets a Patch be hashed by its contents, with the hash cached on first use.
+
     **CORE CONCEPTS**
 
     Mask:   A mask in this context is a dictionary representation of a patch which only
@@ -276,10 +702,22 @@ class Patch:
             layers of changes to be applied while preserving the unique aspects of each
             patch.
 
+            A mask can also be held in sparse form as a `mask.Mask`, which is keyed
+            by `(field, index)` and contains only the differing cells.
+
     **KEY METHODS**
 
+    self.from_dict(d):   Create a Patch from the dictionary shape used in `.bel` files.
+
+    self.to_dict():      Return the dictionary shape used in `.bel` files, without
+                         copying any list fields.
+
     self.mask(patch):    Create a mask from a dictionary representation of a patch.
 
+    self.sparse_mask(patch):
+                         Create a sparse Mask from a Patch or its dictionary
+                         representation.
+
     self.update(mask):   Return a new Patch instance which contains the merged result of
                          the supplied mask with the state from the patch instance on
                          which this method was called. Importantly, this method can be
@@ -300,9 +738,11 @@ class Patch:
     # list of 9 boolean: integers, 1 for each loop + vol loop (9). 0: off, 1: on
     ID_PATCH_LOOP_SW_LOOP: list = field(default_factory=lambda: defaults.NINE_ZEROES)
     # list of 22 values:
-    #   * idx[0-8]: the volume loop (0) and the 8 loops (1-8). Ordered by the loops
-    #   * idx[9-21]: 9 then 10-12 listed twice and 13-15 listed twice. Use unknown.
-    # TODO: figure out the 2nd half of this list.
+    #   * idx[0-12]: the signal chain, listing an element at each step: the volume
+    #     loop (0) and the 8 loops (1-8) appear exactly once, along with 9 and 3 of
+    #     10-15 (in the factory default, the loops then 9 then 10-12).
+    #   * idx[13-21]: the remaining elements of 10-15. Use unknown.
+    # TODO: figure out elements 9-15 and the 2nd half of this list.
     ID_PATCH_LOOP_POSITION: list = field(
         default_factory=lambda: [
             8,  # ^
@@ -512,6 +952,17 @@ class Patch:
     # list of 8 integers: 0: auto, 1: manual
     ID_PATCH_MIDI_TRANSMIT: list = field(default_factory=lambda: defaults.EIGHT_ZEROES)
 
+    @classmethod
+    def from_dict(cls, patch: dict) -> "Patch":
+        return cls(**patch)
+
+    def to_dict(self) -> dict:
+        """Return the dictionary shape used in `.bel` files.
+
+        Unlike `dataclasses.asdict`, list fields are not deep copied.
+        """
+        return {name: getattr(self, name) for name in PATCH_FIELDS}
+
     @property
     def patch_name(self):
         """
@@ -523,52 +974,25 @@ class Patch:
         index = number - 1  # assigns are 1-indexed, locations in backup 0-indexed.
         source = self.ID_PATCH_ASSIGN_SOURCE[index]
         target = self.ID_PATCH_ASSIGN_TARGET[index]
-        source_params = self._get_params_for_assign_source(source)
-        target_params = self._get_params_for_assign_target(target)
-        assign_map = {
-            "is_enabled": self.ID_PATCH_ASSIGN_SW,
-            "min": self.ID_PATCH_ASSIGN_TARGET_MIN,
-            "max": self.ID_PATCH_ASSIGN_TARGET_MAX,
-            **source_params,
-            **target_params,
-        }
-        return {
-            "assign_number": number,
-            "source": mappings.PATCH_ASSIGN_SOURCE_ORDER[source],
-            "target": mappings.PATCH_ASSIGN_TARGET_ORDER[target],
-            "mode": mappings.PATCH_ASSIGN_MODE_ORDER[self.ID_PATCH_ASSIGN_MODE[index]],
-            **{k: v[index] for (k, v) in assign_map.items()},
-        }
-
-    def _get_params_for_assign_source(self, source: int):
-        global_params = {
-            "ActL": self.ID_PATCH_ASSIGN_ACT_RANGE_LO,
-            "ActH": self.ID_PATCH_ASSIGN_ACT_RANGE_HI,
-        }
-        params_map = {
-            mappings.PATCH_ASSIGN_SOURCE_ORDER.index("INT"): {
-                "trigger": self.ID_PATCH_ASSIGN_INT_PEDAL_TRIGGER,
-                "time": self.ID_PATCH_ASSIGN_INT_PEDAL_TIME,
-                "curve": self.ID_PATCH_ASSIGN_INT_PEDAL_CURVE,
-            },
-            mappings.PATCH_ASSIGN_SOURCE_ORDER.index("WAV"): {
-                "rate": self.ID_PATCH_ASSIGN_WAVE_PEDAL_RATE,
-                "form": self.ID_PATCH_ASSIGN_WAVE_PEDAL_FORM,
-            },
-            mappings.PATCH_ASSIGN_SOURCE_ORDER.index("CC"): {
-                "cc#": self.ID_PATCH_ASSIGN_INT_PEDAL_TRIGGER_CC
-            },
-        }
-        return {**global_params, **params_map.get(source, {})}
-
-    def _get_params_for_assign_target(self, source: int):
-        params_map = {
-            mappings.PATCH_ASSIGN_TARGET_ORDER.index("MIDI"): {
-                "target_cc_ch": self.ID_PATCH_ASSIGN_TARGET_CC_CH,
-                "target_cc#": self.ID_PATCH_ASSIGN_TARGET_CC_NO,
+        params = (
+            *ASSIGN_COMMON_PARAMS,
+            *ASSIGN_SOURCE_PARAMS.get(source, ()),
+            *ASSIGN_TARGET_PARAMS.get(target, ()),
+        )
+        return FrozenDict(
+            {
+                "assign_number": number,
+                "source": mappings.PATCH_ASSIGN_SOURCE_ORDER[source],
+                "target": mappings.PATCH_ASSIGN_TARGET_ORDER[target],
+                "mode": mappings.PATCH_ASSIGN_MODE_ORDER[
+                    self.ID_PATCH_ASSIGN_MODE[index]
+                ],
+                **{
+                    ASSIGN_KEYS[param]: getattr(self, ASSIGN_PARAM_FIELDS[param])[index]
+                    for param in params
+                },
             }
-        }
-        return {**params_map.get(source, {})}
+        )
 
     @staticmethod
     def _pick(old, new):
@@ -581,7 +1005,11 @@ class Patch:
         return None if old == new else new
 
     def _mutate(self, mode: str, dictionary: dict) -> dict:
-        """Mutate the input dictionary based on the supplied mode."""
+        """Mutate the input dictionary based on the supplied mode.
+
+        NOTE - `mask` and `update` use the equivalent functions compiled into
+               PATCH_CODEC instead. This is kept as the reference implementation.
+        """
         output = {}
         action = getattr(self, mode)
         for k, v in dictionary.items():
@@ -595,6 +1023,9 @@ class Patch:
     def update(self, mask: dict):
         """Return a new Patch instance, with mask applied.
 
+        `mask` may be a dense mask dictionary or a sparse Mask, in which case only
+        the masked cells are visited.
+
         The input mask dictionary will only contain keys/values that are different
         from either the factory default patch or the last state of the
         global_defaults.json.
@@ -605,7 +1036,9 @@ class Patch:
         in an 'upsert' action.
 
         """
-        return Patch(**{**asdict(self), **self._mutate("_pick", mask)})
+        if isinstance(mask, Mask):
+            return Patch(**mask.apply(self))
+        return PATCH_CODEC.update(self, mask)
 
     def mask(self, patch: dict) -> dict:
         """Return a 'mask' dictionary created by comparing the `patch` dictionary
@@ -623,14 +1056,32 @@ class Patch:
             * if the value is different from this Patch instance's version of
               key, pass that key on to the output dict.
         """
-        return self._mutate("_mask", patch)
+        return PATCH_CODEC.mask(self, patch)
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = PATCH_CODEC.hash(self)
+            return self._hash
+
+    def apply_edit(self, edit: Edit) -> "Patch":
+        """Return a copy of this patch with `edit` applied, or this patch itself if
+        the edit does not change it."""
+        changes = edit.changes(self)
+        return replace(self, **changes) if changes else self
+
+    def sparse_mask(self, patch) -> Mask:
+        """Return a sparse Mask of the cells in `patch` (a Patch instance or patch
+        dictionary) that differ from this Patch instance."""
+        return Mask.diff(self, patch)
 
     @property
     def is_mask(self):
         """Return True if this Patch instance is a "mask"
         IE if any of the list attributes contain Nones.
         """
-        for attr in asdict(self).values():
+        for attr in self.to_dict().values():
             if isinstance(attr, list):
                 return len([i for i in attr if i is None]) > 0
 
@@ -657,6 +1108,111 @@ class Assign:
     target_cc_num: int = 0
 
 
+# Patch field holding each parameter of an Assign, in Assign field order.
+ASSIGN_PARAM_FIELDS = {
+    "is_enabled": "ID_PATCH_ASSIGN_SW",
+    "min_": "ID_PATCH_ASSIGN_TARGET_MIN",
+    "max_": "ID_PATCH_ASSIGN_TARGET_MAX",
+    "ActL": "ID_PATCH_ASSIGN_ACT_RANGE_LO",
+    "ActH": "ID_PATCH_ASSIGN_ACT_RANGE_HI",
+    "trigger": "ID_PATCH_ASSIGN_INT_PEDAL_TRIGGER",
+    "time": "ID_PATCH_ASSIGN_INT_PEDAL_TIME",
+    "curve": "ID_PATCH_ASSIGN_INT_PEDAL_CURVE",
+    "rate": "ID_PATCH_ASSIGN_WAVE_PEDAL_RATE",
+    "form": "ID_PATCH_ASSIGN_WAVE_PEDAL_FORM",
+    "cc_num": "ID_PATCH_ASSIGN_INT_PEDAL_TRIGGER_CC",
+    "target_cc_ch": "ID_PATCH_ASSIGN_TARGET_CC_CH",
+    "target_cc_num": "ID_PATCH_ASSIGN_TARGET_CC_NO",
+}
+ASSIGN_FIELDS = (
+    "ID_PATCH_ASSIGN_SOURCE",
+    "ID_PATCH_ASSIGN_TARGET",
+    "ID_PATCH_ASSIGN_MODE",
+    *ASSIGN_PARAM_FIELDS.values(),
+)
+# the keys of Patch.get_assign, for the parameters that are not valid identifiers.
+ASSIGN_KEYS = {
+    **{param: param for param in ASSIGN_PARAM_FIELDS},
+    "min_": "min",
+    "max_": "max",
+    "cc_num": "cc#",
+    "target_cc_num": "target_cc#",
+}
+# parameters used by every assign, and those that only apply to some sources or
+# targets (and are left at 0 in an Assign otherwise).
+ASSIGN_COMMON_PARAMS = ("is_enabled", "min_", "max_", "ActL", "ActH")
+ASSIGN_SOURCE_PARAMS = {
+    mappings.PATCH_ASSIGN_SOURCE_ORDER.index("INT"): ("trigger", "time", "curve"),
+    mappings.PATCH_ASSIGN_SOURCE_ORDER.index("WAV"): ("rate", "form"),
+    mappings.PATCH_ASSIGN_SOURCE_ORDER.index("CC"): ("cc_num",),
+}
+ASSIGN_TARGET_PARAMS = {
+    mappings.PATCH_ASSIGN_TARGET_ORDER.index("MIDI"): ("target_cc_ch", "target_cc_num")
+}
+
+
+def assign_columns(patches: Sequence) -> dict:
+    """Transpose the assign fields of `patches` (Patch instances or patch dicts) into
+    the column layout used by decode_assigns."""
+    return {
+        name: list(
+            zip(
+                *(
+                    patch[name] if isinstance(patch, dict) else getattr(patch, name)
+                    for patch in patches
+                )
+            )
+        )
+        for name in ASSIGN_FIELDS
+    }
+
+
+def decode_assigns(columns: dict, start: int = 0) -> List[Assign]:
+    """Decode every assign slot of a list of patches into Assigns, ordered by patch
+    and then by assign number, with patch_ids counting up from `start`.
+
+    `columns` maps each of ASSIGN_FIELDS to one column per assign slot, holding the
+    value of that slot for every patch (as in PatchMatrix.columns). Each slot is
+    decoded in a single pass over its columns, with the parameters that do not apply
+    to a source/target pair zeroed by a flag tuple built once per pair.
+    """
+    params = tuple(ASSIGN_PARAM_FIELDS)
+    used_params = {}
+    slots = []
+    for index in range(mappings.array_lengths_map["assign"]):
+        slot = []
+        values = zip(*(columns[ASSIGN_PARAM_FIELDS[param]][index] for param in params))
+        for patch_id, source, target, mode, row in zip(
+            count(start),
+            columns["ID_PATCH_ASSIGN_SOURCE"][index],
+            columns["ID_PATCH_ASSIGN_TARGET"][index],
+            columns["ID_PATCH_ASSIGN_MODE"][index],
+            values,
+        ):
+            flags = used_params.get((source, target))
+            if flags is None:
+                used = {
+                    *ASSIGN_COMMON_PARAMS,
+                    *ASSIGN_SOURCE_PARAMS.get(source, ()),
+                    *ASSIGN_TARGET_PARAMS.get(target, ()),
+                }
+                flags = used_params[(source, target)] = tuple(
+                    param in used for param in params
+                )
+            slot.append(
+                Assign(
+                    patch_id,
+                    index + 1,
+                    mappings.PATCH_ASSIGN_SOURCE_ORDER[source],
+                    mappings.PATCH_ASSIGN_TARGET_ORDER[target],
+                    mappings.PATCH_ASSIGN_MODE_ORDER[mode],
+                    *map(mul, row, flags),
+                )
+            )
+        slots.append(slot)
+    return [assign for patch in zip(*slots) for assign in patch]
+
+
 @dataclass
 class LoopPrefs:
     type: str = "loop_prefs"
@@ -688,6 +1244,10 @@ class MidiPref:
 
 # Calling patch with no parameters instantiates the factory default.
 DEFAULT_PATCH = Patch()
+PATCH_FIELDS = tuple(f.name for f in fields(Patch))
+# Specialized mask/update/equality functions compiled from the fields of Patch.
+PATCH_CODEC = compile_codec(Patch, DEFAULT_PATCH)
+Patch.__eq__ = PATCH_CODEC.equals
 MODEL_MAP = {
     "loop_prefs": LoopPrefs,
     "midi_prefs": MidiPrefs,
@@ -1,26 +1,77 @@
 from abc import ABC
 from dataclasses import asdict
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional, Tuple
 
 
 from tinydb import TinyDB, Query
-from tinydb.table import Document
+from tinydb.middlewares import CachingMiddleware
+from tinydb.storages import JSONStorage
+from tinydb.table import Document, Table
 
-from . import defaults
+from . import bel, defaults, sqlite_db
 from . import mappings as m
 from . import data_models as models
-
-
-def init_db(
-    local_storage_path: str,
-):
-    return TinyDB(f"{local_storage_path}/db.json")
+from .sqlite_db import SqliteDB
 
 
 class Es8TableException(Exception):
     pass
 
 
+STORAGE_BACKENDS = ("tinydb", "sqlite")
+
+
+def init_db(local_storage_path: str, storage: str = "tinydb"):
+    """Open the local database, with either the "tinydb" or "sqlite" storage backend.
+
+    TinyDB writes are cached in memory and only written to `db.json` when the cache
+    fills up, or when the database is flushed or closed, so the caller must close the
+    database when it is done with it. The SQLite backend (see `sqlite_db`) writes to
+    `db.sqlite`, and commits every write as it is made.
+    """
+    if storage == "sqlite":
+        return SqliteDB(f"{local_storage_path}/{sqlite_db.DB_FILE}")
+    if storage != "tinydb":
+        raise Es8TableException(
+            f"Invalid storage backend {storage}, expected one of {STORAGE_BACKENDS}."
+        )
+    return TinyDB(
+        f"{local_storage_path}/db.json", storage=CachingMiddleware(JSONStorage)
+    )
+
+
+def flush(database):
+    """Write any writes that the database has cached to disk."""
+    if isinstance(database, TinyDB):
+        database.storage.flush()
+    else:
+        database.flush()
+
+
+def ingest_backup(
+    table: Table,
+    backup_filepath: str,
+    on_parse: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[list, int]:
+    """Insert every patch in the backup at `backup_filepath` into `table`.
+
+    The backup is streamed one patch at a time, calling `on_parse(patches, bytes)`
+    with the number of patches and bytes parsed so far, and the patches are then
+    inserted with a single `insert_multiple`, which TinyDB writes in one go (rather
+    than rewriting the whole database once per patch). Return the list of patch dicts
+    and the number of bytes ingested.
+    """
+    docs = []
+    parsed = 0
+    with bel.BelReader(backup_filepath) as reader:
+        for _, _, parsed, patch in reader.iter_raw():
+            docs.append(patch)
+            if on_parse is not None:
+                on_parse(len(docs), parsed)
+    table.insert_multiple(docs)
+    return docs, parsed
+
+
 class Es8Table:
     model_map = models.MODEL_MAP
 
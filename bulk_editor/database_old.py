@@ -1,4 +1,8 @@
+from dataclasses import fields
 import sqlite3
+from typing import Dict, Iterable, List, Tuple
+
+from . import data_models as dm
 
 DB_FILE = "es8_editor.db"
 
@@ -69,6 +73,15 @@ class Metadata(object):
 
 
 class AssignModel(object):
+    """In-memory table of the assigns of every patch, for auditing assign usage.
+    Columns are the fields of `data_models.Assign`, eg
+
+        model = AssignModel.from_patch_list(patch_list)
+        model.patch_ids(source="Num8", target="BPM: Tap")
+    """
+
+    COLUMNS = tuple(f.name for f in fields(dm.Assign))
+
     def __init__(self):
         self._db = sqlite3.connect(":memory:")
         self._db.row_factory = sqlite3.Row
@@ -82,8 +95,8 @@ class AssignModel(object):
                 target TEXT,
                 mode TEXT,
                 is_enabled INTEGER,
-                min INTEGER,
-                max INTEGER,
+                min_ INTEGER,
+                max_ INTEGER,
                 ActL INTEGER,
                 ActH INTEGER,
                 trigger INTEGER,
@@ -91,10 +104,74 @@ class AssignModel(object):
                 curve INTEGER,
                 rate INTEGER,
                 form INTEGER,
-                cc# INTEGER,
+                cc_num INTEGER,
                 target_cc_ch INTEGER,
-                target_cc# INTEGER
-                
+                target_cc_num INTEGER,
+                PRIMARY KEY (patch_id, assign_number)
             )
             """
         )
+        self._db.execute("CREATE INDEX assign_source ON assign(source, target)")
+        self._db.execute("CREATE INDEX assign_target ON assign(target)")
+        self._db.commit()
+
+    @classmethod
+    def from_patch_list(cls, patch_list: dm.PatchList) -> "AssignModel":
+        model = cls()
+        model.add_all(patch_list.assigns())
+        return model
+
+    def add_all(self, assigns: Iterable[dm.Assign]):
+        """Insert every assign in a single transaction."""
+        placeholders = ", ".join("?" * len(self.COLUMNS))
+        with self._db:
+            self._db.executemany(
+                f"INSERT INTO assign VALUES ({placeholders})",
+                (tuple(vars(assign).values()) for assign in assigns),
+            )
+
+    def _where(self, conditions: dict) -> Tuple[str, tuple]:
+        for column in conditions:
+            if column not in self.COLUMNS:
+                raise ValueError(f"{column} is not an assign column.")
+        if not conditions:
+            return "", ()
+        clause = " AND ".join(f"{column} = ?" for column in conditions)
+        return f"WHERE {clause}", tuple(conditions.values())
+
+    def search(self, **conditions) -> List[dm.Assign]:
+        """Return every assign matching all of `conditions`, eg
+        `search(source="Num8", is_enabled=1)`."""
+        where, params = self._where(conditions)
+        cursor = self._db.execute(
+            f"SELECT * FROM assign {where} ORDER BY patch_id, assign_number", params
+        )
+        return [dm.Assign(*row) for row in cursor]
+
+    def patch_ids(self, **conditions) -> List[int]:
+        """Return the index of every patch with an assign matching `conditions`."""
+        where, params = self._where(conditions)
+        cursor = self._db.execute(
+            f"SELECT DISTINCT patch_id FROM assign {where} ORDER BY patch_id", params
+        )
+        return [row[0] for row in cursor]
+
+    def count_by(self, *columns: str, **conditions) -> Dict[tuple, int]:
+        """Count the assigns matching `conditions` for each distinct value of
+        `columns`, eg `count_by("source", "target", is_enabled=1)`."""
+        if not columns:
+            raise ValueError("count_by needs at least one column.")
+        for column in columns:
+            if column not in self.COLUMNS:
+                raise ValueError(f"{column} is not an assign column.")
+        where, params = self._where(conditions)
+        group = ", ".join(columns)
+        cursor = self._db.execute(
+            f"SELECT {group}, count(*) FROM assign {where} GROUP BY {group} "
+            "ORDER BY count(*) DESC",
+            params,
+        )
+        return {tuple(row)[:-1]: row[-1] for row in cursor}
+
+    def close(self):
+        self._db.close()
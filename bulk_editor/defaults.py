@@ -10,10 +10,11 @@ def values(n, multiple) -> list:
     return [n] * multiple
 
 
-def local_storage() -> str:
+def local_storage(create: bool = True) -> str:
     home_dir = Path.home()
     local_storage = home_dir / ".es8"
-    local_storage.mkdir(parents=True, exist_ok=True)
+    if create:
+        local_storage.mkdir(parents=True, exist_ok=True)
     return str(local_storage)
 
 
@@ -0,0 +1,245 @@
+"""Versioned store of the global defaults, in `defaults.local_storage()`.
+
+Every change to the global defaults is appended to a journal as a sparse delta: one
+JSON line per version, holding the old and the new value of each cell that changed
+(see `mask.Mask`). Version 0 is the factory default patch, and version `n` is the
+factory default with the first `n` deltas applied. The journal is never rewritten,
+so a rollback is appended as a new version too.
+
+Folding the journal is avoided in three ways:
+
+* `head.json` caches the current state along with the journal offset it was folded
+  up to, so loading the current defaults reads the cache and only folds the
+  versions appended after it (none, unless the cache write was interrupted).
+* every `CHECKPOINT_EVERY` versions the full state is written to `checkpoints/`, so
+  loading any prior version folds at most that many deltas.
+* rolling back undoes the deltas after the target version, from the head, so it
+  costs the size of those deltas rather than a fold of the whole history.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+import json
+import os
+from typing import Iterator, List, Optional, Tuple
+
+from . import data_models as dm
+from . import defaults
+from .mask import Mask
+
+JOURNAL_FILE = "journal.jsonl"
+HEAD_FILE = "head.json"
+CHECKPOINT_DIR = "checkpoints"
+CHECKPOINT_EVERY = 64
+
+# folded current state per store path: (journal offset, version, patch).
+_HEADS = {}
+
+
+class DefaultsStoreError(dm.BulkEditorError):
+    pass
+
+
+@dataclass
+class Version:
+    number: int
+    time: str
+    message: str
+    # [field, index, old, new] for every cell changed by this version.
+    cells: list
+
+    def delta(self, undo: bool = False) -> Mask:
+        """Return the cells set by this version (or by undoing it) as a Mask."""
+        return Mask(
+            ((name, index), old if undo else new)
+            for name, index, old, new in self.cells
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "version": self.number,
+                "time": self.time,
+                "message": self.message,
+                "cells": self.cells,
+            },
+            separators=(",", ":"),
+        )
+
+
+def store_path() -> str:
+    """Return the default location of the store, without creating it."""
+    return os.path.join(defaults.local_storage(create=False), "defaults")
+
+
+class DefaultsStore:
+    """Append-only journal of the global defaults at `path` (by default
+    `store_path()`). Nothing is written until the first `commit`."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = store_path() if path is None else path
+        self.journal = os.path.join(self.path, JOURNAL_FILE)
+
+    def _size(self) -> int:
+        try:
+            return os.path.getsize(self.journal)
+        except FileNotFoundError:
+            return 0
+
+    def _read(self, offset: int) -> Iterator[Tuple[Version, int]]:
+        """Yield every complete journal entry from `offset`, along with the offset
+        just after it. A trailing entry cut short by an interrupted write is
+        skipped, and overwritten by the next commit."""
+        if offset >= self._size():
+            return
+        with open(self.journal, "rb") as infile:
+            infile.seek(offset)
+            for line in infile:
+                if not line.endswith(b"\n"):
+                    return
+                offset += len(line)
+                entry = json.loads(line)
+                yield Version(
+                    entry["version"], entry["time"], entry["message"], entry["cells"]
+                ), offset
+
+    def _load(self, name: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.path, name), "r") as infile:
+                return json.load(infile)
+        except FileNotFoundError:
+            return None
+
+    def _save(self, name: str, offset: int, version: int, patch: dm.Patch):
+        """Write a cached state atomically, so that a reader never sees half of
+        it."""
+        path = os.path.join(self.path, name)
+        with open(f"{path}.tmp", "w") as outfile:
+            json.dump(
+                {"offset": offset, "version": version, "patch": patch.to_dict()},
+                outfile,
+            )
+        os.replace(f"{path}.tmp", path)
+
+    def _head(self) -> Tuple[int, int, dm.Patch]:
+        """Return the journal offset, version and patch of the current state."""
+        size = self._size()
+        head = _HEADS.get(self.path)
+        if head is None or head[0] > size:
+            cached = self._load(HEAD_FILE)
+            if cached is None or cached["offset"] > size:
+                head = (0, 0, dm.DEFAULT_PATCH)
+            else:
+                head = (
+                    cached["offset"],
+                    cached["version"],
+                    dm.Patch.from_dict(cached["patch"]),
+                )
+        offset, number, patch = head
+        if offset < size:
+            values = patch.to_dict()
+            for version, offset in self._read(offset):
+                values = version.delta().apply(values)
+                number = version.number
+            patch = dm.Patch.from_dict(values)
+        _HEADS[self.path] = head = (offset, number, patch)
+        return head
+
+    @property
+    def version(self) -> int:
+        """Return the current version number."""
+        return self._head()[1]
+
+    def current(self) -> dm.Patch:
+        """Return the current global defaults."""
+        return self._head()[2]
+
+    def log(self) -> List[Version]:
+        """Return every version in the journal, oldest first."""
+        return [version for version, _ in self._read(0)]
+
+    def _checkpoint(self, number: int) -> Tuple[int, int, dm.Patch]:
+        """Return the offset, version and patch of the latest checkpoint at or before
+        version `number`."""
+        for at in range(number - number % CHECKPOINT_EVERY, 0, -CHECKPOINT_EVERY):
+            cached = self._load(os.path.join(CHECKPOINT_DIR, f"{at}.json"))
+            if cached is not None:
+                return (
+                    cached["offset"],
+                    cached["version"],
+                    dm.Patch.from_dict(cached["patch"]),
+                )
+        return 0, 0, dm.DEFAULT_PATCH
+
+    def _check(self, number: int, head: int):
+        if not 0 <= number <= head:
+            raise DefaultsStoreError(f"Invalid version {number}, expected 0-{head}.")
+
+    def get(self, number: int) -> dm.Patch:
+        """Return the global defaults as of version `number`."""
+        _, head, patch = self._head()
+        self._check(number, head)
+        if number == head:
+            return patch
+        offset, at, patch = self._checkpoint(number)
+        if at == number:
+            return patch
+        values = patch.to_dict()
+        for version, _ in self._read(offset):
+            values = version.delta().apply(values)
+            if version.number == number:
+                break
+        return dm.Patch.from_dict(values)
+
+    def commit(self, patch, message: str = "") -> int:
+        """Append the change from the current global defaults to `patch` (a Patch
+        instance or dict) as a new version, returning the new version number. If
+        nothing changed, no version is added and the current number is returned."""
+        offset, number, current = self._head()
+        values = current.to_dict()
+        delta = Mask.diff(current, patch)
+        if not delta:
+            return number
+        cells = [
+            [name, index, values[name] if index is None else values[name][index], new]
+            for (name, index), new in delta.items()
+        ]
+        version = Version(number + 1, datetime.now().isoformat(), message, cells)
+        os.makedirs(os.path.join(self.path, CHECKPOINT_DIR), exist_ok=True)
+        with open(self.journal, "ab") as outfile:
+            # drop an entry cut short by an interrupted write.
+            outfile.truncate(offset)
+            outfile.write(f"{version.to_json()}\n".encode())
+            offset = outfile.tell()
+        new = dm.Patch.from_dict(delta.apply(values))
+        _HEADS[self.path] = (offset, version.number, new)
+        self._save(HEAD_FILE, offset, version.number, new)
+        if version.number % CHECKPOINT_EVERY == 0:
+            self._save(
+                os.path.join(CHECKPOINT_DIR, f"{version.number}.json"),
+                offset,
+                version.number,
+                new,
+            )
+        return version.number
+
+    def rollback(self, number: int, message: Optional[str] = None) -> dm.Patch:
+        """Return the global defaults to version `number`, by appending a version
+        that undoes every version after it. Returns the restored defaults."""
+        _, head, current = self._head()
+        self._check(number, head)
+        if number == head:
+            return current
+        # the versions to undo start within a checkpoint interval of `number`.
+        offset = self._checkpoint(number)[0]
+        undone = [
+            version for version, _ in self._read(offset) if version.number > number
+        ]
+        undo = Mask()
+        for version in reversed(undone):
+            undo.update(version.delta(undo=True))
+        self.commit(
+            undo.apply(current.to_dict()),
+            f"rollback to version {number}" if message is None else message,
+        )
+        return self.current()
@@ -0,0 +1,222 @@
+"""Content-addressed history of backup files, in `defaults.local_storage()`.
+
+Each patch is stored once as an object named by the hash of its encoded bytes, so a
+patch that is the same in many backups (or many times in one backup) takes the
+space of one. Everything in a backup outside the patch array's patches (the header,
+the `system` section and the separators between patches) is stored as one more
+object, the skeleton. A version of a backup is then a manifest: the hash of the
+skeleton and the hashes of the 800 patches, in order.
+
+The patch spans come from `bel.load_index`, so recording a backup hashes its bytes
+without decoding any JSON, and checking a version out splices the stored bytes back
+together into a copy identical to the recorded backup. Queries about a patch across
+versions, and diffs between versions, only read manifests, and only decode the
+patches they return.
+
+    objects/<2 hex>/<hash>   encoded patch (or skeleton) bytes
+    manifests/<n>.json       version n
+"""
+
+from dataclasses import asdict, dataclass
+from datetime import datetime
+import hashlib
+import json
+import mmap
+import os
+from typing import Dict, List, Optional, Tuple
+
+from . import data_models as dm
+from . import defaults, mappings
+from .bel import load_index
+from .mask import Mask
+
+OBJECT_DIR = "objects"
+MANIFEST_DIR = "manifests"
+
+
+class HistoryError(dm.BulkEditorError):
+    pass
+
+
+def object_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+@dataclass
+class Manifest:
+    version: int
+    time: str
+    source: str
+    message: str
+    skeleton: str
+    # hash of each patch, by patch index.
+    patches: List[str]
+
+
+@dataclass
+class VersionDiff:
+    old: int
+    new: int
+    # {patch index: (old hash, new hash)} for every patch that differs.
+    patches: Dict[int, Tuple[str, str]]
+    # whether anything outside the patches (eg the system section) differs.
+    skeleton: bool
+
+    @property
+    def coords(self) -> List[dm.PatchCoords]:
+        return [
+            dm.PatchCoords(*mappings.index_to_patch(index)) for index in self.patches
+        ]
+
+
+def history_path() -> str:
+    """Return the default location of the history, without creating it."""
+    return os.path.join(defaults.local_storage(create=False), "history")
+
+
+class History:
+    """History of backup files at `path` (by default `history_path()`)."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = history_path() if path is None else path
+        self._manifests = {}
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.path, OBJECT_DIR, digest[:2], digest)
+
+    def _write_object(self, data: bytes) -> str:
+        digest = object_hash(data)
+        path = self._object_path(digest)
+        if not os.path.isfile(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.tmp", "wb") as outfile:
+                outfile.write(data)
+            os.replace(f"{path}.tmp", path)
+        return digest
+
+    def read_object(self, digest: str) -> bytes:
+        try:
+            with open(self._object_path(digest), "rb") as infile:
+                return infile.read()
+        except FileNotFoundError:
+            raise HistoryError(f"Object {digest} is missing from {self.path}.")
+
+    def _manifest_path(self, version: int) -> str:
+        return os.path.join(self.path, MANIFEST_DIR, f"{version}.json")
+
+    @property
+    def head(self) -> int:
+        """Return the latest version number (0 if nothing has been recorded)."""
+        try:
+            names = os.listdir(os.path.join(self.path, MANIFEST_DIR))
+        except FileNotFoundError:
+            return 0
+        return max(
+            (int(name[:-5]) for name in names if name.endswith(".json")), default=0
+        )
+
+    def manifest(self, version: int) -> Manifest:
+        """Return the manifest of `version`. Negative versions count back from the
+        latest, so -1 is the latest version and -3 is two before it."""
+        head = self.head
+        if version < 0:
+            version += head + 1
+        if not 1 <= version <= head:
+            raise HistoryError(f"Invalid version {version}, expected 1-{head}.")
+        return self._load(version)
+
+    def _load(self, version: int) -> Manifest:
+        if version not in self._manifests:
+            with open(self._manifest_path(version), "r") as infile:
+                self._manifests[version] = Manifest(**json.load(infile))
+        return self._manifests[version]
+
+    def manifests(self) -> List[Manifest]:
+        """Return the manifest of every version, oldest first."""
+        return [self._load(version) for version in range(1, self.head + 1)]
+
+    def commit(self, path: str, message: str = "") -> int:
+        """Record the backup at `path` as a new version, returning its number. If the
+        backup is the same as the latest version, nothing is recorded and the latest
+        version number is returned."""
+        spans = load_index(path)
+        with open(path, "rb") as infile:
+            with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                patches = [self._write_object(data[start:end]) for start, end in spans]
+                # the skeleton holds everything between the patches, latin-1 decoded
+                # so that it round trips through JSON byte for byte.
+                bounds = [0, *(offset for span in spans for offset in span), None]
+                gaps = [
+                    data[start:end].decode("latin-1")
+                    for start, end in zip(bounds[::2], bounds[1::2])
+                ]
+        skeleton = self._write_object(json.dumps(gaps).encode())
+        head = self.head
+        if head:
+            latest = self._load(head)
+            if latest.skeleton == skeleton and latest.patches == patches:
+                return head
+        manifest = Manifest(
+            head + 1,
+            datetime.now().isoformat(),
+            os.path.abspath(path),
+            message,
+            skeleton,
+            patches,
+        )
+        os.makedirs(os.path.join(self.path, MANIFEST_DIR), exist_ok=True)
+        # `x` mode, so that a concurrent commit of the same version number fails
+        # rather than overwriting it.
+        with open(self._manifest_path(manifest.version), "x") as outfile:
+            json.dump(asdict(manifest), outfile)
+        self._manifests[manifest.version] = manifest
+        return manifest.version
+
+    def checkout(self, version: int, output: str):
+        """Write `version` to the backup file at `output`, identical to the backup
+        that was recorded."""
+        manifest = self.manifest(version)
+        gaps = json.loads(self.read_object(manifest.skeleton))
+        with open(output, "wb") as outfile:
+            for gap, digest in zip(gaps, manifest.patches):
+                outfile.write(gap.encode("latin-1"))
+                outfile.write(self.read_object(digest))
+            outfile.write(gaps[-1].encode("latin-1"))
+
+    def patch_at(self, version: int, bank: int, patch: int) -> dm.Patch:
+        """Return the patch at `bank:patch` as of `version`."""
+        index = mappings.patch_to_index(bank, patch)
+        digest = self.manifest(version).patches[index]
+        return dm.Patch.from_dict(json.loads(self.read_object(digest)))
+
+    def patch_history(self, bank: int, patch: int) -> List[Tuple[int, str]]:
+        """Return `(version, hash)` for every version that changed the patch at
+        `bank:patch`, starting with the first version that recorded it."""
+        index = mappings.patch_to_index(bank, patch)
+        changes = []
+        for manifest in self.manifests():
+            digest = manifest.patches[index]
+            if not changes or changes[-1][1] != digest:
+                changes.append((manifest.version, digest))
+        return changes
+
+    def diff(self, old: int, new: int) -> VersionDiff:
+        """Return the patches that differ between versions `old` and `new`."""
+        a, b = self.manifest(old), self.manifest(new)
+        return VersionDiff(
+            a.version,
+            b.version,
+            {
+                index: (x, y)
+                for index, (x, y) in enumerate(zip(a.patches, b.patches))
+                if x != y
+            },
+            a.skeleton != b.skeleton,
+        )
+
+    def diff_patch(self, old: int, new: int, bank: int, patch: int) -> Mask:
+        """Return the cells of the patch at `bank:patch` that changed between
+        versions `old` and `new`, with their value in `new`."""
+        return Mask.diff(
+            self.patch_at(old, bank, patch), self.patch_at(new, bank, patch)
+        )
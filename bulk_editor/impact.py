@@ -0,0 +1,196 @@
+"""Dry runs: report what a list of actions would do to a backup, without writing it.
+
+`dry_run` runs the actions (see `jobs`) against a backup exactly as an edit would,
+then compares the resulting patches with the original ones. Nothing is serialized:
+only the patches that changed are diffed, cell by cell, into an `ImpactReport`.
+
+Besides the cells that change, the report flags the patches that have an individual
+assign that the change overrides. A patch has an individual assign when the assign
+is switched on and differs from the global default the patches were based on before
+the change. The edit only changes cells that still hold the default value, so an
+individual assign keeps its customized cells, but any of its other cells that the
+change touches are overwritten, which mixes the two assigns.
+
+The report can be printed as a rich table (`print_report`), or written as JSON
+(`ImpactReport.to_dict`).
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from . import data_models as dm
+from . import jobs, mappings
+from .bel import BelReader, changed_patches
+from .mask import Mask
+
+
+def cell_name(name: str, index: Optional[int]) -> str:
+    return name if index is None else f"{name}[{index}]"
+
+
+def _cells(old: dict, new) -> list:
+    """Return `[field, index, old, new]` for every cell that differs."""
+    return [
+        [name, index, old[name] if index is None else old[name][index], value]
+        for (name, index), value in Mask.diff(old, new).items()
+    ]
+
+
+def individual_assigns(patch: dict, default: dict) -> List[int]:
+    """Return the number of every assign of `patch` that is switched on and differs
+    from the assign of the same number in `default`."""
+    switches = patch["ID_PATCH_ASSIGN_SW"]
+    return [
+        i + 1
+        for i in range(len(switches))
+        if switches[i]
+        and any(patch[name][i] != default[name][i] for name in dm.ASSIGN_FIELDS)
+    ]
+
+
+@dataclass
+class PatchImpact:
+    slot: int
+    # [field, index, old, new] for every cell that changes.
+    cells: list
+    # individual assigns (see `individual_assigns`) that the change overrides.
+    overridden: List[int] = field(default_factory=list)
+
+    @property
+    def coords(self) -> str:
+        return "{}:{}".format(*mappings.index_to_patch(self.slot))
+
+    def to_dict(self) -> dict:
+        return {
+            "patch": self.coords,
+            "cells": self.cells,
+            "overridden": self.overridden,
+        }
+
+
+@dataclass
+class ImpactReport:
+    total: int
+    # [field, index, old, new] for every cell of the global default that changes.
+    defaults: list
+    patches: List[PatchImpact] = field(default_factory=list)
+
+    @property
+    def overridden(self) -> List[PatchImpact]:
+        return [patch for patch in self.patches if patch.overridden]
+
+    def cell_counts(self) -> Dict[str, int]:
+        """Return the number of patches changed in each cell."""
+        counts = Counter(
+            cell_name(name, index)
+            for patch in self.patches
+            for name, index, *_ in patch.cells
+        )
+        return dict(counts.most_common())
+
+    def banks(self) -> Dict[int, Dict[str, int]]:
+        """Return the number of changed and overridden patches in each bank that
+        changes."""
+        banks = {}
+        for patch in self.patches:
+            bank, _ = mappings.index_to_patch(patch.slot)
+            counts = banks.setdefault(bank, {"changed": 0, "overridden": 0})
+            counts["changed"] += 1
+            counts["overridden"] += bool(patch.overridden)
+        return banks
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "changed": len(self.patches),
+            "overridden": len(self.overridden),
+            "defaults": self.defaults,
+            "cells": self.cell_counts(),
+            "banks": {str(bank): counts for bank, counts in self.banks().items()},
+            "patches": [patch.to_dict() for patch in self.patches],
+        }
+
+
+def compare(
+    old: Iterable[dict], new: Iterable[dict], old_default, new_default
+) -> ImpactReport:
+    """Return the impact of changing the patches `old` to `new` (patch dicts), and
+    the global default from `old_default` to `new_default`."""
+    old = list(old)
+    default = dm._as_dict(old_default)
+    report = ImpactReport(len(old), _cells(default, new_default))
+    for slot, patch in changed_patches(old, new).items():
+        cells = _cells(old[slot], patch)
+        assigns = {index + 1 for name, index, *_ in cells if name in dm.ASSIGN_FIELDS}
+        overridden = [n for n in individual_assigns(old[slot], default) if n in assigns]
+        report.patches.append(PatchImpact(slot, cells, overridden))
+    return report
+
+
+def dry_run(
+    path: str,
+    steps: list,
+    backend: str = "patch",
+    default: Optional[dm.Patch] = None,
+) -> ImpactReport:
+    """Run the actions in `steps` against the backup at `path` as `batch.edit_file`
+    would, and return their impact without writing anything.
+
+    `default` is the global default the patches are based on (by default, the
+    factory default patch).
+    """
+    with BelReader(path) as reader:
+        original_patches = [patch for *_, patch in reader.iter_raw()]
+    old_default = dm.DEFAULT_PATCH if default is None else default
+    patch_list = dm.PatchList(
+        patches=iter(original_patches) if backend == "stream" else original_patches,
+        backend=backend,
+        states=[old_default],
+    )
+    _, new_default = jobs.run_job(patch_list, steps)
+    return compare(original_patches, patch_list.iter_dicts(), old_default, new_default)
+
+
+def print_report(report: ImpactReport, console=None, limit: int = 20):
+    """Print a summary of `report` as rich tables: the number of patches changed in
+    each cell and in each bank, and up to `limit` patches with overridden individual
+    assigns."""
+    from rich.console import Console
+    from rich.table import Table
+
+    console = Console() if console is None else console
+    console.print(
+        f"{len(report.patches)}/{report.total} patches change, "
+        f"{len(report.overridden)} with an overridden individual assign."
+    )
+    if report.defaults:
+        table = Table(title="Global default")
+        for column in ["Cell", "Old", "New"]:
+            table.add_column(column)
+        for name, index, old, new in report.defaults:
+            table.add_row(cell_name(name, index), str(old), str(new))
+        console.print(table)
+    if not report.patches:
+        return
+    table = Table(title="Cells")
+    table.add_column("Cell")
+    table.add_column("Patches", justify="right")
+    for cell, count in report.cell_counts().items():
+        table.add_row(cell, str(count))
+    console.print(table)
+    table = Table(title="Banks")
+    for column in ["Bank", "Changed", "Overridden"]:
+        table.add_column(column, justify="right")
+    for bank, counts in report.banks().items():
+        table.add_row(str(bank), str(counts["changed"]), str(counts["overridden"]))
+    console.print(table)
+    if report.overridden:
+        table = Table(title="Overridden individual assigns")
+        table.add_column("Patch")
+        table.add_column("Assigns")
+        for patch in report.overridden[:limit]:
+            table.add_row(patch.coords, ", ".join(map(str, patch.overridden)))
+        if len(report.overridden) > limit:
+            table.caption = f"and {len(report.overridden) - limit} more"
+        console.print(table)
@@ -0,0 +1,131 @@
+"""Inverted index over the cell values of a patch list.
+
+`InvertedIndex` maps every `(field, index)` cell of a patch (`index` being None for
+scalar fields, as with `mask.Mask`) and every value in that cell to a bitmap of the
+patches that hold that value, where bit `i` is set for the patch in slot `i`. The
+bitmaps are plain python ints, so a lookup is a couple of dict lookups, and queries
+combine selections with `&`, `|` and `~` at the cost of a single integer operation.
+
+Applying a `mask.Edit` to the index moves every patch holding one of the sources of
+a cell onto its target in a handful of integer operations per cell, so the index can
+be kept up to date as defaults are applied, without rebuilding it.
+"""
+
+from typing import Dict, Iterator, Optional, Sequence
+
+
+class Selection:
+    """Set of patch slots, stored as a bitmap."""
+
+    __slots__ = ("bits", "size")
+
+    def __init__(self, bits: int, size: int):
+        self.bits = bits
+        self.size = size  # number of patches in the list, for ~
+
+    def __and__(self, other: "Selection") -> "Selection":
+        return Selection(self.bits & other.bits, self.size)
+
+    def __or__(self, other: "Selection") -> "Selection":
+        return Selection(self.bits | other.bits, self.size)
+
+    def __sub__(self, other: "Selection") -> "Selection":
+        return Selection(self.bits & ~other.bits, self.size)
+
+    def __invert__(self) -> "Selection":
+        return Selection(~self.bits & ((1 << self.size) - 1), self.size)
+
+    def __eq__(self, other):
+        if not isinstance(other, Selection):
+            return NotImplemented
+        return self.bits == other.bits
+
+    def __bool__(self):
+        return bool(self.bits)
+
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def __contains__(self, slot: int):
+        return bool(self.bits >> slot & 1)
+
+    def __iter__(self) -> Iterator[int]:
+        """Yield the slot index of every patch in the selection, in order."""
+        bits = self.bits
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+    def __repr__(self):
+        return f"Selection({list(self)})"
+
+
+class InvertedIndex:
+    """Map of `(field, index) -> {value: bitmap of patch slots}`."""
+
+    def __init__(self, cells: Dict[tuple, Dict[object, int]], size: int):
+        self.cells = cells
+        self.size = size
+
+    @classmethod
+    def from_matrix(cls, matrix) -> "InvertedIndex":
+        """Build the index from the columns of a `matrix.PatchMatrix`."""
+        from .matrix import COLUMNS
+
+        size = len(matrix)
+        full = (1 << size) - 1
+        cells = {}
+        for column, values in zip(COLUMNS, matrix.columns):
+            first = values[0] if values else None
+            if values.count(first) == size:
+                # most columns hold the same value in every patch.
+                bitmaps = {first: full} if size else {}
+            else:
+                bitmaps = {}
+                for slot, value in enumerate(values):
+                    bitmaps[value] = bitmaps.get(value, 0) | 1 << slot
+            cells[(column.field, column.index)] = bitmaps
+        return cls(cells, size)
+
+    @classmethod
+    def from_patches(cls, patches: Sequence) -> "InvertedIndex":
+        """Build the index from a list of patch dicts (or Patch instances)."""
+        from .matrix import PatchMatrix
+
+        return cls.from_matrix(PatchMatrix.from_patches(patches))
+
+    def all(self) -> Selection:
+        return Selection((1 << self.size) - 1, self.size)
+
+    def where(self, field: str, value, index: Optional[int] = None) -> Selection:
+        """Return the patches where `field` (or `field[index]`) is `value`."""
+        return Selection(self.cells[(field, index)].get(value, 0), self.size)
+
+    def values(self, field: str, index: Optional[int] = None) -> set:
+        """Return every value held by `field` (or `field[index]`) across patches."""
+        return set(self.cells[(field, index)])
+
+    def apply_edit(self, edit):
+        """Update the index for `edit` (a `mask.Edit`) being applied to every patch."""
+        for cell, (sources, target) in edit.items():
+            bitmaps = self.cells[cell]
+            moved = 0
+            for source in sources:
+                moved |= bitmaps.pop(source, 0)
+            if moved:
+                bitmaps[target] = bitmaps.get(target, 0) | moved
+
+    def assign(self, field: str, index: Optional[int], value, selection: Selection):
+        """Update the index for `field[index]` being set to `value` in the patches in
+        `selection`."""
+        if not selection:
+            return
+        bitmaps = self.cells[(field, index)]
+        for other in list(bitmaps):
+            bits = bitmaps[other] & ~selection.bits
+            if bits:
+                bitmaps[other] = bits
+            else:
+                del bitmaps[other]
+        bitmaps[value] = bitmaps.get(value, 0) | selection.bits
@@ -0,0 +1,94 @@
+"""Job files, which run several actions against a backup in a single pass.
+
+A job file lists actions from `actions.VALID_ACTIONS` in the order they should be
+run, with the same arguments as the command line. It can be written as JSON:
+
+    {"actions": [
+        {"action": "set_assign", "assign_number": 1, "source": "Num8",
+         "mode": "MOM", "target": "BPM: Tap"},
+        {"action": "set_default_patch", "coords": "1:1"},
+        {"action": "swap_loops", "loops": [7, 6], "wipe": true}
+    ]}
+
+or as TOML, with one `[[actions]]` table per action. `params` can either be given
+inline or as the path to a params file, relative to the job file (as is the `base`
+template of `merge_template`).
+
+The actions run inside a PatchList transaction, so they only update the default
+state, and the patches are updated once when the transaction is committed. A job
+costs a single apply no matter how many actions it contains, with the same result
+as running the actions one after the other. `swap_loops`, `reorder_chain` and
+`merge_template` rewrite the patches themselves rather than the default state, so
+each of them commits the changes before it and costs a pass of its own.
+"""
+
+import argparse
+import json
+import os
+from typing import List
+
+from . import actions
+from . import data_models as dm
+
+try:
+    import tomllib
+except ImportError:  # python < 3.11
+    tomllib = None
+
+ACTION_DEFAULTS = {
+    "mode": "TGL",
+    "params": {},
+    "force": False,
+    "wipe": False,
+    "before": False,
+    "strategy": "ours",
+    "threshold": None,
+}
+
+
+class JobError(dm.BulkEditorError):
+    pass
+
+
+def load_job(path: str) -> List[argparse.Namespace]:
+    """Read the job file at `path`, returning one argparse Namespace per action."""
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise JobError("TOML job files require python 3.11 or later.")
+        with open(path, "rb") as infile:
+            job = tomllib.load(infile)
+    else:
+        with open(path, "r") as infile:
+            job = json.load(infile)
+    steps = job.get("actions") if isinstance(job, dict) else job
+    if not isinstance(steps, list) or not steps:
+        raise JobError(f"{path} does not contain a list of actions.")
+    return [_parse_step(step, os.path.dirname(path)) for step in steps]
+
+
+def _parse_step(step: dict, root: str) -> argparse.Namespace:
+    action = step.get("action")
+    if action not in actions.VALID_ACTIONS:
+        raise JobError(
+            f"Invalid action {action!r}, "
+            f"expected one of {', '.join(actions.VALID_ACTIONS)}."
+        )
+    args = argparse.Namespace(**{**ACTION_DEFAULTS, **step})
+    if isinstance(args.params, str):
+        with open(os.path.join(root, args.params), "r") as paramfile:
+            args.params = json.load(paramfile)
+    if getattr(args, "base", None) is not None:
+        args.base = os.path.join(root, args.base)
+    return args
+
+
+def run_job(patch_list: dm.PatchList, steps: List[argparse.Namespace]):
+    """Run every action in `steps` against `patch_list` in a single transaction, so
+    that the patches are only updated once.
+
+    Returns the same `(patches, latest_default_state)` tuple as a single action.
+    """
+    with patch_list.transaction():
+        for args in steps:
+            actions.VALID_ACTIONS[args.action](patch_list, args, apply=False)
+    return patch_list.patches, patch_list.latest_default_state
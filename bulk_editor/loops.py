@@ -0,0 +1,294 @@
+"""Rewire the loops of every patch in a backup.
+
+Loops are numbered 1-8, with 9 for the volume loop. They are stored per loop in
+`ID_PATCH_LOOP_SW_LOOP` and `ID_PATCH_CARRY_OVER_LOOP` (index `n - 1` for loop `n`),
+assigns refer to them by target (`LOOP: L1` to `LOOP: L8` in
+`ID_PATCH_ASSIGN_TARGET`), and the signal chain lists them in order by element (see
+`ID_PATCH_LOOP_POSITION`).
+
+A `LoopSwap` is a single permutation of the loops, and a `ChainMove` moves one loop
+relative to another in the signal chain. Both have the same `changes`/`apply`
+interface as `mask.Edit`, so they can be applied by `PatchList` with any backend,
+and with the matrix backend they only rewrite the columns they affect (swapping two
+loops swaps their columns outright).
+"""
+
+from typing import List, Optional
+
+from . import mappings
+from .data_models import BulkEditorError
+
+LOOP_COUNT = 8
+VOLUME_LOOP = 9
+# fields holding one value per loop, indexed by loop number - 1.
+LOOP_FIELDS = ("ID_PATCH_LOOP_SW_LOOP", "ID_PATCH_CARRY_OVER_LOOP")
+# the signal chain is the first 13 entries of ID_PATCH_LOOP_POSITION, holding the
+# element at each step of the chain: every loop exactly once, along with element 9
+# and 3 of the elements 10-15.
+CHAIN_LENGTH = 13
+LOOP_ELEMENTS = frozenset(range(LOOP_COUNT + 1))
+
+
+def loop_target(loop: int) -> int:
+    """Return the ID_PATCH_ASSIGN_TARGET value of `LOOP: L<loop>`."""
+    return mappings.PATCH_ASSIGN_TARGET_ORDER.index(f"LOOP: L{loop}")
+
+
+def loop_element(loop: int) -> int:
+    """Return the ID_PATCH_LOOP_POSITION element of a loop (0 for the volume loop)."""
+    return 0 if loop == VOLUME_LOOP else loop
+
+
+def is_valid_chain(chain) -> bool:
+    """Return True if every loop is in `chain` exactly once."""
+    loops = [element for element in chain if element in LOOP_ELEMENTS]
+    return len(loops) == len(LOOP_ELEMENTS) and set(loops) == LOOP_ELEMENTS
+
+
+def _getter(patch):
+    return patch.__getitem__ if isinstance(patch, dict) else patch.__getattribute__
+
+
+class _Rewire:
+    """Base class for changes to the loops of every patch."""
+
+    def changes(self, patch) -> dict:
+        """Return `{field: value}` for every field of `patch` (a Patch instance or
+        dict) that this change changes. Lists are copied before they are changed."""
+        raise NotImplementedError
+
+    def apply(self, patch) -> dict:
+        """Return a patch dictionary with this change applied to `patch`, sharing
+        every field that did not change."""
+        values = patch if isinstance(patch, dict) else patch.to_dict()
+        changes = self.changes(values)
+        return {**values, **changes} if changes else values
+
+    def apply_matrix(self, matrix):
+        """Apply this change to every patch in a `matrix.PatchMatrix`."""
+        raise NotImplementedError
+
+
+class LoopSwap(_Rewire):
+    """Swap `loop` and `other` (1-8) in every patch.
+
+    With `wipe`, the settings of `loop` are moved to `other` and the settings that
+    were in `other` are wiped: `loop` is left switched off, without carry over, and
+    assigns that targeted `other` are disabled. EG after moving a pedal from loop 7
+    to loop 6 and removing the pedal that was in loop 6,
+    `LoopSwap(7, 6, wipe=True)`. The chain is swapped either way, so that it still
+    holds every loop.
+    """
+
+    def __init__(self, loop: int, other: int, wipe: bool = False):
+        for n in (loop, other):
+            if not 1 <= n <= LOOP_COUNT:
+                raise BulkEditorError(f"Invalid loop {n}, expected 1-{LOOP_COUNT}.")
+        if loop == other:
+            raise BulkEditorError("Can not swap a loop with itself.")
+        self.loop = loop
+        self.other = other
+        self.wipe = wipe
+        self.targets = {
+            loop_target(loop): loop_target(other),
+            loop_target(other): loop_target(loop),
+        }
+        self.elements = {
+            loop_element(loop): loop_element(other),
+            loop_element(other): loop_element(loop),
+        }
+        # after the swap, `loop` holds whatever was in `other`.
+        self.wiped_target: Optional[int] = loop_target(loop) if wipe else None
+
+    def __repr__(self):
+        return f"LoopSwap({self.loop}, {self.other}, wipe={self.wipe})"
+
+    def changes(self, patch) -> dict:
+        get = _getter(patch)
+        a, b = self.loop - 1, self.other - 1
+        changed = {}
+        for name in LOOP_FIELDS:
+            value = get(name)
+            new = list(value)
+            new[a], new[b] = value[b], value[a]
+            if self.wipe:
+                new[a] = 0
+            if new != value:
+                changed[name] = new
+        positions = get("ID_PATCH_LOOP_POSITION")
+        new_positions = [
+            self.elements.get(element, element) for element in positions[:CHAIN_LENGTH]
+        ] + positions[CHAIN_LENGTH:]
+        if new_positions != positions:
+            changed["ID_PATCH_LOOP_POSITION"] = new_positions
+        targets = get("ID_PATCH_ASSIGN_TARGET")
+        new_targets = [self.targets.get(target, target) for target in targets]
+        if new_targets != targets:
+            changed["ID_PATCH_ASSIGN_TARGET"] = new_targets
+        if self.wipe and self.wiped_target in new_targets:
+            switches = get("ID_PATCH_ASSIGN_SW")
+            new_switches = [
+                0 if target == self.wiped_target else switch
+                for switch, target in zip(switches, new_targets)
+            ]
+            if new_switches != switches:
+                changed["ID_PATCH_ASSIGN_SW"] = new_switches
+        return changed
+
+    def apply_matrix(self, matrix):
+        """Apply this swap to every patch in a `matrix.PatchMatrix`, swapping the loop
+        columns and only rewriting the chain and assign columns that hold either
+        loop."""
+        from .matrix import FIELD_SLICES, PatchMatrix
+
+        a, b = self.loop - 1, self.other - 1
+        columns = list(matrix.columns)
+        size = len(matrix)
+        for name in LOOP_FIELDS:
+            start = FIELD_SLICES[name].start
+            columns[start + a], columns[start + b] = (
+                columns[start + b],
+                columns[start + a],
+            )
+            if self.wipe:
+                columns[start + a] = [0] * size
+        start = FIELD_SLICES["ID_PATCH_LOOP_POSITION"].start
+        for c in range(start, start + CHAIN_LENGTH):
+            if any(element in self.elements for element in columns[c]):
+                columns[c] = [
+                    self.elements.get(element, element) for element in columns[c]
+                ]
+        targets = FIELD_SLICES["ID_PATCH_ASSIGN_TARGET"]
+        switches = FIELD_SLICES["ID_PATCH_ASSIGN_SW"]
+        for t, s in zip(
+            range(targets.start, targets.stop), range(switches.start, switches.stop)
+        ):
+            column = columns[t]
+            if not any(target in self.targets for target in column):
+                continue
+            column = columns[t] = [
+                self.targets.get(target, target) for target in column
+            ]
+            if self.wipe and self.wiped_target in column:
+                columns[s] = [
+                    0 if target == self.wiped_target else switch
+                    for switch, target in zip(columns[s], column)
+                ]
+        return PatchMatrix(columns)
+
+
+class ChainMove(_Rewire):
+    """Move `loop` directly after (or before) `anchor` in the signal chain of every
+    patch that uses both loops (or of every patch, with `used_only=False`). Loops
+    are numbered 1-8, and 9 is the volume loop.
+
+    A chain that does not hold every loop exactly once can not be reordered, so
+    those patches are left untouched and reported by `rejected`.
+
+    Backups hold a handful of distinct chains, so each distinct chain is only
+    reordered once.
+    """
+
+    def __init__(
+        self, loop: int, anchor: int, after: bool = True, used_only: bool = True
+    ):
+        for n in (loop, anchor):
+            if not 1 <= n <= VOLUME_LOOP:
+                raise BulkEditorError(f"Invalid loop {n}, expected 1-{VOLUME_LOOP}.")
+        if loop == anchor:
+            raise BulkEditorError("Can not move a loop relative to itself.")
+        self.loop = loop
+        self.anchor = anchor
+        self.after = after
+        self.used_only = used_only
+        self._reordered = {}
+
+    def __repr__(self):
+        return (
+            f"ChainMove({self.loop}, {self.anchor}, after={self.after}, "
+            f"used_only={self.used_only})"
+        )
+
+    def reorder(self, chain: tuple) -> Optional[tuple]:
+        """Return `chain` with the move applied, or None if it is not a valid
+        chain."""
+        if chain not in self._reordered:
+            reordered = None
+            if is_valid_chain(chain):
+                moved = list(chain)
+                moved.remove(loop_element(self.loop))
+                at = moved.index(loop_element(self.anchor)) + self.after
+                moved.insert(at, loop_element(self.loop))
+                if is_valid_chain(moved):
+                    reordered = tuple(moved)
+            self._reordered[chain] = reordered
+        return self._reordered[chain]
+
+    def _applies(self, switches) -> bool:
+        return not self.used_only or bool(
+            switches[self.loop - 1] and switches[self.anchor - 1]
+        )
+
+    def changes(self, patch) -> dict:
+        get = _getter(patch)
+        if not self._applies(get("ID_PATCH_LOOP_SW_LOOP")):
+            return {}
+        value = get("ID_PATCH_LOOP_POSITION")
+        chain = tuple(value[:CHAIN_LENGTH])
+        reordered = self.reorder(chain)
+        if reordered is None or reordered == chain:
+            return {}
+        return {"ID_PATCH_LOOP_POSITION": [*reordered, *value[CHAIN_LENGTH:]]}
+
+    def _columns(self, matrix):
+        """Return whether the move applies to each patch in `matrix`, and the chain
+        of each patch."""
+        from .matrix import FIELD_SLICES
+
+        start = FIELD_SLICES["ID_PATCH_LOOP_POSITION"].start
+        switches = FIELD_SLICES["ID_PATCH_LOOP_SW_LOOP"].start
+        if self.used_only:
+            applies = map(
+                all,
+                zip(
+                    matrix.columns[switches + self.loop - 1],
+                    matrix.columns[switches + self.anchor - 1],
+                ),
+            )
+        else:
+            applies = [True] * len(matrix)
+        return applies, zip(*matrix.columns[start : start + CHAIN_LENGTH])
+
+    def apply_matrix(self, matrix):
+        """Apply this move to every patch in a `matrix.PatchMatrix`, only rewriting
+        the chain columns."""
+        from .matrix import FIELD_SLICES, PatchMatrix
+
+        chains = []
+        for applies, chain in zip(*self._columns(matrix)):
+            reordered = self.reorder(chain) if applies else None
+            chains.append(chain if reordered is None else reordered)
+        start = FIELD_SLICES["ID_PATCH_LOOP_POSITION"].start
+        columns = list(matrix.columns)
+        columns[start : start + CHAIN_LENGTH] = map(list, zip(*chains))
+        return PatchMatrix(columns)
+
+    def rejected(self, patches) -> List[int]:
+        """Return the slot of every patch in `patches` (Patch instances, dicts or a
+        `matrix.PatchMatrix`) that this move applies to, but which can not be
+        reordered."""
+        if hasattr(patches, "columns"):
+            pairs = zip(*self._columns(patches))
+        else:
+            pairs = (
+                (
+                    self._applies(get("ID_PATCH_LOOP_SW_LOOP")),
+                    tuple(get("ID_PATCH_LOOP_POSITION")[:CHAIN_LENGTH]),
+                )
+                for get in map(_getter, patches)
+            )
+        return [
+            slot
+            for slot, (applies, chain) in enumerate(pairs)
+            if applies and self.reorder(chain) is None
+        ]
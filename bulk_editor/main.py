@@ -1,6 +1,5 @@
-from dataclasses import asdict
 from functools import partial
-import json
+import os
 from pathlib import Path
 import time
 
@@ -9,26 +8,43 @@ from asciimatics.exceptions import ResizeScreenError
 from rich import print, pretty
 from rich.console import Console
 from rich.prompt import Prompt, Confirm
-from rich.progress import Progress, BarColumn, TaskProgressColumn, TextColumn
+from rich.progress import (
+    Progress,
+    BarColumn,
+    ProgressColumn,
+    TaskProgressColumn,
+    TextColumn,
+    TransferSpeedColumn,
+)
+from rich.text import Text
 
 from tinydb import Query
 import typer
 
-from . import defaults
+from . import bel, defaults
 from .screens import editor
 from . import data_models as dm
 from . import database as db
-from . import mappings
 from .context import AppContext
 
 app = typer.Typer()
 console = Console()
 
 
+class RateColumn(ProgressColumn):
+    """Renders the number of patches processed per second, for tasks that track
+    progress in bytes and the number of patches in the `patches` field."""
+
+    def render(self, task) -> Text:
+        elapsed = task.elapsed
+        if not elapsed:
+            return Text("? patches/s", style="progress.data.speed")
+        rate = task.fields.get("patches", 0) / elapsed
+        return Text(f"{rate:,.0f} patches/s", style="progress.data.speed")
+
+
 def get_model(backup_filepath: str) -> dm.PatchList:
-    with open(backup_filepath, "r") as infile:
-        backup = json.load(infile)
-    return dm.PatchList(backup["patch"])
+    return bel.load_patch_list(backup_filepath)
 
 
 @app.command()
@@ -89,49 +105,45 @@ def init(
             break
         print("[prompt.invalid]File not found. Check for typos?")
 
+    size = os.path.getsize(backup_filepath)
     with Progress(
         TextColumn("[progress.description]{task.description}"),
         BarColumn(),
         TaskProgressColumn(),
+        RateColumn(),
+        TransferSpeedColumn(),
         expand=True,
         transient=True,
     ) as progress:
-        add_default = progress.add_task("[red]Creating Default Entry...[/]", total=15)
-
         db_method(payload)
 
-        for i in range(15):
-            if i == 14:
-                progress.update(
-                    add_default,
-                    advance=1,
-                    description="[red]Creating Default Entry...[/][green] Done![/]",
-                )
-            progress.update(add_default, advance=1)
-            time.sleep(0.05)
-
         load_patches = progress.add_task(
-            "[blue]Loading patches from default file...", total=800
+            "[blue]Loading patches from backup file...", total=size, patches=0
         )
-        ctx.obj.patch_list = get_model(payload["patch_backup_filepath"])
-
-        for i, p in enumerate(ctx.obj.patch_list.patches):
-            bank, patch = mappings.index_to_patch(i)
-            p_id = patch_table.insert(asdict(p))
-            progress.update(
-                load_patches,
-                advance=1,
-                description=(
-                    f"[blue]inserted [bold green_yellow]{bank}[/]:"
-                    f"[spring_green1]{patch}[/] - "
-                    f"[light_cyan1]'{p.patch_name}[/]' "
-                    f"with id [sping_green1 bold]{p_id}...[/]"
-                ),
-            )
+        start = time.perf_counter()
+        patches, nbytes = db.ingest_backup(
+            patch_table,
+            backup_filepath,
+            on_parse=lambda patches, parsed: progress.update(
+                load_patches, completed=parsed, patches=patches
+            ),
+        )
+        progress.update(
+            load_patches, description="[blue]Writing patches to database..."
+        )
+        db.flush(ctx.obj.db)
+        elapsed = time.perf_counter() - start
 
         metadata_doc_id = conf_table.get(conf.type == "metadata").doc_id
         conf_table.update({"is_ingested": True}, doc_ids=[metadata_doc_id])
 
+    ctx.obj.patch_list = dm.PatchList(patches)
+    count = len(patches)
+    print(
+        f"Ingested [bold]{count}[/] patches ({nbytes / 1e6:.1f} MB) in "
+        f"{elapsed:.2f}s - {count / elapsed:,.0f} patches/s, "
+        f"{nbytes / elapsed / 1e6:.1f} MB/s."
+    )
     print(
         "\n\n:sparkles: [bold]Default profile set with patch backup path "
         f"[green]{backup_filepath}[/] :sparkles:\n\n"
@@ -153,12 +165,24 @@ def configure(ctx: typer.Context):
 
 
 @app.callback()
-def main(ctx: typer.Context):
+def main(
+    ctx: typer.Context,
+    storage: str = typer.Option(
+        "tinydb", help=f"storage backend, one of {', '.join(db.STORAGE_BACKENDS)}"
+    ),
+):
+    if storage not in db.STORAGE_BACKENDS:
+        raise typer.BadParameter(
+            f"expected one of {', '.join(db.STORAGE_BACKENDS)}", param_hint="storage"
+        )
     path = defaults.local_storage()
+    database = db.init_db(path, storage=storage)
+    # writes may be cached by the database until it is closed.
+    ctx.call_on_close(database.close)
     app_context = AppContext(
-        user_prefs=db.Es8Table(
-            db=db.init_db(path), orm=Query(), table_name="user_prefs"
-        )
+        user_prefs=db.Es8Table(db=database, orm=Query(), table_name="user_prefs"),
+        db=database,
+        orm=Query(),
     )
     ctx.obj = app_context
 
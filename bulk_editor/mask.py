@@ -0,0 +1,163 @@
+"""Sparse mask representation for patches.
+
+A mask records only the cells of a patch that differ from some base patch. Rather
+than a dictionary of full-length lists padded with None (see `data_models.Patch`),
+a Mask is keyed by cell: `(field, index) -> value`, where `index` is the position
+within a list field, or None for scalar fields. Merging, applying and diffing masks
+therefore costs O(changed cells) rather than O(all cells).
+
+An Edit records how a change to the default patch rewrites the patches built on
+it: `(field, index) -> (sources, target)`, where every cell whose value is one of
+`sources` (the values the default has held for that cell) is set to `target`. Edits
+compose, so any number of pending changes to the default can be folded into one
+Edit and applied to the patches in a single pass, with the same result as applying
+each change in turn.
+"""
+
+
+def _values(patch) -> dict:
+    """Return a shallow field -> value dictionary for a Patch instance or dict."""
+    if isinstance(patch, dict):
+        return patch
+    return patch.to_dict()
+
+
+class Mask(dict):
+    """Sparse mask of patch cells, keyed by `(field, index)`."""
+
+    @classmethod
+    def from_dense(cls, dense: dict) -> "Mask":
+        """Create a Mask from a dense mask dictionary (or a full patch dictionary)."""
+        mask = cls()
+        for k, v in dense.items():
+            if isinstance(v, list):
+                mask.update(((k, i), x) for i, x in enumerate(v) if x is not None)
+            elif v is not None:
+                mask[(k, None)] = v
+        return mask
+
+    @classmethod
+    def diff(cls, base, patch) -> "Mask":
+        """Return a Mask of every cell in `patch` that differs from `base`.
+
+        `base` and `patch` may be Patch instances or patch dictionaries, in which
+        case whole fields are compared first so that only differing lists are
+        walked, or they may both be Masks.
+        """
+        if isinstance(base, Mask) and isinstance(patch, Mask):
+            return cls(
+                (cell, v)
+                for cell, v in patch.items()
+                if cell not in base or base[cell] != v
+            )
+        base, patch = _values(base), _values(patch)
+        mask = cls()
+        for k, new in patch.items():
+            old = base[k]
+            if old == new:
+                continue
+            if isinstance(new, list):
+                mask.update(
+                    ((k, i), y) for i, (x, y) in enumerate(zip(old, new)) if x != y
+                )
+            else:
+                mask[(k, None)] = new
+        return mask
+
+    @property
+    def fields(self) -> set:
+        """Return the names of the fields touched by this mask."""
+        return {k for (k, _) in self}
+
+    def merge(self, other: "Mask") -> "Mask":
+        """Return a new Mask with the cells of `other` layered over this one."""
+        return Mask({**self, **other})
+
+    def apply(self, patch) -> dict:
+        """Return a new patch dictionary with this mask applied over `patch`.
+
+        Only lists which contain a masked cell are copied. Every other value is
+        shared with `patch`.
+        """
+        values = _values(patch)
+        output = dict(values)
+        for (k, i), v in self.items():
+            if i is None:
+                output[k] = v
+                continue
+            if output[k] is values[k]:
+                output[k] = list(values[k])
+            output[k][i] = v
+        return output
+
+
+class Edit(dict):
+    """Pending change to the default patch, keyed by `(field, index)`, with
+    `(sources, target)` values."""
+
+    @classmethod
+    def diff(cls, base, patch) -> "Edit":
+        """Return the Edit that moves the patches built on the default `base` onto
+        the default `patch`."""
+        values = _values(base)
+        return cls(
+            (cell, (frozenset((_cell(values, cell),)), v))
+            for cell, v in Mask.diff(base, patch).items()
+        )
+
+    @property
+    def target(self) -> Mask:
+        """Return the cells that this Edit sets, as a Mask."""
+        return Mask((cell, target) for cell, (_, target) in self.items())
+
+    def changes(self, patch) -> dict:
+        """Return `{field: value}` for every field of `patch` (a Patch instance or
+        dict) that this Edit changes. Lists are copied before they are changed."""
+        get = patch.__getitem__ if isinstance(patch, dict) else patch.__getattribute__
+        changed = {}
+        for (k, i), (sources, target) in self.items():
+            if i is None:
+                if get(k) in sources:
+                    changed[k] = target
+                continue
+            value = changed[k] if k in changed else get(k)
+            if value[i] not in sources:
+                continue
+            if k not in changed:
+                value = changed[k] = list(value)
+            value[i] = target
+        return changed
+
+    def apply(self, patch) -> dict:
+        """Return a patch dictionary with this Edit applied to `patch`.
+
+        If the Edit does not change `patch` at all, `patch` is returned as a dict
+        without copying. Otherwise only the changed fields are replaced, and every
+        other value is shared with `patch`.
+        """
+        values = _values(patch)
+        changes = self.changes(values)
+        return {**values, **changes} if changes else values
+
+
+def _cell(values: dict, cell: tuple):
+    k, i = cell
+    return values[k] if i is None else values[k][i]
+
+
+def compose(first: Edit, second: Edit) -> Edit:
+    """Return a single Edit equivalent to applying `first` and then `second`.
+
+    `second` must follow on from `first`, ie any cell that both of them touch must
+    have the target of `first` among the sources of `second`, which is always the
+    case for consecutive changes to the same default patch.
+    """
+    composed = Edit(first)
+    for cell, (sources, target) in second.items():
+        if cell in composed:
+            first_sources, first_target = composed[cell]
+            if first_target not in sources:
+                raise ValueError(f"Edits to {cell} are not consecutive.")
+            sources = first_sources | sources
+        composed[cell] = (sources, target)
+    return composed
@@ -0,0 +1,148 @@
+"""Columnar representation of the patch list element of a backup file.
+
+Every patch in a backup has exactly the same shape, so the whole list can be stored
+as a single integer matrix with one row per patch and a fixed column layout derived
+from the fields of `data_models.Patch`: scalar fields take up one column and list
+fields take up one column per element (eg 12 for `ID_PATCH_ASSIGN_SOURCE`).
+
+The matrix is stored column-major (a list of columns, each holding one value per
+patch), so that mask, update and edit operations run as whole-column
+operations and columns that are not affected by an edit are never touched.
+"""
+
+from dataclasses import dataclass, fields
+from typing import Iterable, List, Optional
+
+from . import data_models as dm
+
+
+@dataclass(frozen=True)
+class Column:
+    """A single column of the matrix layout.
+
+    `index` is the position within a list field, or None for scalar fields.
+    """
+
+    field: str
+    index: Optional[int]
+
+
+def _build_layout():
+    """Derive the column layout from the fields of the factory default patch."""
+    columns = []
+    slices = {}
+    for f in fields(dm.Patch):
+        value = getattr(dm.DEFAULT_PATCH, f.name)
+        start = len(columns)
+        if isinstance(value, list):
+            columns.extend(Column(f.name, i) for i in range(len(value)))
+            slices[f.name] = slice(start, len(columns))
+        else:
+            columns.append(Column(f.name, None))
+            slices[f.name] = start
+    return tuple(columns), slices
+
+
+COLUMNS, FIELD_SLICES = _build_layout()
+WIDTH = len(COLUMNS)
+
+
+def flatten(patch) -> list:
+    """Flatten a Patch instance or patch dictionary into a single matrix row."""
+    get = patch.get if isinstance(patch, dict) else patch.__getattribute__
+    row = []
+    for name, cols in FIELD_SLICES.items():
+        if isinstance(cols, slice):
+            row.extend(get(name))
+        else:
+            row.append(get(name))
+    return row
+
+
+def unflatten(row) -> dict:
+    """Convert a matrix row back into the dictionary shape used in `.bel` files."""
+    return {
+        name: list(row[cols]) if isinstance(cols, slice) else row[cols]
+        for name, cols in FIELD_SLICES.items()
+    }
+
+
+class PatchMatrix:
+    """Column-major integer matrix holding every patch in a backup.
+
+    `columns[c][r]` is the value of column `COLUMNS[c]` for patch `r`. Columns are
+    never mutated in place: operations return a new PatchMatrix which shares every
+    column that was not affected, so untouched columns cost nothing to carry over.
+
+    A mask in matrix form follows the same rules as a mask dictionary (see
+    `data_models.Patch`): cells which match the base are None. A column which
+    matches the base for every patch is stored as None rather than as a full column
+    of Nones.
+    """
+
+    __slots__ = ("columns",)
+
+    def __init__(self, columns: List[Optional[list]]):
+        self.columns = columns
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[list]) -> "PatchMatrix":
+        columns = [list(c) for c in zip(*rows)]
+        if not columns:
+            columns = [[] for _ in COLUMNS]
+        return cls(columns)
+
+    @classmethod
+    def from_patches(cls, patches: Iterable) -> "PatchMatrix":
+        """Build a matrix from Patch instances or patch dictionaries."""
+        return cls.from_rows(map(flatten, patches))
+
+    def __len__(self):
+        return next((len(c) for c in self.columns if c is not None), 0)
+
+    def __eq__(self, other):
+        return isinstance(other, PatchMatrix) and self.columns == other.columns
+
+    def rows(self):
+        """Yield every patch as a flat row tuple."""
+        return zip(*self.columns)
+
+    def to_dicts(self):
+        """Yield every patch in the dictionary shape used in `.bel` files."""
+        return map(unflatten, self.rows())
+
+    def to_patches(self) -> list:
+        return [dm.Patch(**p) for p in self.to_dicts()]
+
+    def mask(self, base) -> "PatchMatrix":
+        """Return a mask matrix created by comparing every patch to `base`."""
+        masked = []
+        for column, b in zip(self.columns, flatten(base)):
+            if all(v == b for v in column):
+                masked.append(None)
+            else:
+                masked.append([None if v == b else v for v in column])
+        return PatchMatrix(masked)
+
+    def update(self, base) -> "PatchMatrix":
+        """Treat this matrix as a mask and apply it over `base` for every patch.
+
+        Returns a full matrix where every None cell has been filled in with the value
+        from `base`.
+        """
+        n = len(self)
+        updated = []
+        for column, b in zip(self.columns, flatten(base)):
+            if column is None:
+                updated.append([b] * n)
+            else:
+                updated.append([b if v is None else v for v in column])
+        return PatchMatrix(updated)
+
+    def apply_edit(self, edit) -> "PatchMatrix":
+        """Apply a `mask.Edit` to every patch, only visiting the columns it touches."""
+        applied = list(self.columns)
+        for (k, i), (sources, target) in edit.items():
+            c = FIELD_SLICES[k] if i is None else FIELD_SLICES[k].start + i
+            applied[c] = [target if v in sources else v for v in applied[c]]
+        return PatchMatrix(applied)
@@ -0,0 +1,146 @@
+"""Three-way merge of a template (meta-patch) change into the patches derived from
+the template.
+
+Given the old and the new version of a template, every cell that the template
+changed is merged into each patch derived from it:
+
+* a patch that still holds the old template value takes the new value,
+* a patch that already holds the new value is left as is, and
+* a patch that holds some other value has customized the cell, which is a conflict.
+  Conflicts keep the patch value (the "ours" strategy) or take the new template
+  value ("theirs").
+
+Every other cell of every patch is left untouched. The merge is computed from the
+`inverted.InvertedIndex` of the patch list: each changed cell is a few bitmap
+operations covering every patch at once, so the cost depends on the number of cells
+the template changed rather than on the number of patches.
+
+A patch is derived from a template if it holds the template value in at least
+`threshold` of the cells where the template differs from the factory default.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from . import data_models as dm
+from .inverted import InvertedIndex, Selection
+from .mask import Mask
+
+STRATEGIES = ("ours", "theirs")
+DERIVED_THRESHOLD = 0.8
+
+
+class MergeError(dm.BulkEditorError):
+    pass
+
+
+@dataclass
+class Conflict:
+    slot: int
+    field: str
+    index: Optional[int]
+    base: int  # value in the old template
+    theirs: int  # value in the new template
+    ours: int  # value in the patch
+
+
+@dataclass
+class CellMerge:
+    """Merge result of a single cell changed by the template, across patches."""
+
+    base: int
+    theirs: int
+    # patches that held the old template value, and take the new one.
+    updated: Selection
+    # patches that already held the new template value.
+    unchanged: Selection
+    # patches that customized the cell.
+    conflicts: Selection
+
+
+@dataclass
+class MergeResult:
+    strategy: str
+    # the patches that the template change was merged into.
+    patches: Selection
+    cells: Dict[Tuple[str, Optional[int]], CellMerge] = field(default_factory=dict)
+    conflicts: List[Conflict] = field(default_factory=list)
+
+    def assignments(self) -> Dict[Tuple[str, Optional[int]], Tuple[int, Selection]]:
+        """Return `{cell: (value, patches)}` for every cell the merge sets."""
+        assignments = {}
+        for cell, merge in self.cells.items():
+            patches = merge.updated
+            if self.strategy == "theirs":
+                patches = patches | merge.conflicts
+            if patches:
+                assignments[cell] = (merge.theirs, patches)
+        return assignments
+
+    @property
+    def updated(self) -> Selection:
+        """Return the patches that the merge changes."""
+        updated = Selection(0, self.patches.size)
+        for _, patches in self.assignments().values():
+            updated = updated | patches
+        return updated
+
+
+def derived_from(
+    index: InvertedIndex, template, threshold: float = DERIVED_THRESHOLD
+) -> Selection:
+    """Return the patches in `index` derived from `template` (a Patch instance or
+    dict), ie which hold the template value in at least `threshold` of the cells
+    where the template differs from the factory default.
+
+    If the template does not differ from the factory default, every patch is
+    derived from it.
+    """
+    signature = Mask.diff(dm.DEFAULT_PATCH, template)
+    if not signature:
+        return index.all()
+    counts = [0] * index.size
+    for (name, i), value in signature.items():
+        for slot in index.where(name, value, i):
+            counts[slot] += 1
+    needed = threshold * len(signature)
+    bits = 0
+    for slot, count in enumerate(counts):
+        if count >= needed:
+            bits |= 1 << slot
+    return Selection(bits, index.size)
+
+
+def three_way_merge(
+    index: InvertedIndex,
+    base,
+    theirs,
+    patches: Optional[Selection] = None,
+    strategy: str = "ours",
+) -> MergeResult:
+    """Merge the change from the `base` template to `theirs` (Patch instances or
+    dicts) into the patches in `patches` (by default, every patch in `index`)."""
+    if strategy not in STRATEGIES:
+        raise MergeError(
+            f"Invalid strategy {strategy!r}, expected one of {', '.join(STRATEGIES)}."
+        )
+    if patches is None:
+        patches = index.all()
+    result = MergeResult(strategy, patches)
+    values = base if isinstance(base, dict) else base.to_dict()
+    for (name, i), new in Mask.diff(base, theirs).items():
+        old = values[name] if i is None else values[name][i]
+        updated = index.where(name, old, i) & patches
+        unchanged = index.where(name, new, i) & patches
+        conflicts = patches - updated - unchanged
+        result.cells[(name, i)] = CellMerge(old, new, updated, unchanged, conflicts)
+        if not conflicts:
+            continue
+        for value, bits in index.cells[(name, i)].items():
+            if bits & conflicts.bits:
+                result.conflicts.extend(
+                    Conflict(slot, name, i, old, new, value)
+                    for slot in Selection(bits, index.size) & conflicts
+                )
+    result.conflicts.sort(key=lambda conflict: conflict.slot)
+    return result
@@ -0,0 +1,282 @@
+"""SQLite storage backend for the local database.
+
+`SqliteDB` is a drop-in replacement for the TinyDB database returned by
+`database.init_db`, implementing the subset of the TinyDB API used by `Es8Table` and
+`main.init`. The database runs in WAL mode, and every write (including a whole
+`insert_multiple`) is a single transaction.
+
+Most tables (`conf`, `user_prefs`) are `DocumentTable`s, which store each document
+as JSON with an indexed `type` column. Conditions are TinyDB queries, evaluated
+against the documents in Python, as these tables only hold a handful of documents.
+
+The `patch` table is a `PatchTable`, which also stores the bank, patch number, name
+and every scalar `ID_PATCH_*` field of each patch in its own indexed column, so that
+lookups such as `get_patch(32, 4)` or `where("ID_PATCH_MASTER_BPM", ">", 120)` are
+indexed queries rather than scans.
+"""
+
+import json
+import sqlite3
+from typing import Callable, Dict, Iterable, List, Optional
+
+from tinydb.table import Document
+
+from . import data_models as dm
+from . import mappings
+
+DB_FILE = "db.sqlite"
+PATCH_TABLE = "patch"
+OPERATORS = ("=", "!=", "<", "<=", ">", ">=")
+SCALAR_FIELDS = tuple(
+    name
+    for name in dm.PATCH_FIELDS
+    if not isinstance(getattr(dm.DEFAULT_PATCH, name), list)
+)
+
+
+class SqliteDBError(dm.BulkEditorError):
+    pass
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class DocumentTable:
+    """Table of JSON documents, with the TinyDB table API."""
+
+    def __init__(self, connection: sqlite3.Connection, name: str):
+        self._db = connection
+        self.name = name
+        self._table = _quote(name)
+        self._create()
+
+    def _create(self):
+        name = self.name
+        with self._db:
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self._table} ("
+                "doc_id INTEGER PRIMARY KEY, type TEXT, doc TEXT NOT NULL)"
+            )
+            self._db.execute(
+                f"CREATE INDEX IF NOT EXISTS {_quote(name + '_type')} "
+                f"ON {self._table}(type)"
+            )
+
+    def _row(self, doc_id: Optional[int], document: dict) -> tuple:
+        return doc_id, document.get("type"), json.dumps(document)
+
+    def _document(self, row) -> Document:
+        return Document(json.loads(row["doc"]), doc_id=row["doc_id"])
+
+    def _select(self, where: str = "", params: Iterable = ()) -> List[Document]:
+        cursor = self._db.execute(
+            f"SELECT * FROM {self._table} {where} ORDER BY doc_id", tuple(params)
+        )
+        return [self._document(row) for row in cursor]
+
+    def __len__(self):
+        return self._db.execute(f"SELECT count(*) FROM {self._table}").fetchone()[0]
+
+    def all(self) -> List[Document]:
+        return self._select()
+
+    def insert(self, document: dict) -> int:
+        return self.insert_multiple([document])[0]
+
+    def insert_multiple(self, documents: Iterable[dict]) -> List[int]:
+        """Insert every document in a single transaction."""
+        doc_ids = []
+        with self._db:
+            for document in documents:
+                cursor = self._db.execute(
+                    f"INSERT INTO {self._table} VALUES (?, ?, ?)",
+                    self._row(getattr(document, "doc_id", None), document),
+                )
+                doc_ids.append(cursor.lastrowid)
+        return doc_ids
+
+    def get(
+        self, cond: Optional[Callable] = None, doc_id: Optional[int] = None
+    ) -> Optional[Document]:
+        if doc_id is not None:
+            documents = self._select("WHERE doc_id = ?", (doc_id,))
+        else:
+            documents = self.search(cond)
+        return documents[0] if documents else None
+
+    def search(self, cond: Callable) -> List[Document]:
+        return [document for document in self.all() if cond(document)]
+
+    def _matching(self, cond=None, doc_ids=None) -> List[Document]:
+        if doc_ids is not None:
+            placeholders = ", ".join("?" * len(doc_ids))
+            return self._select(f"WHERE doc_id IN ({placeholders})", doc_ids)
+        return self.search(cond)
+
+    def update(self, fields: dict, cond=None, doc_ids=None) -> List[int]:
+        """Update the fields of every matching document in a single transaction."""
+        documents = self._matching(cond, doc_ids)
+        with self._db:
+            for document in documents:
+                document.update(fields)
+                self._db.execute(
+                    f"UPDATE {self._table} SET type = ?, doc = ? WHERE doc_id = ?",
+                    self._row(document.doc_id, document)[1:] + (document.doc_id,),
+                )
+        return [document.doc_id for document in documents]
+
+    def upsert(self, document: dict, cond=None) -> List[int]:
+        """Update the matching documents (or the document with the same doc_id, if
+        `document` is a Document), inserting `document` if there are none."""
+        doc_id = getattr(document, "doc_id", None)
+        if doc_id is not None:
+            updated = self.update(document, doc_ids=[doc_id])
+        else:
+            updated = self.update(document, cond)
+        return updated or [self.insert(document)]
+
+    def remove(self, cond=None, doc_ids=None) -> List[int]:
+        doc_ids = [document.doc_id for document in self._matching(cond, doc_ids)]
+        with self._db:
+            self._db.executemany(
+                f"DELETE FROM {self._table} WHERE doc_id = ?",
+                [(doc_id,) for doc_id in doc_ids],
+            )
+        return doc_ids
+
+    def truncate(self):
+        with self._db:
+            self._db.execute(f"DELETE FROM {self._table}")
+
+
+class PatchTable(DocumentTable):
+    """Table of patches, with an indexed column for the bank, patch number, name and
+    every scalar field of each patch.
+
+    Patches are stored in slot order, and the doc_id of a patch is its slot index + 1
+    (as with the TinyDB patch table).
+    """
+
+    COLUMNS = ("bank", "patch", "name") + SCALAR_FIELDS
+
+    def _create(self):
+        name = self.name
+        columns = ", ".join(
+            ["bank INTEGER", "patch INTEGER", "name TEXT"]
+            + [f"{field} INTEGER" for field in SCALAR_FIELDS]
+        )
+        with self._db:
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self._table} ("
+                f"doc_id INTEGER PRIMARY KEY, {columns}, doc TEXT NOT NULL)"
+            )
+            self._db.execute(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS {_quote(name + '_coords')} "
+                f"ON {self._table}(bank, patch)"
+            )
+            for column in self.COLUMNS[2:]:
+                self._db.execute(
+                    f"CREATE INDEX IF NOT EXISTS {_quote(f'{name}_{column}')} "
+                    f"ON {self._table}({column})"
+                )
+
+    def _row(self, doc_id: Optional[int], document: dict) -> tuple:
+        if doc_id is None:
+            raise SqliteDBError("Patches must be inserted with a doc_id.")
+        bank, patch = mappings.index_to_patch(doc_id - 1)
+        return (
+            doc_id,
+            bank,
+            patch,
+            mappings.ord_to_text(document["ID_PATCH_NAME"]),
+            *(document[field] for field in SCALAR_FIELDS),
+            json.dumps(document),
+        )
+
+    def insert_multiple(self, documents: Iterable[dict]) -> List[int]:
+        """Append the patches to the table in a single transaction."""
+        start = self._db.execute(
+            f"SELECT coalesce(max(doc_id), 0) FROM {self._table}"
+        ).fetchone()[0]
+        rows = [
+            self._row(getattr(document, "doc_id", None) or start + i, document)
+            for i, document in enumerate(documents, 1)
+        ]
+        placeholders = ", ".join("?" * (len(self.COLUMNS) + 2))
+        with self._db:
+            self._db.executemany(
+                f"INSERT INTO {self._table} VALUES ({placeholders})", rows
+            )
+        return [row[0] for row in rows]
+
+    def update(self, fields: dict, cond=None, doc_ids=None) -> List[int]:
+        documents = self._matching(cond, doc_ids)
+        assignments = ", ".join(f"{column} = ?" for column in self.COLUMNS)
+        with self._db:
+            for document in documents:
+                document.update(fields)
+                row = self._row(document.doc_id, document)
+                self._db.execute(
+                    f"UPDATE {self._table} SET {assignments}, doc = ? "
+                    "WHERE doc_id = ?",
+                    row[1:] + (document.doc_id,),
+                )
+        return [document.doc_id for document in documents]
+
+    def get_patch(self, bank: int, patch: int) -> Optional[Document]:
+        """Return the patch at `bank:patch`."""
+        documents = self._select("WHERE bank = ? AND patch = ?", (bank, patch))
+        return documents[0] if documents else None
+
+    def where(self, column: str, op: str, value) -> List[Document]:
+        """Return every patch where `column` `op` `value`, eg
+        `where("ID_PATCH_MASTER_BPM", ">", 120)`. `column` must be one of
+        PatchTable.COLUMNS."""
+        if column not in self.COLUMNS:
+            raise SqliteDBError(f"{column} is not an indexed patch column.")
+        if op not in OPERATORS:
+            raise SqliteDBError(f"Invalid operator {op}, expected one of {OPERATORS}.")
+        return self._select(f"WHERE {column} {op} ?", (value,))
+
+
+class SqliteDB:
+    """SQLite database with the subset of the TinyDB API used by the editor."""
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._tables: Dict[str, DocumentTable] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def table(self, name: str) -> DocumentTable:
+        if name not in self._tables:
+            cls = PatchTable if name == PATCH_TABLE else DocumentTable
+            self._tables[name] = cls(self._db, name)
+        return self._tables[name]
+
+    def tables(self) -> set:
+        cursor = self._db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        return {row["name"] for row in cursor}
+
+    def drop_table(self, name: str):
+        """Drop the table `name`. As with TinyDB, the table can still be used after it
+        has been dropped, starting out empty."""
+        with self._db:
+            self._db.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+        if name in self._tables:
+            self._tables[name]._create()
+
+    def flush(self):
+        """Every write is already committed, this is for parity with TinyDB's
+        CachingMiddleware."""
+
+    def close(self):
+        self._db.close()
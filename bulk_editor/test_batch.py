@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from . import batch
+from .data_models import DEFAULT_PATCH, PatchList
+
+TEST_FILE = "bulk_editor/test_data/test_1.bel"
+STEP = argparse.Namespace(
+    action="set_assign",
+    assign_number=1,
+    source="Num8",
+    mode="MOM",
+    target="BPM: Tap",
+    params={},
+)
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.mkdtemp()
+        for name in ("unit_1.bel", "unit_2.bel"):
+            shutil.copy(TEST_FILE, os.path.join(self.tmpdir, name))
+        with open(os.path.join(self.tmpdir, "broken.bel"), "w") as outfile:
+            json.dump({"target": "ES-8"}, outfile)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def test_expand_paths(self):
+        self.assertEqual(
+            [os.path.basename(p) for p in batch.expand_paths([self.tmpdir])],
+            ["broken.bel", "unit_1.bel", "unit_2.bel"],
+        )
+        pattern = os.path.join(self.tmpdir, "unit_*.bel")
+        self.assertEqual(len(batch.expand_paths([pattern, self.tmpdir])), 3)
+        # the edited copies written by an earlier run are not edited again.
+        shutil.copy(TEST_FILE, os.path.join(self.tmpdir, "unit_1_edited.bel"))
+        self.assertEqual(len(batch.expand_paths([self.tmpdir])), 3)
+
+    def test_output_path(self):
+        path = os.path.join(self.tmpdir, "unit_1.bel")
+        self.assertEqual(
+            batch.output_path(path), os.path.join(self.tmpdir, "unit_1_edited.bel")
+        )
+        with self.assertRaises(batch.BulkEditorError):
+            batch.output_path(path, suffix="")
+
+    def test_output_clash(self):
+        other = os.path.join(self.tmpdir, "other")
+        os.mkdir(other)
+        shutil.copy(TEST_FILE, os.path.join(other, "unit_1.bel"))
+        paths = [os.path.join(d, "unit_1.bel") for d in (self.tmpdir, other)]
+        output_dir = os.path.join(self.tmpdir, "out")
+        with self.assertRaises(batch.BulkEditorError):
+            list(batch.run_batch(paths, [STEP], output_dir=output_dir))
+        self.assertFalse(os.path.exists(output_dir))
+
+    def test_output_is_input(self):
+        edited = os.path.join(self.tmpdir, "unit_1_edited.bel")
+        shutil.copy(TEST_FILE, edited)
+        paths = [os.path.join(self.tmpdir, "unit_1.bel"), edited]
+        with self.assertRaises(batch.BulkEditorError):
+            list(batch.run_batch(paths, [STEP]))
+        with open(edited, "rb") as infile, open(TEST_FILE, "rb") as original:
+            self.assertEqual(infile.read(), original.read())
+
+    def test_run_batch(self):
+        output_dir = os.path.join(self.tmpdir, "out")
+        paths = batch.expand_paths([self.tmpdir])
+        results = {
+            os.path.basename(r.path): r
+            for r in batch.run_batch(paths, [STEP], output_dir=output_dir, workers=2)
+        }
+        self.assertFalse(results["broken.bel"].ok)
+        self.assertIn("BelFormatError", results["broken.bel"].error)
+        with open(TEST_FILE, "r") as infile:
+            expected = PatchList(json.load(infile)["patch"])
+        expected.update_assign(1, "Num8", "MOM", "BPM: Tap", {})
+        for name in ("unit_1.bel", "unit_2.bel"):
+            self.assertTrue(results[name].ok)
+            with open(results[name].output, "r") as infile:
+                self.assertEqual(json.load(infile)["patch"], expected.to_dicts())
+
+    def test_default(self):
+        # a global default that already holds assign 1, as if set by an earlier run.
+        default = DEFAULT_PATCH.update(
+            {"ID_PATCH_MASTER_BPM": 1234, "ID_PATCH_ASSIGN_SW": [1] + [None] * 11}
+        )
+        path = os.path.join(self.tmpdir, "unit_1.bel")
+        single = os.path.join(self.tmpdir, "single.bel")
+        batch.edit_file(path, single, [STEP], default=default)
+        (result,) = batch.run_batch(
+            [path], [STEP], output_dir=os.path.join(self.tmpdir, "out"), default=default
+        )
+        with open(single, "r") as infile, open(result.output, "r") as batchfile:
+            self.assertEqual(json.load(infile), json.load(batchfile))
+        with open(TEST_FILE, "r") as infile:
+            expected = PatchList(json.load(infile)["patch"], states=[default])
+        expected.update_assign(1, "Num8", "MOM", "BPM: Tap", {})
+        with open(single, "r") as infile:
+            self.assertEqual(json.load(infile)["patch"], expected.to_dicts())
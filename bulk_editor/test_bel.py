@@ -0,0 +1,155 @@
+import gc
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+from . import bel
+from . import data_models as d
+
+TEST_FILE = "bulk_editor/test_data/test_1.bel"
+
+
+class TestBelReader(unittest.TestCase):
+    def setUp(self) -> None:
+        with open(TEST_FILE, "r") as infile:
+            self.backupfile = json.load(infile)
+
+    def test_header(self):
+        self.assertEqual(
+            bel.read_header(TEST_FILE),
+            {k: v for k, v in self.backupfile.items() if k != "patch"},
+        )
+
+    def test_iter_patches(self):
+        patches = list(bel.iter_patches(TEST_FILE))
+        self.assertEqual(len(patches), 800)
+        self.assertEqual(patches[9][0], d.PatchCoords(bank=1, patch=2))
+        self.assertEqual([p.to_dict() for _, p in patches], self.backupfile["patch"])
+
+    def test_small_chunks(self):
+        with bel.BelReader(TEST_FILE, chunk_size=7) as reader:
+            raw = [patch for *_, patch in reader.iter_raw()]
+        self.assertEqual(raw, self.backupfile["patch"])
+
+    def test_invalid_file_is_closed(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "broken.bel")
+            with open(path, "w") as outfile:
+                json.dump({"target": "ES-8"}, outfile)
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always", ResourceWarning)
+                with self.assertRaises(bel.BelFormatError):
+                    bel.BelReader(path)
+                gc.collect()
+        self.assertEqual(
+            [w for w in caught if issubclass(w.category, ResourceWarning)], []
+        )
+
+    def test_spans(self):
+        with open(TEST_FILE, "rb") as infile:
+            data = infile.read()
+        with bel.BelReader(TEST_FILE) as reader:
+            for _, start, end, patch in reader.iter_raw():
+                self.assertEqual(json.loads(data[start:end]), patch)
+
+
+class TestBelIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        with open(TEST_FILE, "r") as infile:
+            self.backupfile = json.load(infile)
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "backup.bel")
+        shutil.copy(TEST_FILE, self.path)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def test_random_access(self):
+        with bel.BelIndex(self.path, cache=False) as index:
+            self.assertEqual(len(index), 800)
+            self.assertEqual(index[259], self.backupfile["patch"][259])
+            self.assertEqual(index[-1], self.backupfile["patch"][-1])
+        self.assertEqual(
+            bel.read_patch_at(self.path, 32, 4).to_dict(),
+            self.backupfile["patch"][259],
+        )
+
+    def test_index_cache(self):
+        spans = bel.load_index(self.path)
+        self.assertTrue(os.path.isfile(bel.index_path(self.path)))
+        self.assertEqual(bel.load_index(self.path), spans)
+        # rewriting the backup invalidates the cached index
+        with open(self.path, "w") as outfile:
+            json.dump(self.backupfile, outfile)
+        self.assertNotEqual(bel.load_index(self.path), spans)
+        self.assertEqual(bel.load_index(self.path), bel.build_index(self.path))
+
+    def test_damaged_index_cache(self):
+        spans = bel.load_index(self.path)
+        cache_file = bel.index_path(self.path)
+        for damaged in ['{"key": {"size"', "[]", '{"key": null}']:
+            with open(cache_file, "w") as outfile:
+                outfile.write(damaged)
+            self.assertEqual(bel.load_index(self.path), spans)
+            # the damaged cache is replaced.
+            with open(cache_file, "r") as infile:
+                self.assertEqual(json.load(infile)["spans"], [list(s) for s in spans])
+        self.assertFalse(os.path.exists(cache_file + ".tmp"))
+
+    def test_lazy_patch_list(self):
+        patch_list = bel.load_patch_list(self.path, backend="lazy")
+        self.assertEqual(
+            patch_list.get_patch(99, 8).to_dict(), self.backupfile["patch"][799]
+        )
+        self.assertEqual(patch_list.to_dicts(), self.backupfile["patch"])
+        # the caller owns the BelIndex of a lazy PatchList from load_patch_list.
+        patch_list.rows.close()
+
+    def test_open_patch_list(self):
+        with bel.open_patch_list(self.path, backend="lazy") as patch_list:
+            index = patch_list.rows
+            self.assertEqual(
+                patch_list.get_patch(99, 8).to_dict(), self.backupfile["patch"][799]
+            )
+        self.assertTrue(index._map.closed)
+        with bel.open_patch_list(self.path) as patch_list:
+            self.assertEqual(patch_list.to_dicts(), self.backupfile["patch"])
+
+    def test_splice_write(self):
+        output = os.path.join(self.tmpdir, "output.bel")
+        patches = [dict(p) for p in self.backupfile["patch"]]
+        patches[3]["ID_PATCH_MASTER_BPM"] = 123
+        changed = bel.changed_patches(self.backupfile["patch"], patches)
+        self.assertEqual(list(changed), [3])
+        bel.splice_write(self.path, output, changed)
+        with open(output, "r") as infile:
+            self.assertEqual(json.load(infile)["patch"], patches)
+        with open(self.path, "rb") as a, open(output, "rb") as b:
+            source, spliced = a.read(), b.read()
+        start, end = bel.load_index(self.path)[3]
+        self.assertEqual(spliced[:start], source[:start])
+        self.assertEqual(spliced[-100:], source[-100:])
+
+    def test_write_bel(self):
+        output = os.path.join(self.tmpdir, "output.bel")
+        with bel.BelReader(self.path) as reader:
+            patches = (patch for *_, patch in reader.iter_raw())
+            with open(output, "w") as outfile:
+                count = bel.write_bel(outfile, reader.header, patches)
+        self.assertEqual(count, 800)
+        with open(output, "r") as infile:
+            self.assertEqual(infile.read(), json.dumps(self.backupfile))
+
+    def test_stream_patch_list(self):
+        params = dict(assign_number=1, source="Num8", mode="MOM", target="BPM: Tap")
+        expected = d.PatchList(self.backupfile["patch"])
+        expected.update_assign(params={}, **params)
+        with bel.BelReader(self.path) as reader:
+            patch_list = d.PatchList(
+                (patch for *_, patch in reader.iter_raw()), backend="stream"
+            )
+            patch_list.update_assign(params={}, **params)
+            self.assertEqual(list(patch_list.iter_dicts()), expected.to_dicts())
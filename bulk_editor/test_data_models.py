@@ -1,9 +1,13 @@
+from collections import Counter
 from dataclasses import dataclass
+from functools import reduce
 import json
 import unittest
 
 from . import data_models as d
 from . import actions
+from .database_old import AssignModel
+from .mask import Edit
 
 
 @dataclass
@@ -16,8 +20,227 @@ class MockArgs:
 
 
 class TestPatchActions(unittest.TestCase):
-    # TODO
-    pass
+    def test_to_dict_round_trip(self):
+        patch = d.Patch.from_dict(d.DEFAULT_PATCH.to_dict())
+        self.assertEqual(patch, d.DEFAULT_PATCH)
+        self.assertIs(patch.ID_PATCH_NAME, d.DEFAULT_PATCH.ID_PATCH_NAME)
+
+    def test_update_shares_unchanged_fields(self):
+        updated = d.DEFAULT_PATCH.update(
+            {"ID_PATCH_ASSIGN_SW": [1] + [None] * 11, "ID_PATCH_MASTER_BPM": 120}
+        )
+        self.assertEqual(updated.ID_PATCH_ASSIGN_SW[0], 1)
+        self.assertEqual(d.DEFAULT_PATCH.ID_PATCH_ASSIGN_SW[0], 0)
+        self.assertIs(updated.ID_PATCH_CTL_FUNC, d.DEFAULT_PATCH.ID_PATCH_CTL_FUNC)
+
+    def test_codec_matches_mutate(self):
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            patches = json.load(infile)["patch"]
+        base = d.DEFAULT_PATCH
+        for patch in patches[:64]:
+            mask = base._mutate("_mask", patch)
+            self.assertEqual(base.mask(patch), mask)
+            self.assertEqual(
+                base.update(mask),
+                d.Patch(**{**base.to_dict(), **base._mutate("_pick", mask)}),
+            )
+        self.assertNotEqual(d.Patch.from_dict(patches[0]), base)
+
+    def test_apply_edit_matches_mask_update(self):
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            patches = [d.Patch.from_dict(p) for p in json.load(infile)["patch"][:64]]
+        latest = d.DEFAULT_PATCH.update(
+            {"ID_PATCH_ASSIGN_SW": [1] + [None] * 11, "ID_PATCH_MASTER_BPM": 120}
+        )
+        edit = Edit.diff(d.DEFAULT_PATCH, latest)
+        for patch in patches:
+            applied = patch.apply_edit(edit)
+            self.assertEqual(
+                applied, latest.update(d.DEFAULT_PATCH.mask(patch.to_dict()))
+            )
+            self.assertIs(applied.ID_PATCH_CTL_FUNC, patch.ID_PATCH_CTL_FUNC)
+        unchanged = latest.update({"ID_PATCH_MASTER_BPM": 90})
+        self.assertIs(unchanged.apply_edit(edit), unchanged)
+
+    def test_hash(self):
+        patch = d.Patch.from_dict(d.DEFAULT_PATCH.to_dict())
+        self.assertEqual(hash(patch), hash(d.DEFAULT_PATCH))
+        self.assertEqual(len({patch, d.DEFAULT_PATCH}), 1)
+        updated = patch.update({"ID_PATCH_MASTER_BPM": 120})
+        self.assertNotEqual(hash(updated), hash(patch))
+
+    def test_get_assign_is_hashable(self):
+        assign = d.DEFAULT_PATCH.get_assign(1)
+        self.assertIn(assign, {d.DEFAULT_PATCH.get_assign(1)})
+        with self.assertRaises(TypeError):
+            assign["source"] = "Num8"
+
+
+class TestPatchListStates(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.backupfile = json.load(infile)
+
+    def test_latest_default_state_is_cached(self):
+        patch_list = d.PatchList(self.backupfile["patch"][:8])
+        patch_list._update_states({"ID_PATCH_MASTER_BPM": 120})
+        patch_list._update_states({"ID_PATCH_CTL1": 0})
+        folded = patch_list.latest_default_state
+        self.assertIs(folded, patch_list.latest_default_state)
+        self.assertEqual(
+            folded,
+            reduce(lambda state, mask: state.update(mask), patch_list.states),
+        )
+
+    def test_replacing_states_invalidates_cache(self):
+        patch_list = d.PatchList(self.backupfile["patch"][:8])
+        patch_list._update_states({"ID_PATCH_MASTER_BPM": 120})
+        patch_list.states = [d.DEFAULT_PATCH]
+        self.assertIs(patch_list.latest_default_state, d.DEFAULT_PATCH)
+
+
+class TestLazyPatchList(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.backupfile = json.load(infile)
+
+    def test_get_patch_builds_one_patch(self):
+        patch_list = d.PatchList(self.backupfile["patch"], backend="lazy")
+        patch = patch_list.get_patch(32, 4)
+        self.assertEqual(patch.to_dict(), self.backupfile["patch"][259])
+        self.assertIs(patch, patch_list.get_patch(32, 4))
+        self.assertEqual(list(patch_list._cache), [259])
+        self.assertIsNone(patch_list._patches)
+
+    def test_apply_matches_patch_backend(self):
+        params = dict(
+            assign_number=2, source="Num8", mode="MOM", target="BPM: Tap", params={}
+        )
+        patch_list = d.PatchList(self.backupfile["patch"])
+        lazy_list = d.PatchList(self.backupfile["patch"], backend="lazy")
+        patch_list.update_assign(**params)
+        lazy_list.update_assign(**params)
+        self.assertEqual(lazy_list.to_dicts(), patch_list.to_dicts())
+
+
+class TestPatchListInterning(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.backupfile = json.load(infile)
+
+    def test_identical_patches_share_storage(self):
+        patch_list = d.PatchList(self.backupfile["patch"])
+        distinct = {json.dumps(p) for p in self.backupfile["patch"]}
+        self.assertEqual(len({id(p) for p in patch_list.patches}), len(distinct))
+
+    def test_apply_updates_distinct_patches(self):
+        patch_list = d.PatchList(self.backupfile["patch"])
+        patches, _ = patch_list.update_assign(1, "Num8", "MOM", "BPM: Tap", {})
+        self.assertEqual(len({id(p) for p in patches}), len(set(patches)))
+        assigns = Counter(p.get_assign(1) for p in patches)
+        self.assertEqual(assigns.most_common(1)[0][0]["source"], "Num8")
+
+
+class TestPatchListTransaction(unittest.TestCase):
+    EDITS = [
+        (1, "Num8", "MOM", "BPM: Tap", {}),
+        (1, "CTL1", "TGL", "LOOP: L3", {}),
+        (2, "Num8", "MOM", "BPM: Tap", {}),
+        (1, "Num8", "MOM", "BPM: Tap", {}),
+    ]
+
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.backupfile = json.load(infile)
+        self.expected = d.PatchList(self.backupfile["patch"])
+        for edit in self.EDITS:
+            self.expected.update_assign(*edit)
+
+    def test_commit_matches_sequential_edits(self):
+        for backend in ["patch", "matrix", "lazy"]:
+            patch_list = d.PatchList(self.backupfile["patch"], backend=backend)
+            with patch_list.transaction():
+                for edit in self.EDITS:
+                    patch_list.update_assign(*edit)
+                self.assertEqual(patch_list.to_dicts(), self.backupfile["patch"])
+            self.assertEqual(patch_list.to_dicts(), self.expected.to_dicts())
+            self.assertEqual(
+                patch_list.latest_default_state, self.expected.latest_default_state
+            )
+
+    def test_get_patch_includes_pending_edits(self):
+        patch_list = d.PatchList(self.backupfile["patch"])
+        patch_list.begin()
+        patch_list.update_assign(*self.EDITS[0])
+        self.assertEqual(
+            patch_list.get_patch(32, 4).get_assign(1),
+            self.expected.get_patch(32, 4).get_assign(1),
+        )
+
+    def test_rollback(self):
+        patch_list = d.PatchList(self.backupfile["patch"])
+        initial = patch_list.latest_default_state
+        with self.assertRaises(ValueError):
+            with patch_list.transaction():
+                patch_list.update_assign(*self.EDITS[0])
+                raise ValueError
+        self.assertIs(patch_list.latest_default_state, initial)
+        self.assertEqual(patch_list.to_dicts(), self.backupfile["patch"])
+
+
+class TestPatchListAssigns(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.backupfile = json.load(infile)
+        self.patch_list = d.PatchList(self.backupfile["patch"])
+
+    def test_get_patch_assigns_matches_get_assign(self):
+        patch = self.patch_list.get_patch(32, 4)
+        keys = {v: k for k, v in d.ASSIGN_KEYS.items()}
+        self.assertEqual(
+            self.patch_list.get_patch_assigns(32, 4),
+            [
+                d.Assign(
+                    patch_id=259,
+                    **{keys.get(k, k): v for k, v in patch.get_assign(n).items()},
+                )
+                for n in range(1, 13)
+            ],
+        )
+
+    def test_assigns(self):
+        assigns = self.patch_list.assigns()
+        self.assertEqual(len(assigns), 800 * 12)
+        self.assertEqual(
+            assigns[259 * 12 : 260 * 12], self.patch_list.get_patch_assigns(32, 4)
+        )
+        for backend in ["matrix", "lazy"]:
+            patch_list = d.PatchList(self.backupfile["patch"], backend=backend)
+            self.assertEqual(patch_list.assigns(), assigns)
+
+    def test_assign_model(self):
+        model = AssignModel.from_patch_list(self.patch_list)
+        expected = [
+            (assign.patch_id, assign.assign_number)
+            for assign in self.patch_list.assigns()
+            if assign.source == "Num8" and assign.target == "BPM: Tap"
+        ]
+        matches = model.search(source="Num8", target="BPM: Tap")
+        self.assertEqual(
+            [(assign.patch_id, assign.assign_number) for assign in matches], expected
+        )
+        self.assertEqual(
+            model.patch_ids(source="Num8", target="BPM: Tap"),
+            sorted({patch_id for patch_id, _ in expected}),
+        )
+        self.assertEqual(
+            model.count_by("source", "target")[("Num8", "BPM: Tap")], len(expected)
+        )
+        with self.assertRaises(ValueError):
+            model.search(**{"cc#": 1})
+        with self.assertRaises(ValueError):
+            model.count_by()
+        model.close()
 
 
 class TestPatchListActions(unittest.TestCase):
@@ -45,6 +268,9 @@ class TestPatchListActions(unittest.TestCase):
         action_func = actions.VALID_ACTIONS["set_assign"]
         patches, default = action_func(patch_list, args)
         assign_set = set([patch.get_assign(4) for patch in patches])
+        # NOTE - this currently fails with 18 != 1: patches keep the cells of assign 4
+        #        that they customized (see test_set_assign_keeps_customized_cells), so
+        #        test_1.bel ends up with 18 distinct assign 4 values.
         self.assertEqual(
             len(assign_set), 1
         )  # validate assign is the same for all patches
@@ -55,6 +281,26 @@ class TestPatchListActions(unittest.TestCase):
             expected_default, default
         )  # validate that the default patch matches expected
 
+    def test_set_assign_keeps_customized_cells(self):
+        patch_list = d.PatchList(self.backupfile["patch"])
+        before = patch_list.to_dicts()
+        patch_list.update_assign(4, "MemM", "TGL", "E.CTL: CTL2", {})
+        expected = patch_list.latest_default_state.to_dict()
+        default = d.DEFAULT_PATCH.to_dict()
+        for old, new in zip(before, patch_list.to_dicts()):
+            for name in d.ASSIGN_FIELDS:
+                # a cell that held the old default takes the new default, and a
+                # customized cell is left as is.
+                self.assertEqual(
+                    new[name][3],
+                    (
+                        expected[name][3]
+                        if old[name][3] == default[name][3]
+                        else old[name][3]
+                    ),
+                )
+        self.assertEqual(len({patch.get_assign(4) for patch in patch_list.patches}), 18)
+
     def test_set_default_patch(self):
         # TODO
         pass
@@ -0,0 +1,25 @@
+import json
+import os
+import unittest
+
+from tinydb import TinyDB
+from tinydb.storages import MemoryStorage
+
+from . import database as db
+
+TEST_FILE = "bulk_editor/test_data/test_1.bel"
+
+
+class TestIngest(unittest.TestCase):
+    def test_ingest_backup(self):
+        with open(TEST_FILE, "r") as infile:
+            backupfile = json.load(infile)
+        table = TinyDB(storage=MemoryStorage).table("patch")
+        progress = []
+        patches, nbytes = db.ingest_backup(
+            table, TEST_FILE, on_parse=lambda *args: progress.append(args)
+        )
+        self.assertEqual(patches, backupfile["patch"])
+        self.assertEqual(table.all(), backupfile["patch"])
+        self.assertEqual(progress[-1][0], 800)
+        self.assertLess(nbytes, os.path.getsize(TEST_FILE))
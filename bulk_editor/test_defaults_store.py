@@ -0,0 +1,133 @@
+import json
+import os
+import tempfile
+import unittest
+
+from . import data_models as d
+from . import defaults_store
+from .defaults_store import DefaultsStore, DefaultsStoreError
+
+
+def bpm(value: int) -> d.Patch:
+    return d.DEFAULT_PATCH.update({"ID_PATCH_MASTER_BPM": value})
+
+
+class TestDefaultsStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "defaults")
+        self.store = DefaultsStore(self.path)
+
+    def tearDown(self) -> None:
+        defaults_store._HEADS.clear()
+        self.tmp.cleanup()
+
+    def test_empty(self):
+        self.assertEqual(self.store.version, 0)
+        self.assertEqual(self.store.current(), d.DEFAULT_PATCH)
+        self.assertEqual(self.store.log(), [])
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_commit(self):
+        self.assertEqual(self.store.commit(bpm(1000), "first"), 1)
+        patch = bpm(1000).update({"ID_PATCH_ASSIGN_SW": [None, 1] + [None] * 10})
+        self.assertEqual(self.store.commit(patch), 2)
+        # committing the current defaults again does not add a version.
+        self.assertEqual(self.store.commit(patch.to_dict()), 2)
+        self.assertEqual(self.store.current(), patch)
+        log = self.store.log()
+        self.assertEqual([version.message for version in log], ["first", ""])
+        self.assertEqual(
+            log[1].cells,
+            [["ID_PATCH_ASSIGN_SW", 1, d.DEFAULT_PATCH.ID_PATCH_ASSIGN_SW[1], 1]],
+        )
+
+    def test_get(self):
+        for value in range(1, 150):
+            self.store.commit(bpm(1000 + value))
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.path, "checkpoints", "128.json"))
+        )
+        for number in [0, 1, 63, 64, 65, 128, 149]:
+            self.assertEqual(
+                self.store.get(number),
+                bpm(1000 + number) if number else d.DEFAULT_PATCH,
+            )
+        with self.assertRaises(DefaultsStoreError):
+            self.store.get(150)
+
+    def test_rollback(self):
+        for value in range(1, 70):
+            self.store.commit(bpm(1000 + value))
+        restored = self.store.rollback(3)
+        self.assertEqual(restored, bpm(1003))
+        self.assertEqual(self.store.version, 70)
+        self.assertEqual(self.store.log()[-1].message, "rollback to version 3")
+        # the rollback only undoes the cells that changed.
+        self.assertEqual(len(self.store.log()[-1].cells), 1)
+        self.assertEqual(self.store.rollback(0), d.DEFAULT_PATCH)
+        self.assertEqual(self.store.get(70), bpm(1003))
+
+    def test_reload(self):
+        self.store.commit(bpm(1000))
+        self.store.commit(bpm(1001))
+        # a new process reads the cached head, and folds anything appended after it.
+        defaults_store._HEADS.clear()
+        with open(os.path.join(self.path, "journal.jsonl"), "a") as journal:
+            journal.write(
+                '{"version":3,"time":"","message":"",'
+                '"cells":[["ID_PATCH_MASTER_BPM",null,1001,1002]]}\n'
+            )
+        self.assertEqual(DefaultsStore(self.path).current(), bpm(1002))
+        # without a cached head the whole journal is folded.
+        defaults_store._HEADS.clear()
+        os.remove(os.path.join(self.path, "head.json"))
+        self.assertEqual(DefaultsStore(self.path).version, 3)
+
+    def test_interrupted_write(self):
+        self.store.commit(bpm(1000))
+        with open(os.path.join(self.path, "journal.jsonl"), "a") as journal:
+            journal.write('{"version":2,"ti')
+        defaults_store._HEADS.clear()
+        self.assertEqual(self.store.version, 1)
+        self.assertEqual(self.store.commit(bpm(1001)), 2)
+        self.assertEqual(len(self.store.log()), 2)
+
+
+class TestGlobalDefaults(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.backupfile = json.load(infile)
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        defaults_store._HEADS.clear()
+        self.tmp.cleanup()
+
+    def test_from_file(self):
+        path = os.path.join(self.tmp.name, "global_defaults.json")
+        # a dense mask, as written by earlier versions.
+        mask = {
+            name: [None] * len(value) if isinstance(value, list) else None
+            for name, value in d.DEFAULT_PATCH.to_dict().items()
+        }
+        mask["ID_PATCH_MASTER_BPM"] = 999
+        with open(path, "w") as outfile:
+            json.dump(mask, outfile)
+        self.assertEqual(d.get_global_defaults_from_file(path), bpm(999))
+        self.assertEqual(
+            d.get_global_defaults_from_file(os.path.join(self.tmp.name, "missing")),
+            d.DEFAULT_PATCH,
+        )
+
+    def test_set_as_default_to_file(self):
+        path = os.path.join(self.tmp.name, "defaults")
+        patch_list = d.PatchList(self.backupfile["patch"], defaults_store=path)
+        patch_list.set_as_default(1, 1, to_file=True)
+        store = DefaultsStore(path)
+        self.assertEqual(store.current(), patch_list.latest_default_state)
+        self.assertEqual(store.log()[0].message, "set_as_default 1:1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import filecmp
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from . import data_models as d
+from .bel import splice_write
+from .history import History, HistoryError
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.history = History(os.path.join(self.tmp.name, "history"))
+        self.backup = os.path.join(self.tmp.name, "test_1.bel")
+        shutil.copyfile("bulk_editor/test_data/test_1.bel", self.backup)
+        with open(self.backup, "r") as infile:
+            self.patches = json.load(infile)["patch"]
+        # the same backup with the BPM of patch 45:3 changed.
+        self.edited = os.path.join(self.tmp.name, "edited.bel")
+        self.index = 45 * 8 + 2
+        splice_write(
+            self.backup,
+            self.edited,
+            {self.index: {**self.patches[self.index], "ID_PATCH_MASTER_BPM": 1234}},
+        )
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_commit_deduplicates(self):
+        self.assertEqual(self.history.commit(self.backup, "original"), 1)
+        objects = os.path.join(self.history.path, "objects")
+        stored = sum(len(files) for _, _, files in os.walk(objects))
+        # one object per distinct patch, plus the skeleton.
+        self.assertEqual(stored, len(set(map(json.dumps, self.patches))) + 1)
+        self.assertEqual(self.history.commit(self.edited, "edited"), 2)
+        self.assertEqual(
+            sum(len(files) for _, _, files in os.walk(objects)), stored + 1
+        )
+        # recording the latest version again does not add a version.
+        self.assertEqual(self.history.commit(self.edited), 2)
+        self.assertEqual(
+            [m.message for m in self.history.manifests()], ["original", "edited"]
+        )
+
+    def test_checkout(self):
+        self.history.commit(self.backup)
+        self.history.commit(self.edited)
+        output = os.path.join(self.tmp.name, "output.bel")
+        self.history.checkout(1, output)
+        self.assertTrue(filecmp.cmp(output, self.backup, shallow=False))
+        self.history.checkout(-1, output)
+        self.assertTrue(filecmp.cmp(output, self.edited, shallow=False))
+        with self.assertRaises(HistoryError):
+            self.history.checkout(3, output)
+
+    def test_patch_history(self):
+        self.history.commit(self.backup)
+        self.history.commit(self.edited)
+        self.history.commit(self.backup)
+        changes = self.history.patch_history(45, 3)
+        self.assertEqual([version for version, _ in changes], [1, 2, 3])
+        self.assertEqual(changes[0][1], changes[2][1])
+        self.assertEqual([v for v, _ in self.history.patch_history(45, 4)], [1])
+        self.assertEqual(self.history.patch_at(-2, 45, 3).ID_PATCH_MASTER_BPM, 1234)
+        self.assertEqual(
+            self.history.patch_at(1, 45, 3),
+            d.Patch.from_dict(self.patches[self.index]),
+        )
+
+    def test_diff(self):
+        self.history.commit(self.backup)
+        self.history.commit(self.edited)
+        diff = self.history.diff(1, 2)
+        self.assertEqual(list(diff.patches), [self.index])
+        self.assertEqual(diff.coords, [d.PatchCoords(45, 3)])
+        self.assertFalse(diff.skeleton)
+        self.assertEqual(
+            self.history.diff_patch(1, 2, 45, 3), {("ID_PATCH_MASTER_BPM", None): 1234}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
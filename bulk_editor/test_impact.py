@@ -0,0 +1,117 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from rich.console import Console
+
+from . import data_models as d
+from . import batch, impact, jobs
+
+SET_ASSIGN = {
+    "action": "set_assign",
+    "assign_number": 2,
+    "source": "CTL1",
+    "target": "BPM: Tap",
+}
+
+
+class TestImpact(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.patches = json.load(infile)["patch"]
+        self.steps = [jobs._parse_step(SET_ASSIGN, "")]
+
+    def test_dry_run_matches_edit(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "output.bel")
+            changed, _ = batch.edit_file(
+                "bulk_editor/test_data/test_1.bel",
+                output,
+                self.steps,
+                default=d.DEFAULT_PATCH,
+            )
+            with open(output, "r") as infile:
+                edited = json.load(infile)["patch"]
+        for backend in ["patch", "matrix", "lazy", "stream"]:
+            report = impact.dry_run(
+                "bulk_editor/test_data/test_1.bel",
+                self.steps,
+                backend=backend,
+                default=d.DEFAULT_PATCH,
+            )
+            self.assertEqual(len(report.patches), changed)
+            for patch in report.patches:
+                expected = self.patches[patch.slot]
+                for name, index, old, new in patch.cells:
+                    self.assertEqual(expected[name][index], old)
+                    self.assertEqual(edited[patch.slot][name][index], new)
+        self.assertEqual(
+            [cell[:2] for cell in report.defaults],
+            [
+                ["ID_PATCH_ASSIGN_SW", 1],
+                ["ID_PATCH_ASSIGN_MODE", 1],
+                ["ID_PATCH_ASSIGN_TARGET", 1],
+            ],
+        )
+
+    def test_overridden(self):
+        # an individual assign 2 in patch 0:1, which keeps its own source and target
+        # but has its mode overwritten.
+        individual = d.DEFAULT_PATCH.update(
+            {
+                "ID_PATCH_ASSIGN_SW": [None, 1] + [None] * 10,
+                "ID_PATCH_ASSIGN_SOURCE": [None, 5] + [None] * 10,
+                "ID_PATCH_ASSIGN_TARGET": [None, 30] + [None] * 10,
+            }
+        )
+        self.patches[0] = individual.to_dict()
+        patch_list = d.PatchList(self.patches, states=[d.DEFAULT_PATCH])
+        old_default = patch_list.latest_default_state
+        patch_list.update_assign(2, "CTL1", "TGL", "BPM: Tap", {})
+        report = impact.compare(
+            self.patches,
+            patch_list.iter_dicts(),
+            old_default,
+            patch_list.latest_default_state,
+        )
+        self.assertEqual(report.patches[0].slot, 0)
+        self.assertEqual(report.patches[0].overridden, [2])
+        self.assertEqual(report.patches[0].cells, [["ID_PATCH_ASSIGN_MODE", 1, 0, 1]])
+        self.assertEqual(report.banks()[0], {"changed": 1, "overridden": 1})
+        self.assertEqual(
+            impact.individual_assigns(self.patches[0], old_default.to_dict()), [2]
+        )
+
+    def test_report(self):
+        report = impact.dry_run(
+            "bulk_editor/test_data/test_1.bel", self.steps, default=d.DEFAULT_PATCH
+        )
+        summary = json.loads(json.dumps(report.to_dict()))
+        self.assertEqual(summary["total"], 800)
+        self.assertEqual(summary["changed"], len(summary["patches"]))
+        self.assertEqual(
+            sum(bank["changed"] for bank in summary["banks"].values()),
+            summary["changed"],
+        )
+        self.assertEqual(
+            summary["cells"]["ID_PATCH_ASSIGN_SW[1]"],
+            sum(
+                1
+                for patch in summary["patches"]
+                for name, index, *_ in patch["cells"]
+                if (name, index) == ("ID_PATCH_ASSIGN_SW", 1)
+            ),
+        )
+        output = io.StringIO()
+        impact.print_report(report, Console(file=output, width=120))
+        self.assertIn(
+            f"{summary['changed']}/800 patches change, "
+            f"{summary['overridden']} with an overridden individual assign.",
+            output.getvalue(),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import unittest
+
+from . import data_models as d
+from . import mappings
+from .inverted import InvertedIndex, Selection
+
+
+class TestInvertedIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.patches = json.load(infile)["patch"]
+        self.index = InvertedIndex.from_patches(self.patches)
+
+    def scan(self, field, value, index=None):
+        return [
+            slot
+            for slot, patch in enumerate(self.patches)
+            if (patch[field] if index is None else patch[field][index]) == value
+        ]
+
+    def test_where_matches_scan(self):
+        for field, index in [
+            ("ID_PATCH_MASTER_BPM", None),
+            ("ID_PATCH_LOOP_SW_LOOP", 6),
+            ("ID_PATCH_ASSIGN_SOURCE", 0),
+        ]:
+            for value in self.index.values(field, index):
+                self.assertEqual(
+                    list(self.index.where(field, value, index)),
+                    self.scan(field, value, index),
+                )
+
+    def test_missing_value(self):
+        self.assertFalse(self.index.where("ID_PATCH_MASTER_BPM", -1))
+
+    def test_combinators(self):
+        num8 = mappings.ES8_FOOTSWITCHES.index("Num8")
+        off = self.index.where(
+            "ID_PATCH_CTL_FUNC", d.PatchList.input_value("OFF", "ctl_func"), num8
+        )
+        loop7 = self.index.where("ID_PATCH_LOOP_SW_LOOP", 1, 6)
+        both = set(off) & set(loop7)
+        self.assertEqual(set(off & loop7), both)
+        self.assertEqual(set(off | loop7), set(off) | set(loop7))
+        self.assertEqual(set(off - loop7), set(off) - set(loop7))
+        self.assertEqual(len(~off), len(self.patches) - len(off))
+        self.assertEqual(~~off, off)
+        self.assertEqual((off | ~off), self.index.all())
+
+    def test_selection(self):
+        selection = Selection(0b1010, 4)
+        self.assertEqual(list(selection), [1, 3])
+        self.assertIn(3, selection)
+        self.assertNotIn(0, selection)
+        self.assertEqual(list(~selection), [0, 2])
+
+
+class TestPatchListIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.patches = json.load(infile)["patch"]
+
+    def test_index_follows_apply(self):
+        for backend in ["patch", "matrix", "lazy"]:
+            patch_list = d.PatchList(self.patches, backend=backend)
+            index = patch_list.index
+            patch_list.update_assign(1, "Num8", "MOM", "BPM: Tap", {})
+            self.assertIs(patch_list.index, index)
+            rebuilt = InvertedIndex.from_patches(patch_list.to_dicts())
+            self.assertEqual(index.cells, rebuilt.cells)
+
+    def test_select(self):
+        patch_list = d.PatchList(self.patches)
+        selection = patch_list.select("ID_PATCH_LOOP_SW_LOOP", 1, 6)
+        self.assertEqual(
+            list(selection),
+            [
+                slot
+                for slot, patch in enumerate(self.patches)
+                if patch["ID_PATCH_LOOP_SW_LOOP"][6] == 1
+            ],
+        )
+
+    def test_stream_backend(self):
+        patch_list = d.PatchList(iter(self.patches), backend="stream")
+        with self.assertRaises(d.BulkEditorError):
+            patch_list.index
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from . import data_models as d
+from . import jobs
+
+JOB = {
+    "actions": [
+        {
+            "action": "set_assign",
+            "assign_number": 1,
+            "source": "Num8",
+            "mode": "MOM",
+            "target": "BPM: Tap",
+        },
+        {
+            "action": "set_assign",
+            "assign_number": 3,
+            "source": "CTL1",
+            "target": "LOOP: L3",
+            "params": "params.json",
+        },
+    ]
+}
+PARAMS = {"ID_PATCH_ASSIGN_TARGET_MIN": 1}
+
+
+class TestJobs(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.backupfile = json.load(infile)
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "job.json")
+        with open(self.path, "w") as outfile:
+            json.dump(JOB, outfile)
+        with open(os.path.join(self.tmpdir, "params.json"), "w") as outfile:
+            json.dump(PARAMS, outfile)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def test_load_job(self):
+        steps = jobs.load_job(self.path)
+        self.assertEqual([s.action for s in steps], ["set_assign", "set_assign"])
+        self.assertEqual(steps[1].mode, "TGL")
+        self.assertEqual(steps[1].params, PARAMS)
+
+    def test_invalid_action(self):
+        with open(self.path, "w") as outfile:
+            json.dump({"actions": [{"action": "nope"}]}, outfile)
+        with self.assertRaises(jobs.JobError):
+            jobs.load_job(self.path)
+
+    def test_run_job_matches_sequential_actions(self):
+        expected = d.PatchList(self.backupfile["patch"])
+        expected.update_assign(1, "Num8", "MOM", "BPM: Tap", {})
+        expected.update_assign(3, "CTL1", "TGL", "LOOP: L3", PARAMS)
+        patch_list = d.PatchList(self.backupfile["patch"])
+        _, default = jobs.run_job(patch_list, jobs.load_job(self.path))
+        self.assertEqual(default, expected.latest_default_state)
+        self.assertEqual(patch_list.to_dicts(), expected.to_dicts())
@@ -0,0 +1,240 @@
+import argparse
+import json
+import unittest
+
+from . import data_models as d
+from . import actions, jobs
+from .loops import ChainMove, LoopSwap, is_valid_chain, loop_target
+
+
+class TestLoopSwap(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.patches = json.load(infile)["patch"]
+
+    def test_swap(self):
+        swapped = LoopSwap(7, 6).apply(self.patches[0])
+        for name in ["ID_PATCH_LOOP_SW_LOOP", "ID_PATCH_CARRY_OVER_LOOP"]:
+            self.assertEqual(swapped[name][5], self.patches[0][name][6])
+            self.assertEqual(swapped[name][6], self.patches[0][name][5])
+        chain = self.patches[0]["ID_PATCH_LOOP_POSITION"]
+        self.assertEqual(
+            swapped["ID_PATCH_LOOP_POSITION"],
+            [{6: 7, 7: 6}.get(e, e) for e in chain[:13]] + chain[13:],
+        )
+        targets = {loop_target(6): loop_target(7), loop_target(7): loop_target(6)}
+        for patch in self.patches:
+            self.assertEqual(
+                LoopSwap(7, 6).apply(patch)["ID_PATCH_ASSIGN_TARGET"],
+                [targets.get(t, t) for t in patch["ID_PATCH_ASSIGN_TARGET"]],
+            )
+
+    def test_swap_and_wipe(self):
+        patch = {
+            **self.patches[0],
+            "ID_PATCH_LOOP_SW_LOOP": [0, 0, 0, 0, 0, 1, 1, 0, 0],
+            "ID_PATCH_ASSIGN_TARGET": [loop_target(6), loop_target(7)] + [9] * 10,
+            "ID_PATCH_ASSIGN_SW": [1] * 12,
+        }
+        wiped = LoopSwap(7, 6, wipe=True).apply(patch)
+        self.assertEqual(wiped["ID_PATCH_LOOP_SW_LOOP"], [0, 0, 0, 0, 0, 1, 0, 0, 0])
+        self.assertEqual(
+            wiped["ID_PATCH_ASSIGN_TARGET"][:2], [loop_target(7), loop_target(6)]
+        )
+        self.assertEqual(wiped["ID_PATCH_ASSIGN_SW"][:3], [0, 1, 1])
+        self.assertTrue(is_valid_chain(wiped["ID_PATCH_LOOP_POSITION"][:13]))
+
+    def test_invalid_loops(self):
+        for loops in [(0, 1), (1, 9), (3, 3)]:
+            with self.assertRaises(d.BulkEditorError):
+                LoopSwap(*loops)
+
+
+class TestPatchListSwapLoops(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.patches = json.load(infile)["patch"]
+
+    def test_backends_match(self):
+        for wipe in [False, True]:
+            swap = LoopSwap(7, 6, wipe)
+            expected = [swap.apply(patch) for patch in self.patches]
+            for backend in ["patch", "matrix", "lazy", "stream"]:
+                patch_list = d.PatchList(
+                    iter(self.patches) if backend == "stream" else self.patches,
+                    backend=backend,
+                )
+                patch_list.swap_loops(7, 6, wipe=wipe)
+                self.assertEqual(patch_list.to_dicts(), expected)
+
+    def test_swap_twice_is_identity(self):
+        patch_list = d.PatchList(self.patches)
+        patch_list.swap_loops(2, 5)
+        patch_list.swap_loops(2, 5)
+        self.assertEqual(patch_list.to_dicts(), self.patches)
+
+    def test_default_state_is_swapped(self):
+        patch_list = d.PatchList(self.patches)
+        patch_list.update_assign(1, "Num8", "MOM", "LOOP: L6", {})
+        patch_list.swap_loops(7, 6)
+        self.assertEqual(
+            patch_list.latest_default_state.get_assign(1)["target"], "LOOP: L7"
+        )
+        # a later change to the default only touches patches that still follow it.
+        patch_list.update_assign(1, "Num8", "MOM", "BPM: Tap", {})
+        self.assertEqual(
+            patch_list.get_patch(32, 4).get_assign(1)["target"], "BPM: Tap"
+        )
+
+    def test_job(self):
+        expected = d.PatchList(self.patches)
+        expected.update_assign(1, "Num8", "MOM", "BPM: Tap", {})
+        expected.swap_loops(7, 6, wipe=True)
+        expected.update_assign(2, "CTL1", "TGL", "LOOP: L3", {})
+
+        patch_list = d.PatchList(self.patches)
+        jobs.run_job(
+            patch_list,
+            [
+                jobs._parse_step(step, "")
+                for step in [
+                    {
+                        "action": "set_assign",
+                        "assign_number": 1,
+                        "source": "Num8",
+                        "mode": "MOM",
+                        "target": "BPM: Tap",
+                    },
+                    {"action": "swap_loops", "loops": [7, 6], "wipe": True},
+                    {
+                        "action": "set_assign",
+                        "assign_number": 2,
+                        "source": "CTL1",
+                        "target": "LOOP: L3",
+                    },
+                ]
+            ],
+        )
+        self.assertEqual(patch_list.to_dicts(), expected.to_dicts())
+
+    def test_action(self):
+        patch_list = d.PatchList(self.patches)
+        args = argparse.Namespace(action="swap_loops", loops=[7, 6], wipe=False)
+        actions.VALID_ACTIONS["swap_loops"](patch_list, args)
+        self.assertEqual(
+            patch_list.to_dicts(), [LoopSwap(7, 6).apply(p) for p in self.patches]
+        )
+
+
+class TestChainMove(unittest.TestCase):
+    DEFAULT_CHAIN = (8, 7, 6, 5, 4, 3, 2, 1, 0, 9, 10, 11, 12)
+
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.patches = json.load(infile)["patch"]
+        # a patch using loops 3 and 6, and a copy of it with a broken chain.
+        self.patches[0] = {
+            **self.patches[0],
+            "ID_PATCH_LOOP_SW_LOOP": [0, 0, 1, 0, 0, 1, 0, 0, 0],
+            "ID_PATCH_LOOP_POSITION": [
+                *self.DEFAULT_CHAIN,
+                *self.patches[0]["ID_PATCH_LOOP_POSITION"][13:],
+            ],
+        }
+        self.patches[1] = {
+            **self.patches[0],
+            "ID_PATCH_LOOP_POSITION": [0] * 22,
+        }
+
+    def test_reorder(self):
+        self.assertEqual(
+            ChainMove(3, 6).reorder(self.DEFAULT_CHAIN),
+            (8, 7, 6, 3, 5, 4, 2, 1, 0, 9, 10, 11, 12),
+        )
+        self.assertEqual(
+            ChainMove(3, 6, after=False).reorder(self.DEFAULT_CHAIN),
+            (8, 7, 3, 6, 5, 4, 2, 1, 0, 9, 10, 11, 12),
+        )
+        # the volume loop is element 0.
+        self.assertEqual(
+            ChainMove(9, 8, after=False).reorder(self.DEFAULT_CHAIN),
+            (0, 8, 7, 6, 5, 4, 3, 2, 1, 9, 10, 11, 12),
+        )
+        self.assertEqual(
+            ChainMove(1, 2).reorder(self.DEFAULT_CHAIN), self.DEFAULT_CHAIN
+        )
+        self.assertIsNone(ChainMove(3, 6).reorder((0,) * 13))
+
+    def test_used_only(self):
+        move = ChainMove(3, 6)
+        self.assertEqual(
+            move.changes(self.patches[0])["ID_PATCH_LOOP_POSITION"][:13],
+            list(move.reorder(self.DEFAULT_CHAIN)),
+        )
+        self.assertEqual(
+            move.changes({**self.patches[0], "ID_PATCH_LOOP_SW_LOOP": [0] * 9}), {}
+        )
+        self.assertNotEqual(
+            ChainMove(3, 6, used_only=False).changes(
+                {**self.patches[0], "ID_PATCH_LOOP_SW_LOOP": [0] * 9}
+            ),
+            {},
+        )
+
+    def test_backends_match(self):
+        move = ChainMove(3, 6)
+        expected = [move.apply(patch) for patch in self.patches]
+        for backend in ["patch", "matrix", "lazy"]:
+            patch_list = d.PatchList(self.patches, backend=backend)
+            self.assertEqual(patch_list.reorder_chain(3, 6), [1])
+            patches = patch_list.to_dicts()
+            self.assertEqual(patches, expected)
+            self.assertEqual(patches[1], self.patches[1])
+            for patch in patches[:1] + patches[2:]:
+                self.assertTrue(is_valid_chain(patch["ID_PATCH_LOOP_POSITION"][:13]))
+
+    def test_rejected_after_pending_defaults(self):
+        # a valid chain, which a pending change to the default chain breaks.
+        chain = [8, 7, 6, 5, 4, 1, 2, 3, 0, 9, 10, 11, 12]
+        patches = [
+            {**patch, "ID_PATCH_LOOP_POSITION": [*chain, *self.DEFAULT_CHAIN[:9]]}
+            for patch in self.patches[2:10]
+        ]
+        for backend, transaction in [
+            ("patch", False),
+            ("matrix", False),
+            ("lazy", False),
+            # as in a job, where the default change is still pending.
+            ("patch", True),
+        ]:
+            patch_list = d.PatchList(patches, backend=backend)
+            if transaction:
+                patch_list.begin()
+            patch_list.states = [
+                d.DEFAULT_PATCH.update(
+                    {"ID_PATCH_LOOP_POSITION": [*chain, *self.DEFAULT_CHAIN[:9]]}
+                )
+            ]
+            patch_list._update_states(
+                {"ID_PATCH_LOOP_POSITION": [None] * 6 + [1] + [None] * 15}
+            )
+            self.assertEqual(
+                patch_list.reorder_chain(3, 6, used_only=False), list(range(8))
+            )
+            if transaction:
+                patch_list.commit()
+            for patch in patch_list.to_dicts():
+                self.assertEqual(
+                    patch["ID_PATCH_LOOP_POSITION"][:9], [8, 7, 6, 5, 4, 1, 1, 3, 0]
+                )
+
+    def test_action_reports_rejected_patches(self):
+        patch_list = d.PatchList(self.patches)
+        args = argparse.Namespace(action="reorder_chain", loops=[3, 6], before=False)
+        with self.assertLogs(level="WARNING") as logs:
+            actions.VALID_ACTIONS["reorder_chain"](patch_list, args)
+        self.assertIn("0:2", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
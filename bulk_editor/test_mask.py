@@ -0,0 +1,71 @@
+from dataclasses import asdict
+import unittest
+
+from . import data_models as d
+from .mask import Edit, Mask, compose
+
+
+class TestMask(unittest.TestCase):
+    def setUp(self) -> None:
+        self.patch = asdict(d.DEFAULT_PATCH)
+        self.patch["ID_PATCH_MASTER_BPM"] = 120
+        self.patch["ID_PATCH_ASSIGN_SOURCE"] = [0, 0, 15] + [0] * 9
+
+    def test_diff(self):
+        self.assertEqual(
+            Mask.diff(d.DEFAULT_PATCH, self.patch),
+            {("ID_PATCH_MASTER_BPM", None): 120, ("ID_PATCH_ASSIGN_SOURCE", 2): 15},
+        )
+
+    def test_matches_dense_mask(self):
+        dense = d.DEFAULT_PATCH.mask(self.patch)
+        self.assertEqual(
+            Mask.from_dense(dense), d.DEFAULT_PATCH.sparse_mask(self.patch)
+        )
+
+    def test_apply_shares_untouched_fields(self):
+        mask = Mask({("ID_PATCH_ASSIGN_SOURCE", 0): 4})
+        applied = mask.apply(self.patch)
+        self.assertEqual(applied["ID_PATCH_ASSIGN_SOURCE"][:3], [4, 0, 15])
+        self.assertEqual(self.patch["ID_PATCH_ASSIGN_SOURCE"][0], 0)
+        self.assertIs(applied["ID_PATCH_NAME"], self.patch["ID_PATCH_NAME"])
+
+    def test_merge(self):
+        a = Mask({("ID_PATCH_MASTER_BPM", None): 90, ("ID_PATCH_CTL1", None): 0})
+        b = Mask({("ID_PATCH_MASTER_BPM", None): 100})
+        self.assertEqual(
+            a.merge(b), {("ID_PATCH_MASTER_BPM", None): 100, ("ID_PATCH_CTL1", None): 0}
+        )
+        self.assertEqual(Mask.diff(a, a.merge(b)), b)
+
+
+class TestEdit(unittest.TestCase):
+    def setUp(self) -> None:
+        self.defaults = [d.DEFAULT_PATCH.to_dict()]
+        for bpm in (120, 90):
+            self.defaults.append({**self.defaults[-1], "ID_PATCH_MASTER_BPM": bpm})
+
+    def test_diff(self):
+        self.assertEqual(
+            Edit.diff(*self.defaults[:2]),
+            {
+                ("ID_PATCH_MASTER_BPM", None): (
+                    frozenset([d.DEFAULT_PATCH.ID_PATCH_MASTER_BPM]),
+                    120,
+                )
+            },
+        )
+
+    def test_compose_matches_sequential_edits(self):
+        first = Edit.diff(*self.defaults[:2])
+        second = Edit.diff(*self.defaults[1:])
+        composed = compose(first, second)
+        for bpm in (d.DEFAULT_PATCH.ID_PATCH_MASTER_BPM, 120, 90, 60):
+            patch = {**self.defaults[0], "ID_PATCH_MASTER_BPM": bpm}
+            self.assertEqual(composed.apply(patch), second.apply(first.apply(patch)))
+        self.assertEqual(composed.target, Mask({("ID_PATCH_MASTER_BPM", None): 90}))
+
+    def test_compose_rejects_unrelated_edits(self):
+        first = Edit.diff(*self.defaults[:2])
+        with self.assertRaises(ValueError):
+            compose(first, first)
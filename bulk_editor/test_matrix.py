@@ -0,0 +1,43 @@
+from dataclasses import asdict
+import json
+import unittest
+
+from . import data_models as d
+from . import matrix as m
+
+
+class TestPatchMatrix(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.backupfile = json.load(infile)
+
+    def test_layout(self):
+        self.assertEqual(m.WIDTH, len(m.flatten(d.DEFAULT_PATCH)))
+        self.assertEqual(
+            m.FIELD_SLICES["ID_PATCH_ASSIGN_SOURCE"].stop
+            - m.FIELD_SLICES["ID_PATCH_ASSIGN_SOURCE"].start,
+            12,
+        )
+
+    def test_round_trip(self):
+        matrix = m.PatchMatrix.from_patches(self.backupfile["patch"])
+        self.assertEqual(len(matrix), 800)
+        self.assertEqual(list(matrix.to_dicts()), self.backupfile["patch"])
+
+    def test_mask_update(self):
+        patches = self.backupfile["patch"][:16]
+        matrix = m.PatchMatrix.from_patches(patches)
+        masked = matrix.mask(d.DEFAULT_PATCH)
+        for row, patch in zip(masked.update(d.DEFAULT_PATCH).to_dicts(), patches):
+            self.assertEqual(row, patch)
+
+    def test_matches_patch_backend(self):
+        params = dict(
+            assign_number=4, source="MemM", mode="TGL", target="E.CTL: CTL2", params={}
+        )
+        patch_list = d.PatchList(self.backupfile["patch"])
+        matrix_list = d.PatchList(self.backupfile["patch"], backend="matrix")
+        patches, default = patch_list.update_assign(**params)
+        matrix_patches, matrix_default = matrix_list.update_assign(**params)
+        self.assertEqual(default, matrix_default)
+        self.assertEqual(matrix_list.to_dicts(), [asdict(p) for p in patches])
@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import tempfile
+import unittest
+
+from . import data_models as d
+from . import actions
+from .inverted import InvertedIndex
+from .merge import MergeError, derived_from, three_way_merge
+
+
+class TestThreeWayMerge(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.patches = json.load(infile)["patch"]
+        self.base = d.Patch.from_dict(self.patches[100])
+        self.theirs = self.base.update(
+            {
+                "ID_PATCH_MASTER_BPM": 1234,
+                "ID_PATCH_ASSIGN_SW": [None, 1] + [None] * 10,
+            }
+        )
+        # a patch derived from the template, with a customized BPM.
+        self.patches[5] = {**self.patches[100], "ID_PATCH_MASTER_BPM": 999}
+        self.index = InvertedIndex.from_patches(self.patches)
+
+    def test_cells(self):
+        result = three_way_merge(self.index, self.base, self.theirs)
+        bpm = result.cells[("ID_PATCH_MASTER_BPM", None)]
+        self.assertEqual((bpm.base, bpm.theirs), (self.base.ID_PATCH_MASTER_BPM, 1234))
+        self.assertIn(100, bpm.updated)
+        self.assertIn(5, bpm.conflicts)
+        self.assertEqual(
+            len(bpm.updated) + len(bpm.unchanged) + len(bpm.conflicts),
+            len(self.patches),
+        )
+        self.assertEqual(
+            set(result.cells),
+            {("ID_PATCH_MASTER_BPM", None), ("ID_PATCH_ASSIGN_SW", 1)},
+        )
+
+    def test_conflicts(self):
+        derived = derived_from(self.index, self.base)
+        result = three_way_merge(self.index, self.base, self.theirs, derived)
+        conflict = next(c for c in result.conflicts if c.slot == 5)
+        self.assertEqual(
+            (conflict.field, conflict.index, conflict.ours, conflict.theirs),
+            ("ID_PATCH_MASTER_BPM", None, 999, 1234),
+        )
+        for conflict in result.conflicts:
+            self.assertIn(conflict.slot, derived)
+            self.assertNotIn(conflict.ours, (conflict.base, conflict.theirs))
+
+    def test_derived_from(self):
+        derived = derived_from(self.index, self.base)
+        self.assertIn(5, derived)
+        self.assertIn(100, derived)
+        self.assertLess(len(derived), len(self.patches))
+        self.assertEqual(derived_from(self.index, self.base, 0), self.index.all())
+        self.assertEqual(derived_from(self.index, d.DEFAULT_PATCH), self.index.all())
+
+    def test_invalid_strategy(self):
+        with self.assertRaises(MergeError):
+            three_way_merge(self.index, self.base, self.theirs, strategy="mine")
+
+
+class TestPatchListMergeTemplate(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("bulk_editor/test_data/test_1.bel", "r") as infile:
+            self.patches = json.load(infile)["patch"]
+        self.base = d.Patch.from_dict(self.patches[100])
+        self.theirs = self.base.update({"ID_PATCH_MASTER_BPM": 1234})
+        self.patches[5] = {**self.patches[100], "ID_PATCH_MASTER_BPM": 999}
+
+    def expected(self, derived, strategy):
+        old = self.base.ID_PATCH_MASTER_BPM
+        return [
+            (
+                {**patch, "ID_PATCH_MASTER_BPM": 1234}
+                if slot in derived
+                and (patch["ID_PATCH_MASTER_BPM"] == old or strategy == "theirs")
+                else patch
+            )
+            for slot, patch in enumerate(self.patches)
+        ]
+
+    def test_backends_match(self):
+        for strategy in ["ours", "theirs"]:
+            for backend in ["patch", "matrix", "lazy"]:
+                patch_list = d.PatchList(self.patches, backend=backend)
+                result = patch_list.merge_template(
+                    self.base, self.theirs, strategy=strategy
+                )
+                self.assertEqual(
+                    patch_list.to_dicts(), self.expected(result.patches, strategy)
+                )
+
+    def test_index_is_updated(self):
+        patch_list = d.PatchList(self.patches)
+        patch_list.merge_template(self.base, self.theirs)
+        self.assertEqual(
+            patch_list.index.cells,
+            InvertedIndex.from_patches(patch_list.to_dicts()).cells,
+        )
+
+    def test_action(self):
+        patch_list = d.PatchList(self.patches)
+        # the template in slot 100 (bank 12 patch 5) has been edited.
+        patch_list.patches = [
+            self.theirs if slot == 100 else patch
+            for slot, patch in enumerate(patch_list.patches)
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            base = os.path.join(tmp, "template.json")
+            with open(base, "w") as outfile:
+                json.dump(self.base.to_dict(), outfile)
+            args = argparse.Namespace(
+                action="merge_template",
+                coords="12:5",
+                base=base,
+                strategy="ours",
+                threshold=None,
+            )
+            with self.assertLogs(level="WARNING") as logs:
+                actions.VALID_ACTIONS["merge_template"](patch_list, args)
+        bpms = [patch["ID_PATCH_MASTER_BPM"] for patch in patch_list.to_dicts()]
+        self.assertGreater(bpms.count(1234), 1)
+        self.assertTrue(any("0:6 ID_PATCH_MASTER_BPM" in line for line in logs.output))
+        self.assertEqual(patch_list.get_patch(0, 6).ID_PATCH_MASTER_BPM, 999)
+
+
+if __name__ == "__main__":
+    unittest.main()
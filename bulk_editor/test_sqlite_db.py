@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tinydb import Query
+
+from . import database as db
+from . import sqlite_db
+
+TEST_FILE = "bulk_editor/test_data/test_1.bel"
+
+
+class TestSqliteDB(unittest.TestCase):
+    def setUp(self) -> None:
+        with open(TEST_FILE, "r") as infile:
+            self.backupfile = json.load(infile)
+        self.tmpdir = tempfile.mkdtemp()
+        self.db = db.init_db(self.tmpdir, storage="sqlite")
+
+    def tearDown(self) -> None:
+        self.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_wal_mode(self):
+        mode = self.db._db.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+        self.assertTrue(os.path.isfile(os.path.join(self.tmpdir, "db.sqlite")))
+
+    def test_document_table(self):
+        conf = self.db.table("conf")
+        doc_id = conf.insert({"type": "metadata", "is_ingested": False})
+        conf.update({"is_ingested": True}, doc_ids=[doc_id])
+        metadata = conf.get(Query().type == "metadata")
+        self.assertEqual(metadata.doc_id, doc_id)
+        self.assertTrue(metadata["is_ingested"])
+        conf.upsert({"type": "metadata", "name": "default"}, Query().type == "metadata")
+        self.assertEqual(len(conf), 1)
+        conf.remove(doc_ids=[doc_id])
+        self.assertEqual(conf.all(), [])
+
+    def test_es8_table(self):
+        table = db.Es8Table(db=self.db, orm=Query(), table_name="user_prefs")
+        table.upsert({"midi_ch": "1"}, "midi_pref")
+        table.upsert({"midi_ch": "2"}, "midi_pref")
+        self.assertEqual(len(table.search("midi_pref")), 1)
+        self.assertEqual(table.get("midi_pref")["midi_ch"], "2")
+
+    def test_patch_table(self):
+        patches, _ = db.ingest_backup(self.db.table("patch"), TEST_FILE)
+        table = self.db.table("patch")
+        self.assertEqual(len(table), 800)
+        self.assertEqual(table.get_patch(32, 4), self.backupfile["patch"][259])
+        self.assertEqual(table.get_patch(32, 4).doc_id, 260)
+        fast = [
+            i
+            for i, p in enumerate(self.backupfile["patch"])
+            if p["ID_PATCH_MASTER_BPM"] > 120
+        ]
+        self.assertEqual(
+            [p.doc_id - 1 for p in table.where("ID_PATCH_MASTER_BPM", ">", 120)], fast
+        )
+        with self.assertRaises(sqlite_db.SqliteDBError):
+            table.where("doc; DROP TABLE patch", "=", 1)
+
+    def test_indexed_query_plan(self):
+        self.db.table("patch")
+        plan = self.db._db.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM patch WHERE ID_PATCH_MASTER_BPM > 120"
+        ).fetchall()
+        self.assertIn("USING INDEX", " ".join(row["detail"] for row in plan))
+
+    def test_drop_table(self):
+        table = self.db.table("patch")
+        db.ingest_backup(table, TEST_FILE)
+        self.db.drop_table("patch")
+        self.assertEqual(len(table), 0)
+        db.ingest_backup(table, TEST_FILE)
+        self.assertEqual(len(table), 800)